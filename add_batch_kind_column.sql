@@ -0,0 +1,26 @@
+-- Record which kind of extraction each batch is (see batch_kinds.py), so that each is only ingested by its own kind
+ALTER TABLE director_extract_batches ADD COLUMN batch_kind TEXT;
+
+-- The request ledger records what every request was for, so trust it first
+UPDATE director_extract_batches SET batch_kind = kinds.prompt_kind
+  FROM (SELECT batch_id, min(prompt_kind) AS prompt_kind FROM openai_requests
+         GROUP BY batch_id HAVING count(DISTINCT prompt_kind) = 1) AS kinds
+ WHERE director_extract_batches.id = kinds.batch_id;
+
+-- Batches sent before the ledger existed have no rows in it; fall back on
+-- which queue table still points at them
+UPDATE director_extract_batches SET batch_kind = 'director_compensation'
+ WHERE batch_kind IS NULL
+   AND id IN (SELECT batch_id FROM director_compensation WHERE batch_id IS NOT NULL);
+UPDATE director_extract_batches SET batch_kind = 'director_extraction'
+ WHERE batch_kind IS NULL
+   AND id IN (SELECT batch_id FROM director_extractions WHERE batch_id IS NOT NULL);
+
+-- Anything left has no ledger rows and no queue rows (e.g. a batch whose
+-- rows were all released for retry), so there is no telling which prompt it
+-- used. Mark them 'unknown', which no kind polls or ingests, rather than
+-- risk feeding them to the wrong one. If one still needs ingesting, look at
+-- its input file on OpenAI and set batch_kind by hand.
+UPDATE director_extract_batches SET batch_kind = 'unknown' WHERE batch_kind IS NULL;
+
+ALTER TABLE director_extract_batches ALTER COLUMN batch_kind SET NOT NULL;
@@ -0,0 +1,3 @@
+-- Let batch_sizing.py work out how much is still enqueued at OpenAI and how fast batches come back
+ALTER TABLE director_extract_batches ADD COLUMN estimated_tokens BIGINT;
+ALTER TABLE director_extract_batches ADD COLUMN request_count INT;
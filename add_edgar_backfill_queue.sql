@@ -0,0 +1,12 @@
+-- Work list for backfill_edgar_forms.py
+CREATE TABLE edgar_backfill_queue (
+  url VARCHAR PRIMARY KEY,
+  form VARCHAR NOT NULL,
+  filing_year INT NOT NULL,
+  planned_at TIMESTAMP DEFAULT current_timestamp,
+  completed_at TIMESTAMP
+);
+CREATE INDEX ON edgar_backfill_queue(filing_year) WHERE completed_at IS NULL;
+
+-- Lets the planner find one form's filings for a range of years without a full scan
+CREATE INDEX ON filings(form, extract(year from filingDate));
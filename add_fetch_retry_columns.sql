@@ -0,0 +1,13 @@
+-- Turn html_fetch_failures into a retry queue (see fetch_retry.py)
+ALTER TABLE html_fetch_failures ADD COLUMN attempts INT NOT NULL DEFAULT 1;
+ALTER TABLE html_fetch_failures ADD COLUMN next_attempt_after TIMESTAMP DEFAULT current_timestamp;
+ALTER TABLE html_fetch_failures ADD COLUMN permanent BOOLEAN NOT NULL DEFAULT false;
+
+-- Failures from before the queue existed: 404s and other client errors
+-- are final, the rest can be retried straight away.
+UPDATE html_fetch_failures
+   SET permanent = true
+ WHERE status_code between 400 and 499
+   AND status_code not in (403, 408, 425, 429);
+
+CREATE INDEX ON html_fetch_failures(next_attempt_after) WHERE NOT permanent;
@@ -0,0 +1,14 @@
+-- Each table in filing_tables parsed once into a grid of cells (see table_cells.py and extract_table_cells.py)
+CREATE TABLE IF NOT EXISTS filing_table_grids (
+       table_id INT PRIMARY KEY,
+       row_count INT NOT NULL,
+       column_count INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS filing_table_cells (
+       table_id INT NOT NULL REFERENCES filing_table_grids(table_id),
+       row_number INT NOT NULL,
+       column_number INT NOT NULL,
+       cell_text TEXT NOT NULL,
+       PRIMARY KEY (table_id, row_number, column_number)
+);
@@ -0,0 +1,40 @@
+-- What each table in filing_tables looks like, for finding board skills matrices (see skills_matrix.py)
+CREATE TABLE IF NOT EXISTS filing_table_features (
+       table_id INT PRIMARY KEY,
+       cikcode INT NOT NULL,
+       accessionNumber VARCHAR NOT NULL,
+       table_number INT NOT NULL,
+       feature_version INT NOT NULL,
+       director_names_hash TEXT NOT NULL, -- director_names_by_filing when it was scored
+       row_count INT NOT NULL,
+       column_count INT NOT NULL,
+       orientation TEXT NOT NULL,
+       header_index INT,
+       surname_hits INT NOT NULL,
+       marker_cells INT NOT NULL,
+       image_cells INT NOT NULL,
+       repeated_marker_cells INT NOT NULL,
+       blank_cells INT NOT NULL,
+       body_cells INT NOT NULL,
+       score REAL NOT NULL
+);
+-- For databases made with the first version of this file
+ALTER TABLE filing_table_features ADD COLUMN IF NOT EXISTS director_names_hash TEXT NOT NULL DEFAULT '';
+CREATE INDEX IF NOT EXISTS filing_table_features_by_filing ON filing_table_features(cikcode, accessionNumber, score DESC);
+CREATE INDEX IF NOT EXISTS filing_table_features_by_score ON filing_table_features(score DESC);
+
+-- Which directors are known for each filing. A table's score depends on them,
+-- so detect_skills_matrices.py scores its tables again when this changes
+-- (e.g. once director_mentions has been refreshed after extraction).
+CREATE OR REPLACE VIEW director_names_by_filing AS
+SELECT cikcode, accessionNumber,
+       md5(string_agg(DISTINCT director_name, '|' ORDER BY director_name)) AS director_names_hash
+  FROM director_mentions
+ WHERE director_name IS NOT NULL
+ GROUP BY cikcode, accessionNumber;
+
+-- Each filing's tables, most likely to be a skills matrix first
+CREATE OR REPLACE VIEW likely_skills_matrices AS
+SELECT cikcode, accessionNumber, table_id, table_number, score,
+       rank() OVER (PARTITION BY cikcode, accessionNumber ORDER BY score DESC, table_number) AS rank_in_filing
+  FROM filing_table_features;
@@ -0,0 +1,8 @@
+-- Cache of cleaned filing text shared by ask_openai_bulk.py and extract_director_compensation.py
+CREATE TABLE filing_text_cache (
+  url VARCHAR REFERENCES html_doc_cache(url),
+  cleaner_version INT NOT NULL,
+  text_version TEXT,
+  date_prepared TIMESTAMP DEFAULT current_timestamp,
+  PRIMARY KEY (url, cleaner_version)
+);
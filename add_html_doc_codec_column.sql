@@ -0,0 +1,3 @@
+-- Record how html_doc_cache.content is compressed. Existing rows keep a
+-- null codec (raw bytes) until compress_html_doc_cache.py rewrites them.
+ALTER TABLE html_doc_cache ADD COLUMN codec VARCHAR;
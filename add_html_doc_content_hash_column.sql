@@ -0,0 +1,5 @@
+-- Identify documents by the sha256 of their raw bytes. When
+-- html_doc_cache.content is null, the document lives in the on-disk
+-- blob store (see blob_store.py and migrate_blob_store.py).
+ALTER TABLE html_doc_cache ADD COLUMN content_sha256 VARCHAR;
+CREATE INDEX ON html_doc_cache(content_sha256);
@@ -0,0 +1,32 @@
+-- Support conditional re-fetching (fetch_forms_from_edgar.py --refresh)
+ALTER TABLE html_doc_cache ADD COLUMN etag VARCHAR;
+ALTER TABLE html_doc_cache ADD COLUMN last_modified VARCHAR;
+ALTER TABLE html_doc_cache ADD COLUMN version INT NOT NULL DEFAULT 1;
+ALTER TABLE html_doc_cache ADD COLUMN date_checked TIMESTAMP;
+UPDATE html_doc_cache SET date_checked = date_fetch;
+ALTER TABLE html_doc_cache ALTER COLUMN date_checked SET DEFAULT current_timestamp;
+
+CREATE TABLE html_doc_versions (
+  url VARCHAR REFERENCES html_doc_cache(url),
+  version INT NOT NULL,
+  content BYTEA,
+  codec VARCHAR,
+  content_sha256 VARCHAR,
+  encoding VARCHAR,
+  content_type VARCHAR,
+  etag VARCHAR,
+  last_modified VARCHAR,
+  date_fetch TIMESTAMP,
+  date_superseded TIMESTAMP DEFAULT current_timestamp,
+  PRIMARY KEY (url, version)
+);
+
+CREATE VIEW changed_documents AS
+SELECT
+    url,
+    version,
+    date_fetch AS date_changed
+FROM
+    html_doc_cache
+WHERE
+    version > 1;
@@ -0,0 +1,14 @@
+-- A ledger of every request sent in a batch, so that custom_ids can be short integer ids (see request_ledger.py)
+CREATE TABLE IF NOT EXISTS openai_requests (
+       id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+       batch_id INT NOT NULL REFERENCES director_extract_batches(id),
+       cikcode INT NOT NULL,
+       accessionNumber VARCHAR NOT NULL,
+       url VARCHAR NOT NULL,
+       prompt_kind TEXT NOT NULL,
+       chunk_index INT NOT NULL DEFAULT 0,
+       chunk_count INT NOT NULL DEFAULT 1,
+       FOREIGN KEY (cikcode, accessionnumber) REFERENCES filings(cikcode, accessionnumber),
+       UNIQUE (batch_id, cikcode, accessionNumber, prompt_kind, chunk_index)
+);
+CREATE INDEX ON openai_requests(cikcode, accessionNumber);
@@ -0,0 +1,8 @@
+-- What load_listed_company_submissions.py last loaded for each company,
+-- so that --refresh can skip the ones that haven't changed
+CREATE TABLE submission_fingerprints (
+  cikcode INT PRIMARY KEY,
+  zip_crc BIGINT NOT NULL,
+  latest_accession VARCHAR,
+  date_loaded TIMESTAMP DEFAULT current_timestamp
+);
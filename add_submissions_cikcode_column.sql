@@ -0,0 +1,33 @@
+-- Store the cikcode and company name as real, indexed columns instead of
+-- parsing them out of the json every time cik2name is used. Both are
+-- generated columns, so they stay in sync with the submission json.
+ALTER TABLE submissions_raw
+  ADD COLUMN cikcode INT GENERATED ALWAYS AS (cast(jsonb_extract_path_text(submission, 'cik') as int)) STORED;
+ALTER TABLE submissions_raw
+  ADD COLUMN company_name TEXT GENERATED ALWAYS AS (submission->>'name') STORED;
+CREATE UNIQUE INDEX ON submissions_raw (cikcode);
+
+-- cikcode is unique, so there is no need for the distinct any more
+CREATE OR REPLACE VIEW cik2name AS
+SELECT
+    cikcode,
+    company_name
+FROM
+    submissions_raw;
+
+-- The old expression index on the json is now redundant. It was created
+-- without a name, so find it by its definition rather than guess the one
+-- postgres gave it.
+DO $$
+DECLARE
+    old_index TEXT;
+BEGIN
+    FOR old_index IN
+        SELECT indexname FROM pg_indexes
+         WHERE tablename = 'submissions_raw'
+           AND indexdef LIKE '%jsonb_extract_path_text(submission%'
+    LOOP
+        EXECUTE format('DROP INDEX IF EXISTS %I', old_index);
+    END LOOP;
+END
+$$;
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""Backfill many years and forms of EDGAR documents in one resumable run.
+
+  backfill_edgar_forms.py --plan --from-year 2001 --to-year 2022
+  backfill_edgar_forms.py --progress
+
+--plan works out which documents are still missing with a single anti-join
+against html_doc_cache and saves them in edgar_backfill_queue. Running
+without --plan downloads whatever in the queue is outstanding, newest years
+first, marking entries complete in the same transaction that stores them.
+If the run is interrupted it picks up where it left off without rescanning
+filings. Planning again later only adds filings that have appeared since."""
+
+import argparse
+import datetime
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--plan",
+                    action="store_true",
+                    help="Add outstanding documents for the given years and forms to the queue, then exit")
+parser.add_argument("--form",
+                    action="append",
+                    help="Which forms to plan (may be repeated; default: DEF 14A)")
+parser.add_argument("--from-year",
+                    type=int,
+                    default=2001,
+                    help="First filing year to plan")
+parser.add_argument("--to-year",
+                    type=int,
+                    default=datetime.datetime.now().year - 1,
+                    help="Last filing year to plan (defaults to last year)")
+parser.add_argument("--only-year",
+                    type=int,
+                    help="When fetching, only work on this year's part of the queue")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Fetch at most this many documents")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many downloads to run at once (default: [edgar] workers in the config, or 4)")
+parser.add_argument("--requests-per-second",
+                    type=float,
+                    help="Overall rate limit against EDGAR (default: [edgar] requests_per_second in the config, or 8)")
+parser.add_argument("--commit-every",
+                    type=int,
+                    default=50,
+                    help="Checkpoint after this many documents")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+args = parser.parse_args()
+
+import logging
+import sys
+import time
+
+import doc_store
+import edgar_fetcher
+import fetch_retry
+import pgconnect
+
+logging.basicConfig(
+    format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+    level=logging.INFO if args.verbose else logging.WARNING,
+    datefmt='%Y-%m-%d %H:%M:%S')
+
+conn = pgconnect.connect(args.database_config)
+read_cursor = conn.cursor()
+write_cursor = conn.cursor()
+
+if args.plan:
+    forms = args.form if args.form else ["DEF 14A"]
+    write_cursor.execute("""
+      insert into edgar_backfill_queue (url, form, filing_year)
+      select document_storage_url, form, extract(year from filingDate)
+        from filings
+       where form = any(%s)
+         and extract(year from filingDate) between %s and %s
+         and not exists (select 1 from html_doc_cache where html_doc_cache.url = filings.document_storage_url)
+         and not exists (select 1 from html_fetch_failures
+                          where html_fetch_failures.url = filings.document_storage_url
+                            and permanent)
+      on conflict (url) do nothing""", [forms, args.from_year, args.to_year])
+    added = write_cursor.rowcount
+    conn.commit()
+    read_cursor.execute("""
+      select form, filing_year, count(*)
+        from edgar_backfill_queue
+       where completed_at is null
+    group by form, filing_year
+    order by form, filing_year desc""")
+    for form, year, count in read_cursor:
+        print(f"{form:>10} {year}: {count} outstanding")
+    print(f"Added {added} documents to the backfill queue")
+    sys.exit(0)
+
+# Everything outstanding whose retry (if any) is due
+outstanding = """
+  select q.url
+    from edgar_backfill_queue q
+    left join html_fetch_failures f on (f.url = q.url)
+   where q.completed_at is null
+     and not exists (select 1 from html_doc_cache where html_doc_cache.url = q.url)
+     and (f.url is null or (not f.permanent and f.next_attempt_after <= current_timestamp))
+"""
+params = []
+if args.only_year is not None:
+    outstanding += " and q.filing_year = %s"
+    params.append(args.only_year)
+outstanding += " order by q.filing_year desc, q.url"
+if args.stop_after is not None:
+    outstanding += " limit %s"
+    params.append(args.stop_after)
+read_cursor.execute(outstanding, params)
+total = read_cursor.rowcount
+if total == 0:
+    print("Nothing outstanding in the backfill queue. (Did you run --plan?)")
+    sys.exit(0)
+
+store = doc_store.from_config(args.database_config)
+fetcher = edgar_fetcher.from_config(args.database_config,
+                                    workers=args.workers,
+                                    requests_per_second=args.requests_per_second)
+results = fetcher.fetch_all(row[0] for row in read_cursor)
+
+if args.progress:
+    import tqdm
+    iterator = tqdm.tqdm(results, total=total)
+else:
+    iterator = results
+
+
+def mark_complete(url):
+    write_cursor.execute("update edgar_backfill_queue set completed_at = current_timestamp where url = %s", [url])
+
+
+started = time.monotonic()
+done = 0
+fetched = 0
+failed = 0
+uncommitted = 0
+for url, r, error in iterator:
+    done += 1
+    if error is not None:
+        logging.error(f"Could not fetch {url}: {error}")
+        fetch_retry.record_failure(write_cursor, url, None)
+        failed += 1
+    elif r.status_code != 200:
+        failed += 1
+        if fetch_retry.record_failure(write_cursor, url, r.status_code):
+            logging.error(f"Could not fetch {url}: {r.status_code}")
+        else:
+            logging.error(f"Could not fetch {url}: {r.status_code} (giving up)")
+            mark_complete(url)
+    else:
+        store.save(write_cursor, url, r.content, r.encoding, r.headers.get('content-type'),
+                   r.headers.get('etag'), r.headers.get('last-modified'))
+        fetch_retry.record_success(write_cursor, url)
+        mark_complete(url)
+        fetched += 1
+    uncommitted += 1
+    if uncommitted >= args.commit_every:
+        conn.commit()
+        uncommitted = 0
+        if not args.progress:
+            elapsed = time.monotonic() - started
+            eta = datetime.timedelta(seconds=int(elapsed / done * (total - done)))
+            print(f"{done}/{total} done ({done / elapsed:.1f}/s), ETA {eta}", flush=True)
+
+conn.commit()
+print(f"Fetched {fetched} documents, {failed} failures, {total - done} not attempted")
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+
+"""Build, submit and ingest OpenAI batches for the kinds in batch_kinds.py.
+
+build_and_submit() finds the filings a kind hasn't asked about yet, cleans
+them, writes them into batch files sized by batch_sizing.py, records every
+request in the openai_requests ledger and sends the batches. fetch() polls
+every unfinished batch at once, whatever its kind (see batch_poller.py), and
+hands the results of finished ones to the ingest handler of the kind that
+sent them.
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+
+import openai
+
+import batch_kinds
+import batch_output
+import batch_poller
+import batch_sizing
+import filing_text
+import openai_key
+import prompt_chunks
+import request_ledger
+import token_costs
+from batch_response_parser import RetryableBatchRecordError, extract_tool_arguments
+
+EXPECTED_BATCH_ENDPOINT = "/v1/chat/completions"
+# Results are handed to a kind's ingest function this many at a time
+RESULTS_PER_PAGE = 1000
+
+
+def add_filing_arguments(parser):
+    """Options for choosing which filings to ask about, and how to split them up."""
+    parser.add_argument("--progress",
+                        action="store_true",
+                        help="Show a progress bar")
+    parser.add_argument("--stop-after",
+                        type=int,
+                        help="Don't try to process every table. Stop after this number")
+    parser.add_argument("--cikcode",
+                        type=int,
+                        help="Only process documents from this cikcode")
+    parser.add_argument("--accession-number",
+                        help="Only process documents with this accession number")
+    parser.add_argument("--accession-file",
+                        help="File containing accession numbers to process, one per line")
+    parser.add_argument("--newest",
+                        type=int,
+                        help="Only the most recently filed N outstanding filings")
+    parser.add_argument("--openai-key-file",
+                        default=openai_key.DEFAULT_OPENAI_KEY_FILE)
+    parser.add_argument("--max-prompt-tokens",
+                        type=int,
+                        default=prompt_chunks.DEFAULT_MAX_PROMPT_TOKENS,
+                        help="Split filings bigger than this into several requests (for kinds that can)")
+    parser.add_argument("--max-chunks",
+                        type=int,
+                        default=10,
+                        help="Skip filings that would need more requests than this")
+
+
+def add_build_arguments(parser):
+    add_filing_arguments(parser)
+    parser.add_argument("--show-prompt", action="store_true", help="Display the prompts that are sent to OpenAI")
+    parser.add_argument("--show-response", action="store_true", help="Display the response returned by OpenAI")
+    parser.add_argument("--dry-run", action="store_true", help="Don't send anything to OpenAI")
+    parser.add_argument("--batch-file", help="Where to put the batch file (default: random tempfile). Further batches go in -2, -3, ... alongside it")
+    parser.add_argument("--batch-id-save-file", help="What file to put the local batch IDs into, one per line")
+    parser.add_argument("--max-batches",
+                        type=int,
+                        help="Send at most this many batches (default: max_batches in the [batch] section of the config, or 10)")
+
+
+def outstanding_filings(read_cursor, kind, args):
+    """Run the query for the filings kind hasn't asked about yet."""
+    constraints = []
+    constraint_args = []
+    if args.cikcode is not None:
+        constraints.append("cikcode = %s")
+        constraint_args.append(args.cikcode)
+    if args.accession_number is not None:
+        constraints.append("accessionnumber = %s")
+        constraint_args.append(args.accession_number)
+    if args.accession_file is not None:
+        with open(args.accession_file, 'r') as f:
+            accession_numbers = [line.strip() for line in f if line.strip()]
+        if accession_numbers:
+            constraints.append("accessionnumber = any(%s)")
+            constraint_args.append(accession_numbers)
+    if len(constraints) == 0:
+        constraints = ""
+    else:
+        constraints = " AND " + (' AND '.join(constraints))
+
+    # Filings that have already been cleaned come straight from filing_text_cache,
+    # without fetching the raw document at all
+    query = f"""
+    select cikcode, accessionnumber,
+           case when filing_text_cache.url is null then content end,
+           codec, content_sha256, encoding, content_type, html_doc_cache.url,
+           filing_text_cache.text_version
+      from html_doc_cache join filings on (document_storage_url = html_doc_cache.url)
+      left join filing_text_cache on (filing_text_cache.url = html_doc_cache.url
+                                      and filing_text_cache.cleaner_version = %s)
+     where html_doc_cache.url not in (select url from {kind.queue_table})
+    """ + constraints
+
+    if args.newest is not None:
+        query += f" order by filingDate desc, cikcode, accessionnumber limit {int(args.newest)}"
+    else:
+        query += " order by cikcode, accessionnumber"
+        if args.stop_after is not None:
+            query += f" limit {args.stop_after}"
+
+    read_cursor.execute(query, [filing_text.CLEANER_VERSION] + constraint_args)
+
+
+def filing_requests(conn, store, kind, args):
+    """Yield (cikcode, accession number, url, user messages, estimated tokens) for kind's outstanding filings.
+
+    Each filing's text is cleaned (and cached) if it hasn't been already,
+    and split into several user messages if kind is chunked and it is too
+    big for one request.
+    """
+    # A server-side cursor, since the run usually stops when its token budget is
+    # used up, long before the end of the backlog
+    read_cursor = conn.cursor(name=f"outstanding_{kind.name}")
+    sentence_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+
+    outstanding_filings(read_cursor, kind, args)
+
+    # Every request repeats the system prompt and the tool definition
+    fixed_tokens = prompt_chunks.estimate_tokens(kind.system_prompt) + prompt_chunks.estimate_tokens(json.dumps([kind.tool]))
+
+    if args.progress:
+        import tqdm
+        iterator = tqdm.tqdm(read_cursor, desc=kind.name)
+    else:
+        iterator = read_cursor
+
+    try:
+        for cikcode, accession_number, content, codec, content_sha256, encoding, content_type, url, text_version in iterator:
+            logging.info(f"Processing {cikcode=}, {accession_number=}")
+            if args.progress:
+                iterator.set_description(f"{kind.name} {cikcode} {accession_number}")
+            if text_version is None:
+                if content_type == 'image/gif':
+                    sys.stderr.write(f"{cikcode} {accession_number} is a gif. {url}\n")
+                    continue
+                try:
+                    text_version = filing_text.text_version(store.decode(content, codec, content_sha256), encoding, content_type)
+                except filing_text.UnsupportedContentType:
+                    sys.exit(f"Don't know how to handle {cikcode=} {accession_number=} because {content_type=}")
+                filing_text.save(write_cursor, url, text_version)
+
+            if kind.chunked:
+                chunks = prompt_chunks.plan_chunks(sentence_cursor, cikcode, accession_number, text_version, args.max_prompt_tokens)
+                if len(chunks) > args.max_chunks:
+                    sys.stderr.write(f"{cikcode} {accession_number} would need {len(chunks)} requests; skipping. {url}\n")
+                    continue
+                if len(chunks) > 1:
+                    logging.info(f"Splitting {url} into {len(chunks)} requests")
+            else:
+                chunks = [text_version]
+
+            user_contents = []
+            request_tokens = 0
+            for chunk_number, chunk in enumerate(chunks):
+                if len(chunks) == 1:
+                    user_content = chunk
+                else:
+                    user_content = f"[Part {chunk_number + 1} of {len(chunks)} of the filing]\n" + chunk
+                user_contents.append(user_content)
+                request_tokens += fixed_tokens + prompt_chunks.estimate_tokens(user_content)
+            yield cikcode, accession_number, url, user_contents, request_tokens
+    finally:
+        read_cursor.close()
+
+
+def build(conn, store, kind, args, batch_file):
+    """Write batch files for kind's outstanding filings.
+
+    Returns the (local batch id, batch file) of each batch, and the
+    BatchPlanner that says how big each one is.
+    """
+    write_cursor = conn.cursor()
+
+    limits = batch_sizing.limits_from_config(args.database_config, max_batches=args.max_batches)
+    planner = batch_sizing.planner_for(write_cursor, limits)
+    logging.info(f"Budget for {kind.name} is {planner.budget_tokens} tokens, up to {planner.batch_tokens} per batch")
+
+    # (local batch id, batch file) for each batch, created as the planner asks for them
+    batches = []
+
+    def batch_for(index):
+        if index == len(batches):
+            write_cursor.execute("insert into director_extract_batches (batch_kind) values (%s) returning id", [kind.name])
+            new_batch_id = write_cursor.fetchone()[0]
+            if index == 0:
+                filename = batch_file
+            else:
+                root, extension = os.path.splitext(batch_file)
+                filename = f"{root}-{index + 1}{extension}"
+            open(filename, 'w').close()
+            batches.append((new_batch_id, filename))
+        return batches[index]
+
+    filings = filing_requests(conn, store, kind, args)
+    for cikcode, accession_number, url, user_contents, request_tokens in filings:
+        bodies = [json.dumps(kind.request_body(user_content)) for user_content in user_contents]
+        request_bytes = sum(len(body.encode('utf-8')) + request_ledger.LINE_OVERHEAD_BYTES for body in bodies)
+        index = planner.place(request_tokens, request_bytes, len(bodies))
+        if index is None and request_tokens > limits.enqueued_token_limit * batch_sizing.SAFETY_MARGIN:
+            sys.stderr.write(f"{cikcode} {accession_number} is about {request_tokens} tokens, more than can ever be enqueued; skipping. {url}\n")
+            continue
+        if index is None:
+            logging.info(f"Token budget for this run is used up; stopping at {cikcode} {accession_number}")
+            break
+        batch_id, filename = batch_for(index)
+        custom_ids = request_ledger.record(write_cursor, batch_id, cikcode, accession_number, url,
+                                           kind.name, len(bodies))
+        with open(filename, 'a') as f:
+            for custom_id, body in zip(custom_ids, bodies):
+                f.write(request_ledger.batch_line(custom_id, body))
+
+        write_cursor.execute(f"insert into {kind.queue_table} (url, batch_id) values (%s, %s)", [url, batch_id])
+    filings.close()
+
+    for (batch_id, filename), (tokens, size, request_count) in zip(batches, planner.batches):
+        logging.info(f"Batch {batch_id}: {request_count} {kind.name} requests, about {tokens} tokens, {size} bytes in {filename}")
+    return batches, planner
+
+
+def validate_batch_requests(batch_file_path):
+    """Raise an error if any requests in the batch use an unexpected endpoint."""
+
+    problems = []
+
+    with open(batch_file_path) as batch_file:
+        for line_number, line in enumerate(batch_file, start=1):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            try:
+                payload = json.loads(stripped)
+            except json.JSONDecodeError as exc:
+                problems.append(
+                    f"Line {line_number}: could not decode JSON ({exc})"
+                )
+                continue
+
+            url = payload.get("url")
+            if not url:
+                problems.append(
+                    f"Line {line_number}: missing URL in payload {payload!r}"
+                )
+                continue
+
+            if url != EXPECTED_BATCH_ENDPOINT:
+                problems.append(
+                    f"Line {line_number}: unexpected endpoint '{url}' for custom_id"
+                    f" {payload.get('custom_id')!r}. Expected {EXPECTED_BATCH_ENDPOINT!r}."
+                )
+
+    if problems:
+        problem_report = "\n".join(problems)
+        raise SystemExit(
+            "Refusing to submit batch file because potential endpoint issues were"
+            f" detected:\n{problem_report}\n"
+            f"Expected every request to target {EXPECTED_BATCH_ENDPOINT!r}."
+        )
+
+
+def submit(conn, client, kind, batches, planner):
+    """Send the batches to OpenAI. If that fails part way, the filings in unsent batches are given back."""
+    write_cursor = conn.cursor()
+    for batch_id, batch_file in batches:
+        validate_batch_requests(batch_file)
+
+    sent = 0
+    try:
+        for (batch_id, batch_file), (tokens, size, request_count) in zip(batches, planner.batches):
+            batch_input_file = client.files.create(
+                file=open(batch_file, "rb"),
+                purpose="batch"
+            )
+
+            result = client.batches.create(
+                input_file_id=batch_input_file.id,
+                endpoint=EXPECTED_BATCH_ENDPOINT,
+                completion_window="24h",
+                metadata={
+                    "description": f"{kind.description} {batch_id}",
+                    "local_batch_id": f"{batch_id}"
+                }
+            )
+
+            write_cursor.execute(
+                "update director_extract_batches set openai_batch_id = %s, when_sent = current_timestamp, estimated_tokens = %s, request_count = %s where id = %s",
+                [result.id, tokens, request_count, batch_id]
+            )
+
+            if write_cursor.rowcount != 1:
+                sys.exit(f"Unexpectedly updated {write_cursor.rowcount} rows when we set the openai_batch id to {result.id} for batch {batch_id}")
+            sent += 1
+    except Exception:
+        # Keep the batches OpenAI has accepted, and give the rest of the filings back
+        for batch_id, batch_file in batches[sent:]:
+            write_cursor.execute(f"delete from {kind.queue_table} where batch_id = %s", [batch_id])
+            write_cursor.execute("delete from openai_requests where batch_id = %s", [batch_id])
+            write_cursor.execute("delete from director_extract_batches where id = %s", [batch_id])
+        conn.commit()
+        raise
+
+    conn.commit()
+
+
+def build_and_submit(conn, store, kind, args, batch_file=None):
+    """Build and send kind's batches, returning their local batch ids.
+
+    With --dry-run nothing is sent and nothing is kept: the batch rows and
+    any filing text cleaned along the way are in the same transaction, and
+    it is rolled back.
+    """
+    if batch_file is None:
+        tf = tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.jsonl')
+        batch_file = tf.name
+        tf.close()
+
+    batches, planner = build(conn, store, kind, args, batch_file)
+
+    if len(batches) == 0:
+        # Keep any filing text that was cleaned along the way
+        conn.commit()
+        return []
+
+    if args.dry_run:
+        conn.rollback()
+        return []
+
+    api_key = openai_key.load_openai_api_key(args.openai_key_file)
+    client = openai.OpenAI(api_key=api_key)
+    submit(conn, client, kind, batches, planner)
+    return [batch_id for batch_id, batch_file in batches]
+
+
+def release_for_retry(cursor, kind, local_batch_id, url):
+    """Take a filing out of kind's queue so that the next build asks about it again."""
+    cursor.execute(
+        f"delete from {kind.queue_table} where batch_id = %s and url = %s",
+        [local_batch_id, url],
+    )
+    return cursor.rowcount
+
+
+def format_record_context(error):
+    context = []
+    if getattr(error, "request_id", None):
+        context.append(f"request_id={error.request_id}")
+    if getattr(error, "finish_reason", None):
+        context.append(f"finish_reason={error.finish_reason}")
+    if context:
+        return " (" + ", ".join(context) + ")"
+    return ""
+
+
+def clean_json_for_postgres(json_obj):
+    """Remove null characters, which postgres won't store in text or jsonb."""
+    if isinstance(json_obj, str):
+        return json_obj.replace('\u0000', '')
+    elif isinstance(json_obj, dict):
+        return {k: clean_json_for_postgres(v) for k, v in json_obj.items()}
+    elif isinstance(json_obj, list):
+        return [clean_json_for_postgres(item) for item in json_obj]
+    else:
+        return json_obj
+
+
+def ingest_output(cursor, kind, local_batch_id, openai_batch_id, output_path):
+    """Hand every usable result in a batch output file to kind.ingest.
+
+    Failed or unusable requests release their filing for retry. Returns
+    the token_costs.Usage of the results.
+    """
+    total_usage = token_costs.NO_USAGE
+    results = []
+
+    def add_result(result):
+        results.append(result)
+        if len(results) >= RESULTS_PER_PAGE:
+            kind.ingest(cursor, results)
+            results.clear()
+
+    # Look up every request in the file at once, rather than one per record
+    requests_by_id = batch_output.requests_for(cursor, output_path)
+
+    # Filings that were split into several requests (see prompt_chunks.py):
+    # url -> (number of chunks, {chunk index: (request, arguments, usage)})
+    chunked_results = {}
+
+    for record in batch_output.records(output_path):
+        custom_id = record.get('custom_id')
+        if custom_id is None:
+            logging.error(
+                "Batch %s (local_id=%s) returned a record without custom_id; skipping unrecoverable row",
+                openai_batch_id,
+                local_batch_id,
+            )
+            continue
+        request = requests_by_id.get(custom_id)
+        if request is None:
+            url, chunk_index, chunk_count = prompt_chunks.split_custom_id(custom_id)
+        else:
+            url, chunk_index, chunk_count = request.url, request.chunk_index, request.chunk_count
+            if request.prompt_kind is not None and request.prompt_kind != kind.name:
+                logging.error(
+                    "Batch %s (local_id=%s) is a %s batch but returned request %s for %s; skipping",
+                    openai_batch_id,
+                    local_batch_id,
+                    kind.name,
+                    custom_id,
+                    request.prompt_kind,
+                )
+                continue
+
+        response = record.get('response') or {}
+        body = response.get('body')
+        if not isinstance(body, dict):
+            body = {}
+
+        if response.get('status_code') != 200:
+            request_id = response.get('request_id')
+            error_message = None
+            error = body.get('error')
+            if isinstance(error, dict):
+                error_message = error.get('message')
+
+            if request is not None:
+                sys.stderr.write(
+                    f"Failed to download {url} (CIK {request.cikcode}, accession {request.accession_number})"
+                )
+            else:
+                sys.stderr.write(f"Failed to download {url}")
+
+            if request_id:
+                sys.stderr.write(f" request_id={request_id}")
+            if error_message:
+                sys.stderr.write(f": {error_message}")
+            sys.stderr.write("\n")
+            released = release_for_retry(cursor, kind, local_batch_id, url)
+            logging.warning(
+                "Batch %s (local_id=%s) returned status_code=%s for %s and released %s queued row(s) for retry",
+                openai_batch_id,
+                local_batch_id,
+                response.get('status_code'),
+                url,
+                released,
+            )
+            continue
+
+        if request is None:
+            released = release_for_retry(cursor, kind, local_batch_id, url)
+            logging.error(
+                "Batch %s (local_id=%s) returned %s but no matching request or filing was found. Released %s queued row(s) for retry.",
+                openai_batch_id,
+                local_batch_id,
+                url,
+                released,
+            )
+            continue
+
+        usage = token_costs.usage_from_response(body.get('usage'))
+
+        # Extract the tool call arguments
+        try:
+            arguments = clean_json_for_postgres(extract_tool_arguments(record))
+        except RetryableBatchRecordError as exc:
+            released = release_for_retry(cursor, kind, local_batch_id, url)
+            logging.warning(
+                "Batch %s (local_id=%s) returned unusable structured output for %s: %s%s. Released %s queued row(s) for retry.",
+                openai_batch_id,
+                local_batch_id,
+                url,
+                exc.reason,
+                format_record_context(exc),
+                released,
+            )
+            print(
+                f"WARNING: Batch {local_batch_id} (openai_id={openai_batch_id}) returned unusable structured output for {url}: {exc.reason}{format_record_context(exc)}",
+                file=sys.stderr,
+            )
+            continue
+
+        total_usage = token_costs.add(total_usage, usage)
+
+        if chunk_index is not None:
+            chunk_count, chunks = chunked_results.setdefault(url, (chunk_count, {}))
+            chunks[chunk_index] = (request, arguments, usage)
+            continue
+
+        add_result(batch_kinds.Result(request.url, request.cikcode, request.accession_number, arguments,
+                                      usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens))
+
+    # A chunked filing is only stored once every chunk came back usable; if
+    # any chunk failed, the whole filing was released and is asked again
+    for url, (chunk_count, chunks) in chunked_results.items():
+        if len(chunks) != chunk_count:
+            released = release_for_retry(cursor, kind, local_batch_id, url)
+            logging.warning(
+                "Batch %s (local_id=%s) only returned %s of %s chunks for %s. Released %s queued row(s) for retry.",
+                openai_batch_id,
+                local_batch_id,
+                len(chunks),
+                chunk_count,
+                url,
+                released,
+            )
+            continue
+        parts = [chunks[i] for i in sorted(chunks)]
+        request = parts[0][0]
+        arguments = prompt_chunks.merge_directors([part[1] for part in parts])
+        usage = token_costs.add(*(part[2] for part in parts))
+        add_result(batch_kinds.Result(request.url, request.cikcode, request.accession_number, arguments,
+                                      usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens))
+
+    if len(results) > 0:
+        kind.ingest(cursor, results)
+    return total_usage
+
+
+def fetch(conn, client, kinds, statuses=None):
+    """Ingest every finished batch of the given kinds, committing after each.
+
+    statuses are from batch_poller.poll(); if they aren't given, every
+    outstanding batch of these kinds is polled first.
+
+    Returns the token_costs.Usage of everything ingested, and the number of
+    batches that couldn't be ingested.
+    """
+    cursor = conn.cursor()
+    kinds_by_name = {kind.name: kind for kind in kinds}
+    if statuses is None:
+        statuses = batch_poller.poll(conn, client, kinds=list(kinds_by_name))
+
+    total_usage = token_costs.NO_USAGE
+    failures = 0
+    ingested_kinds = set()
+
+    for status in statuses:
+        local_batch_id, openai_batch_id, openai_result = status.local_batch_id, status.openai_batch_id, status.openai_result
+        if status.batch_kind not in kinds_by_name:
+            continue
+        kind = kinds_by_name[status.batch_kind]
+        if openai_result is None or openai_result.status not in batch_poller.FINISHED_STATUSES:
+            continue
+        if openai_result.error_file_id is not None:
+            try:
+                batch_output.copy_to_stderr(client, openai_result.error_file_id)
+            except openai.NotFoundError:
+                logging.warning(
+                    "OpenAI returned error_file_id %s but the file was unavailable (likely expired)",
+                    openai_result.error_file_id,
+                )
+        if openai_result.output_file_id is None:
+            logging.warning(
+                "Batch %s (local_id=%s) has status=%s but no output_file_id; skipping",
+                openai_batch_id,
+                local_batch_id,
+                openai_result.status,
+            )
+            continue
+
+        try:
+            output_path = batch_output.download(client, openai_result.output_file_id)
+        except openai.NotFoundError:
+            logging.error(
+                "Batch %s (local_id=%s) output file %s not found (likely expired). "
+                "Marking batch as retrieved with no results.",
+                openai_batch_id,
+                local_batch_id,
+                openai_result.output_file_id,
+            )
+            # Mark the batch as retrieved so we don't keep retrying a lost file
+            cursor.execute(
+                "update director_extract_batches set when_retrieved = current_timestamp where id = %s",
+                [local_batch_id],
+            )
+            conn.commit()
+            print(
+                f"ERROR: Batch {local_batch_id} (openai_id={openai_batch_id}) output file expired. "
+                f"File {openai_result.output_file_id} no longer available.",
+                file=sys.stderr,
+            )
+            continue
+
+        try:
+            usage = ingest_output(cursor, kind, local_batch_id, openai_batch_id, output_path)
+            cursor.execute("update director_extract_batches set when_retrieved = current_timestamp where id = %s", [local_batch_id])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.exception("Couldn't ingest %s batch %s (local_id=%s)", kind.name, openai_batch_id, local_batch_id)
+            failures += 1
+            continue
+        finally:
+            os.unlink(output_path)
+        logging.info(f"Ingested {kind.name} batch {local_batch_id}")
+        total_usage = token_costs.add(total_usage, usage)
+        ingested_kinds.add(kind)
+
+    for kind in ingested_kinds:
+        for view in kind.refresh_views:
+            cursor.execute(f"refresh materialized view {view}")
+    conn.commit()
+    return total_usage, failures
+
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Run every kind of OpenAI batch extraction (see batch_kinds.py) in one go.
+
+--fetch ingests each finished batch, looking at every outstanding batch
+once whatever its kind. --build then sends new batches for each kind in
+turn; each kind's budget allows for what the kinds before it just sent.
+With neither option, it does both.
+"""
+
+import argparse
+import batch_engine
+import batch_kinds
+import doc_store
+import logging
+import openai
+import openai_key
+import os
+import pgconnect
+import sys
+import token_costs
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+parser.add_argument("--kind",
+                    action="append",
+                    choices=sorted(batch_kinds.KINDS),
+                    help="Only this kind of extraction (can be given more than once; default: all of them)")
+parser.add_argument("--build", action="store_true", help="Build and send new batches")
+parser.add_argument("--fetch", action="store_true", help="Ingest finished batches")
+parser.add_argument("--show-costs", action="store_true")
+batch_engine.add_build_arguments(parser)
+args = parser.parse_args()
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+else:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.WARNING,
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+if not args.build and not args.fetch:
+    args.build = args.fetch = True
+
+kinds = [batch_kinds.KINDS[name] for name in (args.kind or batch_kinds.KINDS)]
+
+conn = pgconnect.connect(args.database_config)
+failures = 0
+
+if args.fetch:
+    client = openai.OpenAI(api_key=openai_key.load_openai_api_key(args.openai_key_file))
+    usage, failures = batch_engine.fetch(conn, client, kinds)
+    if args.show_costs:
+        token_costs.print_costs(usage, token_costs.prices_from_config(args.database_config))
+
+if args.build:
+    store = doc_store.from_config(args.database_config)
+    batch_ids = []
+    for kind in kinds:
+        batch_file = None
+        if args.batch_file is not None:
+            root, extension = os.path.splitext(args.batch_file)
+            batch_file = f"{root}-{kind.name}{extension}"
+        sent = batch_engine.build_and_submit(conn, store, kind, args, batch_file)
+        if len(sent) == 0 and not args.dry_run:
+            print(f"Nothing to send for {kind.name}: no outstanding filings, or no room under the enqueued token limit")
+        batch_ids.extend(sent)
+    if args.batch_id_save_file:
+        with open(args.batch_id_save_file, 'w') as bisf:
+            for batch_id in batch_ids:
+                bisf.write(f"{batch_id}\n")
+
+if failures > 0:
+    sys.exit(f"{failures} batch(es) could not be ingested")
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""The kinds of extraction we run through OpenAI's batch API.
+
+Each kind has its own prompt, tool schema and queue table (the filings it
+has already asked about, and which batch they went in), and a handler that
+stores its results. batch_engine.py does everything else, and records each
+batch's kind in director_extract_batches.batch_kind so that every batch is
+ingested by the kind that sent it.
+
+To add a kind, write its prompt, tool and ingest function and register() a
+BatchKind for it. ingest(cursor, results) is given a page of Result tuples
+at a time and should write them in bulk.
+"""
+
+import collections
+import json
+import logging
+
+import psycopg2.extras
+
+import request_ledger
+
+# One filing's answer, with the usage of every request it took (cached_tokens
+# are the prompt_tokens OpenAI found in its prompt cache)
+Result = collections.namedtuple(
+    "Result", ["url", "cikcode", "accession_number", "arguments", "prompt_tokens", "completion_tokens",
+               "cached_tokens"],
+    defaults=[0])
+
+MODEL = "gpt-5.4-mini"
+
+
+class BatchKind:
+    def __init__(self, name, queue_table, description, system_prompt, tool, ingest,
+                 chunked=False, refresh_views=()):
+        self.name = name
+        # Filings in this table have been asked about (or are being asked about)
+        self.queue_table = queue_table
+        # What goes in the metadata of the batches we send
+        self.description = description
+        self.system_prompt = system_prompt
+        self.tool = tool
+        self.ingest = ingest
+        # Whether filings too big for one request are split into chunks (see
+        # prompt_chunks.py); otherwise they are sent whole
+        self.chunked = chunked
+        # Materialized views to refresh after results have been ingested
+        self.refresh_views = refresh_views
+
+    def request_body(self, user_content):
+        # Everything but the filing is the same in every request of a kind, and
+        # comes first, so that OpenAI can serve it from its prompt cache. The
+        # cache key keeps each kind's requests together on the same cache.
+        return {
+            "model": MODEL,
+            "prompt_cache_key": self.name,
+            "temperature": 0,
+            "tools": [self.tool],
+            "tool_choice": {"type": "function", "function": {"name": self.tool["function"]["name"]}},
+            "messages": [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user_content}],
+        }
+
+
+KINDS = {}
+
+
+def register(kind):
+    KINDS[kind.name] = kind
+    return kind
+
+
+DIRECTOR_EXTRACTION_PROMPT = """Extract the names of all directors listed in this DEF 14A filing, and identify if they have any software-related or adjacent technical skills that would indicate that they can write programs. Examples of relevant skills include: experience as a programmer, software engineer, cybersecurity specialist, or having degrees in computer science, software engineering, mathematics, or similar technical qualifications. Just being a director or manager who had oversight over an organisation that wrote or ran software is not sufficient.
+
+For each director, clearly state:
+- Their full name.
+- Whether they have software-related technical skills (true/false).
+- Provide a brief reason supporting your determination.
+- Include a relevant excerpt from the filing as a source reference.
+"""
+
+DIRECTOR_EXTRACTION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "show_directors",
+        "description": "List directors from a DEF 14A filing, indicating software-related technical background with supporting references.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "directors": {
+                    "type": "array",
+                    "description": "List of directors with technical background information.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "Full name of the director."
+                            },
+                            "reason": {
+                                "type": "string",
+                                "description": "Brief explanation supporting the determination."
+                            },
+                            "software_background": {
+                                "type": "boolean",
+                                "description": "True if director has software or related technical skills, otherwise false."
+                            },
+                            "source_excerpt": {
+                                "type": "string",
+                                "description": "A short excerpt from the filing providing evidence for the determination."
+                            }
+                        },
+                        "required": ["name", "software_background", "reason", "source_excerpt"]
+                    }
+                }
+            },
+            "required": ["directors"]
+        }
+    }
+}
+
+
+def ingest_director_extractions(cursor, results):
+    # Keyed by filing, since postgres refuses an ON CONFLICT DO UPDATE that
+    # touches the same row twice in one statement
+    rows = {(result.cikcode, result.accession_number): (
+                result.cikcode, result.accession_number, json.dumps(result.arguments),
+                result.prompt_tokens, result.completion_tokens)
+            for result in results}
+    psycopg2.extras.execute_values(cursor, """
+         INSERT INTO director_extraction_raw (cikcode, accessionNumber, response, prompt_tokens, completion_tokens)
+                     VALUES %s
+              ON CONFLICT (cikcode, accessionNumber)
+             DO UPDATE SET
+                   response = excluded.response,
+                   prompt_tokens = excluded.prompt_tokens,
+                   completion_tokens = excluded.completion_tokens
+    """, list(rows.values()), page_size=len(rows))
+
+
+register(BatchKind(
+    request_ledger.DIRECTOR_EXTRACTION,
+    queue_table="director_extractions",
+    description="techskills batch",
+    system_prompt=DIRECTOR_EXTRACTION_PROMPT,
+    tool=DIRECTOR_EXTRACTION_TOOL,
+    ingest=ingest_director_extractions,
+    chunked=True,
+    refresh_views=["director_mentions"]))
+
+
+DIRECTOR_COMPENSATION_PROMPT = """Extract information about all directors listed in this DEF 14A filing. For each director, provide:
+
+1. Their full name
+2. Their age (if mentioned)
+3. Their role or position (e.g., Chairman, Independent Director, CEO, etc.)
+4. Their gender (male, female, or non-binary; use 'unknown' if uncertain)
+5. All committees they serve on (e.g., Audit, Compensation, Governance, etc.)
+6. Their total annual compensation in USD
+7. A relevant excerpt from the filing that supports this information
+
+For determining gender:
+- Look for pronouns (he/him, she/her, they/them) used in descriptions of the director
+- Consider traditional gender associations with first names
+- Look for titles like Mr., Mrs., Ms., etc.
+- If the gender cannot be determined from the document, use 'unknown'
+
+If any information is not available for a director, use appropriate default values (0 for numeric fields, empty array for committees, 'unknown' for gender if not determinable, etc.).
+"""
+
+DIRECTOR_COMPENSATION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "show_director_details",
+        "description": "Extract director compensation, age, role, gender, and committee memberships from a DEF 14A filing.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "directors": {
+                    "type": "array",
+                    "description": "List of directors with their details.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "Full name of the director."
+                            },
+                            "age": {
+                                "type": "integer",
+                                "description": "Age of the director. If not stated, use 0."
+                            },
+                            "role": {
+                                "type": "string",
+                                "description": "Role or position of the director (e.g., Chairman, Independent Director, CEO, etc.)"
+                            },
+                            "gender": {
+                                "type": "string",
+                                "description": "Gender of the director (e.g., male, female, non-binary). If uncertain, use 'unknown'."
+                            },
+                            "committees": {
+                                "type": "array",
+                                "description": "List of committees the director serves on.",
+                                "items": {
+                                    "type": "string"
+                                }
+                            },
+                            "compensation": {
+                                "type": "integer",
+                                "description": "Total annual compensation in USD. If not stated, use 0."
+                            },
+                            "source_excerpt": {
+                                "type": "string",
+                                "description": "A short excerpt from the filing providing evidence for the information."
+                            }
+                        },
+                        "required": ["name", "age", "role", "gender", "committees", "compensation", "source_excerpt"]
+                    }
+                }
+            },
+            "required": ["directors"]
+        }
+    }
+}
+
+
+def ingest_director_compensation(cursor, results):
+    cursor.execute("SELECT DISTINCT url FROM director_compensation WHERE url = any(%s)",
+                   [list({result.url for result in results})])
+    queued_urls = {row[0] for row in cursor.fetchall()}
+    directors = []
+    processed_urls = set()
+    for result in results:
+        if result.url not in queued_urls:
+            logging.warning(f"URL {result.url} not found in director_compensation table, skipping")
+            continue
+        if 'directors' in result.arguments:
+            directors.extend((result.url, director) for director in result.arguments['directors'])
+            processed_urls.add(result.url)
+
+    if len(directors) > 0:
+        # Postgres doesn't promise RETURNING rows in VALUES order, and nothing
+        # else tells two directors apart, so take the ids from the sequence
+        # first to know which committees go with which director
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('director_details', 'id')) FROM generate_series(1, %s)",
+                       [len(directors)])
+        director_ids = [row[0] for row in cursor.fetchall()]
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO director_details (id, url, name, age, role, gender, compensation, source_excerpt)
+            VALUES %s
+        """, [(director_id,
+               url,
+               director.get('name', ''),
+               director.get('age', 0),
+               director.get('role', ''),
+               director.get('gender', 'unknown'),
+               director.get('compensation', 0),
+               director.get('source_excerpt', ''))
+              for director_id, (url, director) in zip(director_ids, directors)],
+            page_size=len(directors))
+        committees = []
+        for director_id, (url, director) in zip(director_ids, directors):
+            for committee in director.get('committees') or []:
+                if committee:  # Skip empty committee names
+                    committees.append((director_id, committee))
+        if len(committees) > 0:
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO director_committees (director_id, committee_name)
+                VALUES %s
+                ON CONFLICT (director_id, committee_name) DO NOTHING
+            """, committees, page_size=len(committees))
+
+    if len(processed_urls) > 0:
+        cursor.execute("""
+            UPDATE director_compensation SET processed = TRUE
+            WHERE url = any(%s)
+        """, [list(processed_urls)])
+
+
+register(BatchKind(
+    request_ledger.DIRECTOR_COMPENSATION,
+    queue_table="director_compensation",
+    description="director_compensation batch",
+    system_prompt=DIRECTOR_COMPENSATION_PROMPT,
+    tool=DIRECTOR_COMPENSATION_TOOL,
+    ingest=ingest_director_compensation))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""Read OpenAI batch output files without holding them in memory.
+
+A 50,000-request batch can produce an output file of several hundred MB.
+download() streams it to a temporary file on disk, records() parses it a
+line at a time, and requests_for() resolves every custom_id in it to its
+filing (see request_ledger.py) in bulk rather than one record at a time."""
+
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import request_ledger
+
+
+def download(client, file_id):
+    """Stream an OpenAI file to a temporary file and return its path.
+
+    The caller should os.unlink() it when done. Raises openai.NotFoundError
+    if the file has expired.
+    """
+    handle, path = tempfile.mkstemp(suffix=".jsonl", prefix="batch-output-")
+    os.close(handle)
+    try:
+        with client.files.with_streaming_response.content(file_id) as response:
+            response.stream_to_file(path)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def copy_to_stderr(client, file_id):
+    """Stream an OpenAI file (e.g. a batch's error file) to stderr."""
+    path = download(client, file_id)
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            shutil.copyfileobj(f, sys.stderr)
+    finally:
+        os.unlink(path)
+
+
+def records(path):
+    """Yield each JSON record in a JSONL file, skipping blank and unparseable lines."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as exc:
+                logging.error("%s line %s is not valid JSON (%s); skipping", path, line_number, exc)
+
+
+def requests_for(cursor, path):
+    """Map each custom_id in the file to its request_ledger.Request.
+
+    custom_ids that can't be resolved are left out.
+    """
+    custom_ids = set()
+    for record in records(path):
+        custom_id = record.get("custom_id")
+        if custom_id is not None:
+            custom_ids.add(custom_id)
+    if len(custom_ids) == 0:
+        return {}
+    return request_ledger.resolve(cursor, custom_ids)
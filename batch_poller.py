@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""Check on all our outstanding OpenAI batches at once.
+
+retrieve_all() asks OpenAI about every batch concurrently, with at most
+`concurrency` requests in flight, instead of one after another. poll() does
+that for every unfinished batch in director_extract_batches and records a
+batchprogress snapshot for all of them in one insert.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import time
+
+import openai
+import psycopg2.extras
+
+DEFAULT_CONCURRENCY = 16
+
+# One unfinished batch, and what OpenAI said about it (None if it couldn't be retrieved)
+BatchStatus = collections.namedtuple(
+    "BatchStatus", ["local_batch_id", "openai_batch_id", "batch_kind", "number_of_requests", "openai_result"])
+
+FINISHED_STATUSES = ('completed', 'expired')
+
+
+async def retrieve_all_async(async_client, openai_batch_ids, concurrency=DEFAULT_CONCURRENCY):
+    """Map each OpenAI batch id to its Batch, or None if it couldn't be retrieved."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def retrieve(openai_batch_id):
+        async with semaphore:
+            try:
+                return await async_client.batches.retrieve(openai_batch_id)
+            except openai.OpenAIError as exc:
+                logging.error("Couldn't retrieve batch %s: %s", openai_batch_id, exc)
+                return None
+
+    results = await asyncio.gather(*(retrieve(openai_batch_id) for openai_batch_id in openai_batch_ids))
+    return dict(zip(openai_batch_ids, results))
+
+
+def retrieve_all(client, openai_batch_ids, concurrency=DEFAULT_CONCURRENCY):
+    """retrieve_all_async() for code that isn't async, using the key and base url of a (synchronous) client."""
+    async def run():
+        async with openai.AsyncOpenAI(api_key=client.api_key, base_url=client.base_url) as async_client:
+            return await retrieve_all_async(async_client, openai_batch_ids, concurrency)
+    if len(openai_batch_ids) == 0:
+        return {}
+    return asyncio.run(run())
+
+
+def outstanding_batches(cursor, kinds=None, only_batch=None):
+    """(local id, OpenAI id, kind, number of requests) of every batch sent but not yet retrieved."""
+    query = """
+        select director_extract_batches.id, openai_batch_id, batch_kind,
+               coalesce(request_count, count(openai_requests.id))
+          from director_extract_batches
+          left join openai_requests on (batch_id = director_extract_batches.id)
+         where when_sent is not null
+           and when_retrieved is null"""
+    params = []
+    if kinds is not None:
+        query += " and batch_kind = any(%s)"
+        params.append(list(kinds))
+    if only_batch is not None:
+        query += " and director_extract_batches.id = %s"
+        params.append(only_batch)
+    query += " group by director_extract_batches.id order by director_extract_batches.id"
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def record_progress(cursor, statuses):
+    """Add a batchprogress row for each batch OpenAI is working on or has finished, in one insert."""
+    rows = [(status.local_batch_id,
+             status.openai_result.request_counts.completed,
+             status.openai_result.request_counts.failed)
+            for status in statuses
+            if status.openai_result is not None
+            and status.openai_result.status in ('in_progress', 'completed')
+            and status.openai_result.request_counts is not None]
+    if len(rows) == 0:
+        return
+    psycopg2.extras.execute_values(
+        cursor,
+        "insert into batchprogress (batch_id, number_completed, number_failed) values %s",
+        rows)
+
+
+def poll(conn, client, kinds=None, only_batch=None, concurrency=DEFAULT_CONCURRENCY):
+    """Retrieve every outstanding batch concurrently and record their progress.
+
+    Returns a BatchStatus for each.
+    """
+    cursor = conn.cursor()
+    batches = outstanding_batches(cursor, kinds, only_batch)
+    results = retrieve_all(client, [openai_batch_id for _, openai_batch_id, _, _ in batches], concurrency)
+    statuses = [BatchStatus(local_batch_id, openai_batch_id, batch_kind, number_of_requests, results[openai_batch_id])
+                for local_batch_id, openai_batch_id, batch_kind, number_of_requests in batches]
+    record_progress(cursor, statuses)
+    conn.commit()
+    return statuses
+
+
+def print_report(client, status, show_error_file=True):
+    """Describe one batch the way batchcheck.py always has."""
+    openai_result = status.openai_result
+    if openai_result is None:
+        print(f"""## Batch {status.local_batch_id}
+       Batch ID: {status.openai_batch_id}
+         Status: could not be retrieved
+""")
+        return
+    print(f"""## {openai_result.metadata.get('description')}
+      Num files: {status.number_of_requests}
+       Local ID: {status.local_batch_id}
+       Returned: {openai_result.metadata.get('local_batch_id')}
+       Batch ID: {status.openai_batch_id}
+        Created: {time.asctime(time.localtime(openai_result.created_at))}
+         Status: {openai_result.status}""")
+
+    if openai_result.errors:
+        print("      Errors: ")
+        for err in openai_result.errors.data:
+            print(f"         - {err.code} on line {err.line}: {err.message}")
+
+    if show_error_file and openai_result.error_file_id:
+        try:
+            error_file_response = client.files.content(openai_result.error_file_id)
+        except openai.NotFoundError:
+            print(
+                f"      Error file {openai_result.error_file_id} was unavailable (likely expired)"
+            )
+        else:
+            print("      Error file contents:")
+            for line in error_file_response.text.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"         - {line}")
+                    continue
+
+                custom_id = record.get("custom_id")
+                status_code = record.get("status_code")
+                error = record.get("error")
+                if isinstance(error, dict):
+                    error_message = error.get("message") or json.dumps(error, ensure_ascii=False)
+                else:
+                    error_message = error
+                parts = ["         -"]
+                if custom_id is not None:
+                    parts.append(f"custom_id={custom_id}")
+                if status_code is not None:
+                    parts.append(f"status_code={status_code}")
+                if error_message:
+                    parts.append(f"error={error_message}")
+                additional = record.get("message")
+                if additional and additional != error_message:
+                    parts.append(f"message={additional}")
+                print(" ".join(parts))
+
+    if openai_result.request_counts:
+        print(f"       Progress: {openai_result.request_counts.completed}/{openai_result.request_counts.total}")
+        print(f"       Failures: {openai_result.request_counts.failed}")
+    print()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""Work out how many OpenAI batches to send, and what goes in each.
+
+OpenAI caps the number of prompt tokens an organisation can have enqueued
+across all of its unfinished batches, and the size of each batch file.
+ask_openai_bulk.py and extract_director_compensation.py ask a BatchPlanner
+where each filing's requests should go. The planner starts a new batch
+whenever the current one would exceed its token, byte or request limit,
+and stops taking filings once the enqueued-token budget is used up.
+
+The budget is the configured limit minus what is still queued from earlier
+batches, estimated from their latest batchprogress counts. The token target
+per batch is also capped by how fast recent batches were worked through,
+so that each batch should come back within target_turnaround_hours.
+
+Limits come from an optional [batch] section in db.conf:
+
+  [batch]
+  enqueued_token_limit=2000000
+  max_batch_tokens=1000000
+  max_batch_bytes=190000000
+  target_turnaround_hours=12
+  max_batches=10
+"""
+
+import collections
+import configparser
+import statistics
+
+DEFAULT_ENQUEUED_TOKEN_LIMIT = 2000000
+DEFAULT_MAX_BATCH_TOKENS = 1000000
+# OpenAI rejects batch files over 200MB or 50,000 requests
+DEFAULT_MAX_BATCH_BYTES = 190 * 1000 * 1000
+MAX_BATCH_REQUESTS = 50000
+DEFAULT_TARGET_TURNAROUND_HOURS = 12
+DEFAULT_MAX_BATCHES = 10
+# Our token counts are estimates, so don't plan right up to the limit
+SAFETY_MARGIN = 0.9
+
+BatchLimits = collections.namedtuple(
+    "BatchLimits",
+    ["enqueued_token_limit", "max_batch_tokens", "max_batch_bytes", "target_turnaround_hours", "max_batches"])
+
+
+def limits_from_config(config_filename, **overrides):
+    """BatchLimits from the [batch] section of db.conf. Overrides that are not None take precedence."""
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    section = config["batch"] if config.has_section("batch") else {}
+    limits = BatchLimits(
+        enqueued_token_limit=int(section.get("enqueued_token_limit", DEFAULT_ENQUEUED_TOKEN_LIMIT)),
+        max_batch_tokens=int(section.get("max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS)),
+        max_batch_bytes=int(section.get("max_batch_bytes", DEFAULT_MAX_BATCH_BYTES)),
+        target_turnaround_hours=float(section.get("target_turnaround_hours", DEFAULT_TARGET_TURNAROUND_HOURS)),
+        max_batches=int(section.get("max_batches", DEFAULT_MAX_BATCHES)),
+    )
+    return limits._replace(**{k: v for k, v in overrides.items() if v is not None})
+
+
+def enqueued_tokens(cursor):
+    """Estimated prompt tokens still waiting at OpenAI in batches we have sent.
+
+    Each unfinished batch counts for the fraction of its requests that its
+    latest batchprogress row doesn't show as done. Batches sent before
+    estimated_tokens was recorded aren't counted.
+    """
+    cursor.execute("""
+      select coalesce(sum(b.estimated_tokens *
+                          greatest(0, 1 - coalesce(p.done, 0)::float / greatest(b.request_count, 1))), 0)
+        from director_extract_batches b
+        left join lateral (select number_completed + number_failed as done
+                             from batchprogress
+                            where batchprogress.batch_id = b.id
+                         order by when_checked desc
+                            limit 1) p on true
+       where b.when_sent is not null
+         and b.when_retrieved is null
+         and b.estimated_tokens is not null""")
+    return int(cursor.fetchone()[0])
+
+
+def tokens_per_hour(cursor, recent_batches=20):
+    """Median rate recent batches were worked through, or None if there's no history.
+
+    A batch's turnaround is from when it was sent to the first batchprogress
+    check that found every request done, so it is only as precise as
+    batchcheck.py is frequent.
+    """
+    cursor.execute("""
+      select b.estimated_tokens, extract(epoch from min(p.when_checked) - b.when_sent)
+        from director_extract_batches b
+        join batchprogress p on (p.batch_id = b.id)
+       where b.estimated_tokens is not null
+         and b.request_count > 0
+         and p.number_completed + p.number_failed >= b.request_count
+    group by b.id, b.estimated_tokens, b.when_sent
+    order by b.when_sent desc
+       limit %s""", [recent_batches])
+    rates = [tokens * 3600.0 / seconds for tokens, seconds in cursor.fetchall() if seconds and seconds > 0]
+    if len(rates) == 0:
+        return None
+    return statistics.median(rates)
+
+
+class BatchPlanner:
+    """Decides which batch each filing's requests go into.
+
+    place() returns the index of the batch to use (a new one whenever the
+    index equals the number of batches so far), or None once there is no
+    room left for this run.
+    """
+
+    def __init__(self, budget_tokens, batch_tokens, batch_bytes, max_batches, batch_requests=MAX_BATCH_REQUESTS):
+        self.budget_tokens = budget_tokens
+        self.batch_tokens = batch_tokens
+        self.batch_bytes = batch_bytes
+        self.max_batches = max_batches
+        self.batch_requests = batch_requests
+        self.total_tokens = 0
+        # [tokens, bytes, requests] for each batch
+        self.batches = []
+
+    def place(self, tokens, size, requests=1):
+        if self.total_tokens + tokens > self.budget_tokens:
+            return None
+        if self.batches:
+            current = self.batches[-1]
+            if (current[0] + tokens <= self.batch_tokens and
+                    current[1] + size <= self.batch_bytes and
+                    current[2] + requests <= self.batch_requests):
+                current[0] += tokens
+                current[1] += size
+                current[2] += requests
+                self.total_tokens += tokens
+                return len(self.batches) - 1
+        if len(self.batches) >= self.max_batches:
+            return None
+        # A filing bigger than a whole batch still gets a batch to itself
+        self.batches.append([tokens, size, requests])
+        self.total_tokens += tokens
+        return len(self.batches) - 1
+
+
+def planner_for(cursor, limits):
+    """A BatchPlanner for this run, given what is already queued and how fast batches have been going."""
+    budget = int(limits.enqueued_token_limit * SAFETY_MARGIN) - enqueued_tokens(cursor)
+    batch_tokens = limits.max_batch_tokens
+    rate = tokens_per_hour(cursor)
+    if rate is not None:
+        batch_tokens = min(batch_tokens, int(rate * limits.target_turnaround_hours))
+    return BatchPlanner(max(0, budget), max(1, batch_tokens), limits.max_batch_bytes, limits.max_batches)
@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 
+"""Report on outstanding OpenAI batches, and record their progress.
+
+Every outstanding batch is retrieved concurrently (see batch_poller.py).
+Exits 0 if any batch has completed, and NO_WORK_EXIT_CODE otherwise.
+
+--monitor keeps polling until a batch completes. --daemon keeps polling
+forever, and ingests each batch (as batch_jobs.py --fetch would) as soon
+as it is seen to have finished.
+"""
+
 import argparse
-import json
+import logging
 import sys
 import openai
 import openai_key
 import pgconnect
 import time
 
+import batch_engine
+import batch_kinds
+import batch_poller
+
 NO_WORK_EXIT_CODE = 3
 
 parser = argparse.ArgumentParser()
@@ -16,124 +30,85 @@ parser.add_argument("--database-config",
                     help="Parameters to connect to the database")
 parser.add_argument("--openai-api-key", default=openai_key.DEFAULT_OPENAI_KEY_FILE)
 parser.add_argument("--only-batch", type=int, help="The batch ID to look at")
-parser.add_argument("--monitor", action="store_true", help="Monitor in a loop until the status is 'completed'. Only makes sense with --only-batch")
+parser.add_argument("--kind",
+                    action="append",
+                    choices=sorted(batch_kinds.KINDS),
+                    help="Only look at this kind of batch (can be given more than once; default: all of them)")
+parser.add_argument("--monitor", action="store_true", help="Monitor in a loop until a batch's status is 'completed'")
+parser.add_argument("--daemon", action="store_true", help="Run forever, ingesting batches as soon as they finish")
+parser.add_argument("--interval", type=float, default=15,
+                    help="Seconds between polls with --monitor or --daemon")
+parser.add_argument("--concurrency", type=int, default=batch_poller.DEFAULT_CONCURRENCY,
+                    help="How many batches to ask OpenAI about at once")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
 args = parser.parse_args()
 
+logging.basicConfig(
+    format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+    level=logging.INFO if args.verbose or args.daemon else logging.WARNING,
+    datefmt='%Y-%m-%d %H:%M:%S')
+
 api_key = openai_key.load_openai_api_key(args.openai_api_key)
 client = openai.OpenAI(api_key=api_key)
 
 
 conn = pgconnect.connect(args.database_config)
-cursor = conn.cursor()
-update_cursor = conn.cursor()
 
+kinds = [batch_kinds.KINDS[name] for name in (args.kind or batch_kinds.KINDS)]
+kind_names = [kind.name for kind in kinds]
 
-# Updated query to count files instead of words
-query = """
-    select director_extract_batches.id, openai_batch_id, count(url) 
-    from director_extract_batches 
-    join director_extractions on (batch_id = director_extract_batches.id) 
-    where when_sent is not null 
-    and when_retrieved is null 
-"""
 
-if args.only_batch:
-    query += f"and director_extract_batches.id = {int(args.only_batch)} "
-query += "group by director_extract_batches.id, openai_batch_id"
+def poll():
+    return batch_poller.poll(conn, client, kinds=kind_names, only_batch=args.only_batch,
+                             concurrency=args.concurrency)
+
+
+def has_completed(statuses):
+    return any(status.openai_result is not None and status.openai_result.status == 'completed'
+               for status in statuses)
+
+
+if args.daemon:
+    while True:
+        try:
+            statuses = poll()
+            finished = [status for status in statuses
+                        if status.openai_result is not None
+                        and status.openai_result.status in batch_poller.FINISHED_STATUSES]
+            logging.info(f"{len(statuses)} batches outstanding, {len(finished)} finished")
+            if finished:
+                usage, failures = batch_engine.fetch(conn, client, kinds, finished)
+                logging.info(f"Ingested {len(finished) - failures} batches using {usage.prompt_tokens} prompt "
+                             f"({usage.cached_tokens} cached) and {usage.completion_tokens} completion tokens")
+        except Exception:
+            conn.rollback()
+            logging.exception("Polling failed; trying again next time")
+        time.sleep(args.interval)
 
 if args.monitor:
     import tqdm
-    progress = None
-
-while True:
-    cursor.execute(query)
-    work_to_be_done = False
-
-    for local_batch_id, openai_batch_id, number_of_files in cursor:
-        openai_result = client.batches.retrieve(openai_batch_id)
-        if openai_result.status == 'completed':
-            work_to_be_done = True
-        
-        if openai_result.status in ['in_progress', 'completed']:
-            update_cursor.execute(
-                "insert into batchprogress (batch_id, number_completed, number_failed) values (%s,%s,%s)",
-                [local_batch_id, openai_result.request_counts.completed, openai_result.request_counts.failed]
-            )
-            conn.commit()
-        
-        if args.monitor:
-            if progress is None:
-                progress = tqdm.tqdm(total=number_of_files)
-            progress.set_description(openai_result.status)
-            if openai_result.status in ['in_progress', 'completed']:
-                progress.update(openai_result.request_counts.completed - progress.n)
-            if openai_result.status == 'completed':
-                break
-            time.sleep(15)
-            continue
-        
-        print(f"""## {openai_result.metadata.get('description')}
-      Num files: {number_of_files}
-       Local ID: {local_batch_id}
-       Returned: {openai_result.metadata.get('local_batch_id')}
-       Batch ID: {openai_batch_id}
-        Created: {time.asctime(time.localtime(openai_result.created_at))}
-         Status: {openai_result.status}""")
-        
-        if openai_result.errors:
-            print("      Errors: ")
-            for err in openai_result.errors.data:
-                print(f"         - {err.code} on line {err.line}: {err.message}")
-
-        if openai_result.error_file_id:
-            try:
-                error_file_response = client.files.content(openai_result.error_file_id)
-            except openai.NotFoundError:
-                print(
-                    f"      Error file {openai_result.error_file_id} was unavailable (likely expired)"
-                )
-            else:
-                print("      Error file contents:")
-                for line in error_file_response.text.splitlines():
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        record = json.loads(line)
-                    except json.JSONDecodeError:
-                        print(f"         - {line}")
-                        continue
-
-                    custom_id = record.get("custom_id")
-                    status_code = record.get("status_code")
-                    error = record.get("error")
-                    if isinstance(error, dict):
-                        error_message = error.get("message") or json.dumps(error, ensure_ascii=False)
-                    else:
-                        error_message = error
-                    parts = ["         -"]
-                    if custom_id is not None:
-                        parts.append(f"custom_id={custom_id}")
-                    if status_code is not None:
-                        parts.append(f"status_code={status_code}")
-                    if error_message:
-                        parts.append(f"error={error_message}")
-                    additional = record.get("message")
-                    if additional and additional != error_message:
-                        parts.append(f"message={additional}")
-                    print(" ".join(parts))
-        
-        if openai_result.request_counts:
-            print(f"       Progress: {openai_result.request_counts.completed}/{openai_result.request_counts.total}")
-            print(f"       Failures: {openai_result.request_counts.failed}")
-        print()
-
-    if not args.monitor:
-        break
-    if work_to_be_done:
-        break
-
-if work_to_be_done:
+    progress = tqdm.tqdm()
+    while True:
+        statuses = poll()
+        progress.total = sum(status.number_of_requests or 0 for status in statuses)
+        progress.set_description(", ".join(sorted({status.openai_result.status for status in statuses
+                                                   if status.openai_result is not None})))
+        progress.update(sum(status.openai_result.request_counts.completed
+                            for status in statuses
+                            if status.openai_result is not None and status.openai_result.request_counts)
+                        - progress.n)
+        if has_completed(statuses) or len(statuses) == 0:
+            break
+        time.sleep(args.interval)
+    progress.close()
+else:
+    statuses = poll()
+    for status in statuses:
+        batch_poller.print_report(client, status)
+
+if has_completed(statuses):
     sys.exit(0)
 else:
     sys.exit(NO_WORK_EXIT_CODE)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Compare filing_text.clean_html() with fast_clean_html() on real filings.
+
+  benchmark_filing_text.py --stop-after 200
+  benchmark_filing_text.py tests/fixtures/filings/*.htm
+
+Each document is cleaned by both, timed, and the outputs compared, so this
+doubles as a check that the fast cleaner still agrees with the reference
+one on stored filings. Exits non-zero if any document differs."""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("files",
+                    nargs="*",
+                    help="HTML files to use instead of documents from the database")
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--form",
+                    default="DEF 14A",
+                    help="Which form's documents to benchmark on")
+parser.add_argument("--stop-after",
+                    type=int,
+                    default=100,
+                    help="How many documents from the database to use")
+parser.add_argument("--show-each",
+                    action="store_true",
+                    help="Print the timings for every document")
+args = parser.parse_args()
+
+import statistics
+import sys
+import time
+import warnings
+
+from bs4 import XMLParsedAsHTMLWarning
+
+import filing_text
+
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+
+def documents():
+    if args.files:
+        for filename in args.files:
+            with open(filename, encoding="utf-8", errors="replace") as f:
+                yield filename, f.read()
+        return
+    import doc_store
+    import pgconnect
+    store = doc_store.from_config(args.database_config)
+    conn = pgconnect.connect(args.database_config)
+    cursor = conn.cursor()
+    cursor.execute("""
+      select url, content, codec, content_sha256, encoding
+        from html_doc_cache
+       where content_type = 'text/html'
+         and exists (select 1 from filings
+                      where filings.document_storage_url = html_doc_cache.url
+                        and filings.form = %s)
+       limit %s""", [args.form, args.stop_after])
+    for url, content, codec, content_sha256, encoding in cursor.fetchall():
+        raw = store.decode(content, codec, content_sha256)
+        if raw is None:
+            continue
+        yield url, bytes(raw).decode(encoding or 'utf-8', errors='replace')
+
+
+def timed(function, raw_html):
+    started = time.perf_counter()
+    result = function(raw_html)
+    return result, time.perf_counter() - started
+
+
+reference_times = []
+fast_times = []
+mismatches = []
+for name, raw_html in documents():
+    expected, reference_time = timed(filing_text.clean_html, raw_html)
+    actual, fast_time = timed(filing_text.fast_clean_html, raw_html)
+    reference_times.append(reference_time)
+    fast_times.append(fast_time)
+    if actual != expected:
+        mismatches.append(name)
+    if args.show_each:
+        print(f"{reference_time * 1000:9.1f}ms {fast_time * 1000:9.1f}ms {len(raw_html):>10} chars  {name}")
+
+if len(fast_times) == 0:
+    sys.exit("No documents to benchmark")
+
+print(f"{len(fast_times)} documents")
+for label, times in [("clean_html", reference_times), ("fast_clean_html", fast_times)]:
+    print(f"{label:>16}: mean {statistics.mean(times) * 1000:.1f}ms, "
+          f"median {statistics.median(times) * 1000:.1f}ms, "
+          f"max {max(times) * 1000:.1f}ms per document")
+print(f"Speed-up: {sum(reference_times) / sum(fast_times):.1f}x")
+if mismatches:
+    print(f"{len(mismatches)} documents cleaned differently:")
+    for name in mismatches:
+        print(f"  {name}")
+    sys.exit(1)
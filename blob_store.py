@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""A content-addressed store of fetched filings on local disk.
+
+Each blob is saved under its sha256, sharded two levels deep
+(``ab/cd/abcd...``) so no directory gets too large. Blobs are written
+to a temporary file and renamed into place, so a reader never sees a
+partial file, and identical documents are only stored once."""
+
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+
+
+class BlobNotFoundError(FileNotFoundError):
+    pass
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[0:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put(self, data):
+        """Store ``data`` and return its sha256 hex digest."""
+        digest = content_hash(data)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return digest
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temporary_path)
+            raise
+        return digest
+
+    @contextlib.contextmanager
+    def map(self, digest):
+        """Memory-map a blob read-only.
+
+        The mmap supports the buffer protocol, so it can be handed to
+        anything that accepts bytes-like objects without copying.
+        """
+        path = self.path_for(digest)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError as exc:
+            raise BlobNotFoundError(f"No blob {digest} in {self.root}") from exc
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap refuses zero-length files
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def get(self, digest):
+        with self.map(digest) as mapped:
+            return bytes(mapped)
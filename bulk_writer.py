@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""Write many rows with a few multi-row inserts instead of one round trip each.
+
+    writer = bulk_writer.BulkWriter(write_cursor)
+    for ...:
+        writer.add("insert into document_headings (cikcode, accessionNumber, heading_level) values %s",
+                   (cikcode, accession_number, level))
+    writer.flush()
+    conn.commit()
+
+Rows are queued per insert statement (which must have a single `values %s`),
+and flush() writes each statement's rows with psycopg2's execute_values, in
+the order the statements were first added, so a parent table's rows go in
+before its children's.
+"""
+
+import psycopg2.extras
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+class BulkWriter:
+    def __init__(self, cursor, page_size=DEFAULT_PAGE_SIZE):
+        self.cursor = cursor
+        self.page_size = page_size
+        self.rows = {}
+
+    def add(self, query, row):
+        self.rows.setdefault(query, []).append(row)
+
+    def extend(self, query, rows):
+        self.rows.setdefault(query, []).extend(rows)
+
+    def pending(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+    def flush(self):
+        for query, rows in self.rows.items():
+            if len(rows) > 0:
+                psycopg2.extras.execute_values(self.cursor, query, rows, page_size=self.page_size)
+        self.rows = {}
+
+
+def insert_returning(cursor, query, rows, page_size=DEFAULT_PAGE_SIZE):
+    """Insert rows with one execute_values and return what the query's RETURNING clause gives.
+
+    There is one returned row per inserted row, but Postgres doesn't promise
+    to return them in the order of the VALUES list. To match them up, return
+    a column that identifies each inserted row along with the id.
+    """
+    if len(rows) == 0:
+        return []
+    return psycopg2.extras.execute_values(cursor, query, rows, page_size=page_size, fetch=True)
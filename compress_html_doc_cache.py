@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Compress html_doc_cache rows that were stored before compression existed.
+
+Works through the table in url order, a bounded number of bytes at a time,
+committing after each chunk so it can be interrupted and restarted."""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--codec",
+                    help="Which codec to use (default: [storage] codec in the config, or gzip)")
+parser.add_argument("--rows-per-scan",
+                    type=int,
+                    default=1000,
+                    help="How many urls to look at per index scan")
+parser.add_argument("--max-chunk-bytes",
+                    type=int,
+                    default=64 * 1024 * 1024,
+                    help="Upper bound on uncompressed bytes held in memory and written per transaction")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Stop after compressing this many documents")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+args = parser.parse_args()
+
+import logging
+import sys
+
+import doc_store
+import pgconnect
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+
+store = doc_store.from_config(args.database_config)
+codec = args.codec if args.codec is not None else store.codec
+if codec is None:
+    sys.exit("No codec configured; nothing to do")
+
+conn = pgconnect.connect(args.database_config)
+read_cursor = conn.cursor()
+write_cursor = conn.cursor()
+
+read_cursor.execute("select count(*), coalesce(sum(octet_length(content)), 0) from html_doc_cache where codec is null and content is not null")
+remaining_rows, remaining_bytes = read_cursor.fetchone()
+logging.info(f"{remaining_rows} documents ({remaining_bytes} bytes) are uncompressed")
+
+if args.progress:
+    import tqdm
+    progress = tqdm.tqdm(total=remaining_bytes, unit='B', unit_scale=True)
+
+
+def compress_chunk(urls):
+    read_cursor.execute("select url, content from html_doc_cache where url = any(%s) and codec is null",
+                        [urls])
+    bytes_before = 0
+    bytes_after = 0
+    for url, content in read_cursor.fetchall():
+        compressed = doc_store.compress(bytes(content), codec)
+        write_cursor.execute("update html_doc_cache set content = %s, codec = %s where url = %s",
+                             [compressed, codec, url])
+        bytes_before += len(content)
+        bytes_after += len(compressed)
+    conn.commit()
+    return bytes_before, bytes_after
+
+
+last_url = ''
+documents_done = 0
+total_before = 0
+total_after = 0
+finished = False
+while not finished:
+    read_cursor.execute("""
+      select url, octet_length(content)
+        from html_doc_cache
+       where codec is null
+         and content is not null
+         and url > %s
+    order by url
+       limit %s""", [last_url, args.rows_per_scan])
+    page = read_cursor.fetchall()
+    if len(page) == 0:
+        break
+    last_url = page[-1][0]
+
+    chunk = []
+    chunk_bytes = 0
+    for url, size in page:
+        if args.stop_after is not None and documents_done + len(chunk) >= args.stop_after:
+            finished = True
+            break
+        if chunk and chunk_bytes + size > args.max_chunk_bytes:
+            before, after = compress_chunk(chunk)
+            documents_done += len(chunk)
+            total_before += before
+            total_after += after
+            if args.progress:
+                progress.update(before)
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(url)
+        chunk_bytes += size
+    if chunk:
+        before, after = compress_chunk(chunk)
+        documents_done += len(chunk)
+        total_before += before
+        total_after += after
+        if args.progress:
+            progress.update(before)
+    logging.info(f"Compressed {documents_done} documents so far, up to {last_url}")
+
+if args.progress:
+    progress.close()
+
+ratio = total_before / total_after if total_after else 0
+print(f"Compressed {documents_done} documents from {total_before} to {total_after} bytes ({ratio:.1f}x) with {codec}")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""Score every table in filing_tables for how much it looks like a board skills matrix.
+
+Features (see skills_matrix.py) are computed once per table, in a process
+pool, using the directors already extracted for the filing
+(director_mentions), and stored in filing_table_features with the score.
+Tables are scored again once the directors known for their filing change,
+e.g. when director_mentions is refreshed after the batch extraction.
+
+--list prints the likely skills matrices of each filing, best first,
+instead of scoring anything:
+
+    detect_skills_matrices.py --list --cikcode 1800
+"""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Don't try to score every table. Stop after this number (with --list, show at most this many)")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many processes to score tables with (default: one per CPU)")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=500,
+                    help="How many tables to score per transaction")
+parser.add_argument("--list",
+                    action="store_true",
+                    help="Show the likely skills matrices instead of scoring tables")
+parser.add_argument("--cikcode",
+                    type=int,
+                    help="With --list, only this company's filings")
+parser.add_argument("--accession-number",
+                    help="With --list, only this filing")
+parser.add_argument("--min-score",
+                    type=float,
+                    default=0.5,
+                    help="With --list, only tables scoring at least this")
+args = parser.parse_args()
+
+import bulk_writer
+import collections
+import logging
+import pgconnect
+import skills_matrix
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+
+
+def score(work):
+    """Runs in a worker process. Returns (table id, Features, score)."""
+    table_id, html, surnames = work
+    features = skills_matrix.features(html, surnames)
+    return table_id, features, skills_matrix.score(features)
+
+
+def director_surnames(cursor, filings):
+    """{(cikcode, accession number): [surname, ...]} for each of filings, from director_mentions."""
+    cursor.execute("""select cikcode, accessionnumber, director_name
+                        from director_mentions
+                       where (cikcode, accessionnumber) in (select * from unnest(%s::int[], %s::varchar[]))""",
+                   [[cikcode for cikcode, accession_number in filings],
+                    [accession_number for cikcode, accession_number in filings]])
+    surnames = collections.defaultdict(list)
+    for cikcode, accession_number, director_name in cursor.fetchall():
+        name = skills_matrix.surname(director_name or "")
+        if name is not None:
+            surnames[(cikcode, accession_number)].append(name)
+    return surnames
+
+
+if __name__ == '__main__':
+    conn = pgconnect.connect(args.database_config)
+
+    if args.list:
+        for cikcode, accession_number, table_id, table_number, table_score, rank in skills_matrix.ranked(
+                conn.cursor(), args.cikcode, args.accession_number, args.min_score, args.stop_after):
+            print(f"{cikcode} {accession_number} #{rank}: table {table_number} (table_id {table_id}) scores {table_score:.2f}")
+        sys.exit(0)
+
+    # Committing on the connection the cursor is reading from would close it
+    write_conn = pgconnect.connect(args.database_config)
+    lookup_cursor = conn.cursor()
+    read_cursor = conn.cursor(name="tables_needing_features")
+    read_cursor.itersize = args.rows_per_chunk
+    writer = bulk_writer.BulkWriter(write_conn.cursor())
+
+    skills_matrix.select_tables_needing_features(read_cursor, args.stop_after)
+
+    if args.progress:
+        import tqdm
+        progress = tqdm.tqdm(total=args.stop_after)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            chunk = read_cursor.fetchmany(args.rows_per_chunk)
+            if len(chunk) == 0:
+                break
+            surnames = director_surnames(lookup_cursor, list({(row[1], row[2]) for row in chunk}))
+            work = [(table_id, html, surnames.get((cikcode, accession_number), []))
+                    for table_id, cikcode, accession_number, table_number, html, names_hash in chunk]
+            filing_of = {table_id: (cikcode, accession_number, table_number, names_hash)
+                         for table_id, cikcode, accession_number, table_number, html, names_hash in chunk}
+            for table_id, features, table_score in pool.map(score, work, chunksize=16):
+                writer.add("""insert into filing_table_features (table_id, cikcode, accessionNumber, table_number,
+                                     director_names_hash, feature_version, row_count, column_count, orientation, header_index,
+                                     surname_hits, marker_cells, image_cells, repeated_marker_cells,
+                                     blank_cells, body_cells, score)
+                              values %s
+                              on conflict (table_id) do update set
+                                     director_names_hash = excluded.director_names_hash,
+                                     feature_version = excluded.feature_version, row_count = excluded.row_count,
+                                     column_count = excluded.column_count, orientation = excluded.orientation,
+                                     header_index = excluded.header_index, surname_hits = excluded.surname_hits,
+                                     marker_cells = excluded.marker_cells, image_cells = excluded.image_cells,
+                                     repeated_marker_cells = excluded.repeated_marker_cells,
+                                     blank_cells = excluded.blank_cells, body_cells = excluded.body_cells,
+                                     score = excluded.score""",
+                           (table_id, *filing_of[table_id], skills_matrix.FEATURE_VERSION, *features, table_score))
+            writer.flush()
+            write_conn.commit()
+            logging.info(f"Scored {len(chunk)} tables, up to table_id {chunk[-1][0]}")
+            if args.progress:
+                progress.update(len(chunk))
+
+    if args.progress:
+        progress.close()
+    read_cursor.close()
+    conn.commit()
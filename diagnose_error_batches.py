@@ -6,6 +6,7 @@ import sys
 import openai
 import openai_key
 import pgconnect
+import request_ledger
 
 parser = argparse.ArgumentParser(description="Diagnose batches with errors and provide detailed information")
 parser.add_argument("--database-config",
@@ -47,7 +48,25 @@ def parse_error_record(error_json_str):
         return None
 
 def find_batch_for_url(url):
-    """Find batch information for a given URL"""
+    """Find batch information for a given URL, or a custom_id from the openai_requests ledger"""
+    if request_ledger.is_ledger_id(url):
+        cursor.execute("""
+            SELECT r.batch_id, deb.openai_batch_id, deb.when_sent, deb.when_retrieved, r.url, r.prompt_kind
+            FROM openai_requests r
+            JOIN director_extract_batches deb ON r.batch_id = deb.id
+            WHERE r.id = %s
+        """, [int(url)])
+        result = cursor.fetchone()
+        if result:
+            return {
+                'batch_id': result[0],
+                'openai_batch_id': result[1],
+                'when_sent': result[2],
+                'when_retrieved': result[3],
+                'source_table': f'openai_requests ({result[5]} of {result[4]})'
+            }
+        return None
+
     # Try director_extractions first (old table)
     cursor.execute("""
         SELECT de.batch_id, deb.openai_batch_id, deb.when_sent, deb.when_retrieved
@@ -1,29 +1,37 @@
-from html_table_extractor.extractor import Extractor
+import collections
+import table_cells
+
 class DirectorInformationTable:
     def __init__(self, html_content, orientation, director_surnames):
-        extraction = Extractor(html_content)
-        extraction.parse()
-        extraction_list = extraction.return_list()
-        self.initialize_cell_structure(extraction_list, orientation)
+        self.initialize(table_cells.grid(html_content), orientation, director_surnames)
+
+    @classmethod
+    def from_cells(cls, cells, orientation, director_surnames):
+        """Build from (row, column, text) cells, as stored in filing_table_cells, without parsing any HTML."""
+        table = cls.__new__(cls)
+        table.initialize(cells, orientation, director_surnames)
+        return table
+
+    def initialize(self, cells, orientation, director_surnames):
+        self.initialize_cell_structure(cells, orientation)
         uppercase_surnames = [x.upper() for x in director_surnames]
         self.find_header_where_the_directors_are(uppercase_surnames)
         self.find_director_column_numbers(uppercase_surnames)
         self.find_index_for_content()
 
-    def initialize_cell_structure(self, extraction_list, orientation):
+    def initialize_cell_structure(self, cells, orientation):
         self.cells = {}
         self.row_numbers = set()
         self.column_numbers = set()
-        for x,c in enumerate(extraction_list):
-            for y,d in enumerate(c):
-                if orientation == 'row':
-                    self.cells[(x,y)] = d
-                    self.row_numbers.update([x])
-                    self.column_numbers.update([y])
-                else:
-                    self.cells[(y,x)] = d
-                    self.row_numbers.update([y])
-                    self.column_numbers.update([x])
+        for x,y,d in cells:
+            if orientation == 'row':
+                self.cells[(x,y)] = d
+                self.row_numbers.update([x])
+                self.column_numbers.update([y])
+            else:
+                self.cells[(y,x)] = d
+                self.row_numbers.update([y])
+                self.column_numbers.update([x])
 
     def find_header_where_the_directors_are(self, uppercase_surnames):
         x_count = {}
@@ -121,37 +129,75 @@ class DirectorInformationTable:
                     pass
         return distinct_values, len(distinct_values)-1
 
+    def row_values(self):
+        """The distinct director values in each row"""
+        values = collections.defaultdict(set)
+        for director, y in self.director_column_numbers.items():
+            for x in self.row_numbers:
+                if (x, y) in self.cells:
+                    values[x].add(self.cells[(x, y)])
+        return values
+
     def raw_regions_with_few_values(self, min_size=3):
-        for r1 in self.row_numbers:
-            for r2 in self.row_numbers:
-                if r1 > r2:
+        # Growing a region downwards can only add values, so the set of values
+        # in rows r1..r2 is built up from r1..r2-1's, and once it has more than
+        # two values no longer region starting at r1 can qualify
+        row_values = self.row_values()
+        rows = sorted(self.row_numbers)
+        for r1 in rows:
+            distinct_values = set([""])
+            for r2 in range(r1, rows[-1]+1):
+                distinct_values.update(row_values.get(r2, ()))
+                value_count = len(distinct_values)-1
+                if value_count > 2:
+                    break
+                if r1 + min_size > r2 or r2 not in self.row_numbers:
                     continue
-                if r1 + min_size > r2:
-                    continue
-                distinct_values, value_count = self.get_range_diversity(r1,r2)
-                if value_count > 0 and value_count <= 2:
-                    yield (r1,r2, [self.content_index.get(x) for x in range(r1,r2+1)], value_count, distinct_values)
-
-    def regions_with_few_values(self, min_size=3):                    
-        raw_answers= list(self.raw_regions_with_few_values(min_size))
-        kill_list = set()
-        for z1 in raw_answers:
-            r1 = z1[0]
-            r2 = z1[1]
-            for z2 in raw_answers:
-                q1 = z2[0]
-                q2 = z2[1]
-                if q1 == r1 and q2 == r2:
-                    continue
-                if q1 >= r1 and q2 <= r2:
-                    # Then it is subsumed by the r1,r2
-                    kill_list.update([(q1,q2)])
-        for answer in raw_answers:
-            r1 = answer[0]
-            r2 = answer[1]
-            if (r1,r2) in kill_list:
+                if value_count > 0:
+                    yield (r1,r2, [self.content_index.get(x) for x in range(r1,r2+1)], value_count, set(distinct_values))
+
+    def longest_regions_with_few_values(self, min_size=3):
+        """(r1, r2, value count, values) for the longest region with few values starting at each row"""
+        # The furthest row a region can reach never moves back as its start
+        # moves down, so slide a window over the rows, counting how many rows
+        # in it have each value, instead of trying every end row
+        row_values = self.row_values()
+        rows = sorted(self.row_numbers)
+        counts = {}
+        end = 0
+        for start, r1 in enumerate(rows):
+            end = max(end, start)
+            while end < len(rows):
+                added = [value for value in row_values.get(rows[end], ()) if value != ""]
+                for value in added:
+                    counts[value] = counts.get(value, 0) + 1
+                if len(counts) > 2:
+                    self._forget_values(counts, added)
+                    break
+                end += 1
+            if end == start:
+                # This row has more than two values on its own
                 continue
-            yield answer
+            r2 = rows[end-1]
+            if r1 + min_size <= r2 and len(counts) > 0:
+                yield (r1, r2, len(counts), set(counts) | {""})
+            self._forget_values(counts, [value for value in row_values.get(r1, ()) if value != ""])
+
+    @staticmethod
+    def _forget_values(counts, values):
+        for value in values:
+            counts[value] -= 1
+            if counts[value] == 0:
+                del counts[value]
+
+    def regions_with_few_values(self, min_size=3):
+        # Only the longest region starting at each row can survive, and then
+        # only if no region starting earlier ends as late
+        furthest_end_before = None
+        for r1, r2, value_count, distinct_values in self.longest_regions_with_few_values(min_size):
+            if furthest_end_before is None or furthest_end_before < r2:
+                yield (r1,r2, [self.content_index.get(x) for x in range(r1,r2+1)], value_count, distinct_values)
+            furthest_end_before = r2 if furthest_end_before is None else max(furthest_end_before, r2)
 
     def __getitem__(self, pos):
         return self.cells[pos]
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""Read and write fetched filings in html_doc_cache.
+
+Documents are stored compressed; html_doc_cache.codec says how. Rows with
+no codec predate compression and hold the raw bytes. Alternatively the
+bytes can live in a BlobStore on local disk, in which case content is null
+and content_sha256 names the blob. Everything that reads or writes
+html_doc_cache.content should go through a DocumentStore so that both
+cases are handled consistently."""
+
+import configparser
+import gzip
+
+import blob_store
+import filing_text
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional
+    zstandard = None
+
+DEFAULT_CODEC = "gzip"
+CODECS = ["gzip", "zstd"]
+BACKENDS = ["postgres", "blobstore"]
+
+
+class UnknownCodecError(ValueError):
+    pass
+
+
+def compress(raw, codec):
+    if codec is None:
+        return bytes(raw)
+    if codec == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    if codec == "zstd":
+        if zstandard is None:
+            raise UnknownCodecError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=9).compress(raw)
+    raise UnknownCodecError(f"Unknown codec {codec!r}")
+
+
+def decompress(stored, codec):
+    stored = bytes(stored)
+    if codec is None:
+        return stored
+    if codec == "gzip":
+        return gzip.decompress(stored)
+    if codec == "zstd":
+        if zstandard is None:
+            raise UnknownCodecError("zstd decompression needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(stored)
+    raise UnknownCodecError(f"Unknown codec {codec!r}")
+
+
+# What each later stage made from a filing's document, children before
+# parents. Each stage treats a filing with rows here as done, so replace()
+# deletes them and the stages pick the new version up on their next run.
+_FILING = "(cikcode, accessionnumber) in (select cikcode, accessionnumber from filings where document_storage_url = %s)"
+_SENTENCES = f"sentence_id in (select sentence_id from sentences where {_FILING})"
+_TABLES = f"table_id in (select table_id from filing_tables where {_FILING})"
+STAGE_OUTPUTS = [
+    # extract_tables.py, extract_table_cells.py, detect_skills_matrices.py
+    f"delete from filing_table_features where {_TABLES}",
+    f"delete from filing_table_cells where {_TABLES}",
+    f"delete from filing_table_grids where {_TABLES}",
+    f"delete from filing_tables where {_FILING}",
+    f"delete from filings_with_no_tables where {_FILING}",
+    # grammar_parse.py
+    f"delete from named_entities where {_SENTENCES}",
+    f"delete from noun_chunks where {_SENTENCES}",
+    f"delete from pronouns where {_SENTENCES}",
+    f"delete from sentences where {_FILING}",
+    f"delete from spacy_parses where {_FILING}",
+    # every_textual.py
+    f"delete from document_text_positions where {_FILING}",
+    f"delete from document_headings where {_FILING}",
+    f"delete from document_table_positions where {_FILING}",
+    f"delete from filings_parsed_successfully where {_FILING}",
+    f"delete from filings_with_textual_parse_errors where {_FILING}",
+    # naive_sentences.py
+    f"delete from nes_ranges where {_FILING}",
+    f"delete from naively_extracted_sentences where {_FILING}",
+]
+
+# What the OpenAI batches made from a filing's cleaned text. These cost money
+# to redo, so replace() only deletes them when the cleaned text (see
+# filing_text.py) has changed, not for every change to the raw bytes.
+# director_extraction_raw is simply overwritten when new results are ingested.
+PAID_STAGE_OUTPUTS = [
+    "delete from director_extractions where url = %s",
+    "delete from director_committees where director_id in (select id from director_details where url = %s)",
+    "delete from director_details where url = %s",
+    "delete from director_compensation where url = %s",
+    "delete from filing_text_cache where url = %s",
+]
+
+
+class DocumentStore:
+    def __init__(self, codec=DEFAULT_CODEC, backend="postgres", blobs=None):
+        if codec is not None and codec not in CODECS:
+            raise UnknownCodecError(f"Unknown codec {codec!r}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend {backend!r}")
+        if backend == "blobstore" and blobs is None:
+            raise ValueError("The blobstore backend needs a blob_directory")
+        self.codec = codec
+        self.backend = backend
+        self.blobs = blobs
+
+    def decode(self, content, codec, content_sha256=None):
+        """Turn (content, codec, content_sha256) selected from html_doc_cache into raw bytes."""
+        if content is not None:
+            return decompress(content, codec)
+        if content_sha256 is None:
+            return None
+        if self.blobs is None:
+            raise blob_store.BlobNotFoundError(
+                f"Document {content_sha256} is in a blob store but no blob_directory is configured")
+        return self.blobs.get(content_sha256)
+
+    def _encode(self, raw):
+        if self.backend == "blobstore":
+            self.blobs.put(raw)
+            return None, None
+        return compress(raw, self.codec), self.codec
+
+    def save(self, cursor, url, raw, encoding, content_type, etag=None, last_modified=None):
+        content, codec = self._encode(raw)
+        cursor.execute(
+            """insert into html_doc_cache (url, content, codec, content_sha256, encoding, content_type, etag, last_modified)
+               values (%s, %s, %s, %s, %s, %s, %s, %s)""",
+            [url, content, codec, blob_store.content_hash(raw), encoding, content_type, etag, last_modified],
+        )
+
+    def replace(self, cursor, url, raw, encoding, content_type, etag=None, last_modified=None):
+        """Store a new version of an already-fetched document.
+
+        The current row is copied into html_doc_versions first, so earlier
+        versions are kept rather than overwritten. Everything the later
+        stages made from the old version (see STAGE_OUTPUTS) is deleted, so
+        they process the new version next time they run. The OpenAI results
+        (PAID_STAGE_OUTPUTS) are only deleted if the new version's cleaned
+        text differs from the old one's.
+        """
+        text_changed = self.cleaned_text_changed(cursor, url, raw, encoding, content_type)
+        cursor.execute(
+            """insert into html_doc_versions
+                 (url, version, content, codec, content_sha256, encoding, content_type, etag, last_modified, date_fetch)
+               select url, version, content, codec, content_sha256, encoding, content_type, etag, last_modified, date_fetch
+                 from html_doc_cache where url = %s""",
+            [url],
+        )
+        content, codec = self._encode(raw)
+        cursor.execute(
+            """update html_doc_cache
+                  set content = %s, codec = %s, content_sha256 = %s, encoding = %s, content_type = %s,
+                      etag = %s, last_modified = %s, version = version + 1,
+                      date_fetch = current_timestamp, date_checked = current_timestamp
+                where url = %s""",
+            [content, codec, blob_store.content_hash(raw), encoding, content_type, etag, last_modified, url],
+        )
+        for statement in STAGE_OUTPUTS + (PAID_STAGE_OUTPUTS if text_changed else []):
+            cursor.execute(statement, [url])
+
+    def cleaned_text_changed(self, cursor, url, raw, encoding, content_type):
+        """Whether raw cleans up to different text from the version of url stored now."""
+        cursor.execute("select text_version from filing_text_cache where url = %s and cleaner_version = %s",
+                       [url, filing_text.CLEANER_VERSION])
+        row = cursor.fetchone()
+        try:
+            if row is not None:
+                old_text = row[0]
+            else:
+                old = self.load(cursor, url)
+                if old is None or old[0] is None:
+                    return True
+                old_text = filing_text.text_version(*old)
+            return filing_text.text_version(raw, encoding, content_type) != old_text
+        except (filing_text.UnsupportedContentType, UnicodeDecodeError, LookupError):
+            # No text to compare, so assume the worst
+            return True
+
+    def mark_unchanged(self, cursor, url, etag=None, last_modified=None):
+        """Record that the server confirmed our copy of url is current."""
+        cursor.execute(
+            """update html_doc_cache
+                  set etag = coalesce(%s, etag), last_modified = coalesce(%s, last_modified),
+                      date_checked = current_timestamp
+                where url = %s""",
+            [etag, last_modified, url],
+        )
+
+    def load(self, cursor, url):
+        """Return (raw bytes, encoding, content_type) for url, or None if it hasn't been fetched."""
+        cursor.execute(
+            "select content, codec, content_sha256, encoding, content_type from html_doc_cache where url = %s",
+            [url],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        content, codec, content_sha256, encoding, content_type = row
+        return self.decode(content, codec, content_sha256), encoding, content_type
+
+
+def from_config(config_filename):
+    """Build a DocumentStore from the optional [storage] section of db.conf."""
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    if not config.has_section("storage"):
+        return DocumentStore()
+    storage = config["storage"]
+    codec = storage.get("codec", DEFAULT_CODEC)
+    if codec in ("", "none"):
+        codec = None
+    blobs = None
+    if storage.get("blob_directory"):
+        blobs = blob_store.BlobStore(storage["blob_directory"])
+    return DocumentStore(codec=codec, backend=storage.get("backend", "postgres"), blobs=blobs)
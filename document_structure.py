@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Split a filing's HTML into a sequence of text, headings and tables.
+
+headings_tables_and_text(soup) walks the document in order and returns a
+list of blobs:
+
+    ("TEXT", position, position_of_leader, plaintext)
+    ("HEADING", tag name, position, heading text)
+    ("TABLE", position, table number)
+
+Positions count every blob in the document. A TEXT blob's leader is the
+heading (or first text blob) that starts the section it is in.
+
+All of the walk's state lives in the call, so documents can be walked in
+parallel (every_textual.py does so in a process pool). A tag the walker
+doesn't know what to do with raises UnknownTagError.
+"""
+
+import re
+
+font_size = re.compile(r'font-size:(\d+)')
+
+IGNORED_TAGS = ['script', 'img', 'title', 'noscript', 's', 'del', 'strike', 'meta', 'head', 'map', 'area']
+
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+# These don't break the flow of a section, but text before them is a blob of its own
+BLOCK_TAGS = ['tr', 'td', 'p', 'li', 'ul', 'ol', 'dd', 'dt', 'div', 'caption', 'captions', 'main', 'cite', 'f1',
+              'blockquote', 'datalist', 'details', 'page', 'dl', 'html', 'th', 'pre',
+              'body', 'document', 'c', 'dir']
+
+INLINE_TAGS = ['b', 'i', 'em', 'a', 'u', 'center', 'sup', 'sub', 'strong', 'small', 'big', 'tt',
+               'kbd', 'type']
+
+
+class UnknownTagError(Exception):
+    pass
+
+
+class _Walk:
+    def __init__(self):
+        self.position = 0
+        self.last_table_number_seen = 0
+        self.text_blobs = []
+
+    def flush(self, current_text_blob, level_leader_position):
+        """Record the text seen so far as a blob, if there is any. Returns the (possibly new) leader."""
+        if current_text_blob.strip() != '':
+            self.position += 1
+            if level_leader_position is None:
+                level_leader_position = self.position
+            self.text_blobs.append(("TEXT", self.position, level_leader_position, current_text_blob.strip()))
+        return level_leader_position
+
+    def walk(self, congee, level_leader_position=None):
+        current_text_blob = ""
+        for child in congee.children:
+            if child.name in IGNORED_TAGS:
+                continue
+            if child.name is None:
+                # then it's a navigable string
+                if child.text.strip() == '':
+                    continue
+                # so now it's a navigable string that says something
+                current_text_blob += child.text + ' '
+                continue
+            if child.name == 'table':
+                level_leader_position = self.flush(current_text_blob, level_leader_position)
+                current_text_blob = ''
+                self.last_table_number_seen += 1
+                self.position += 1
+                self.text_blobs.append(("TABLE", self.position, self.last_table_number_seen))
+                # It is possible that there are sentences inside tables that might be informative. Not sure.
+                self.walk(child, level_leader_position=None)
+                continue
+            if child.name in HEADING_TAGS:
+                self.flush(current_text_blob, level_leader_position)
+                current_text_blob = ''
+                self.position += 1
+                self.text_blobs.append(("HEADING", child.name, self.position, child.text))
+                level_leader_position = self.position
+                continue
+            if child.name in ['hr', 'br']:
+                self.flush(current_text_blob, level_leader_position)
+                current_text_blob = ''
+                level_leader_position = None
+                continue
+            if child.find('table') or child.find('p'):
+                level_leader_position = self.flush(current_text_blob, level_leader_position)
+                current_text_blob = ''
+                self.walk(child, level_leader_position=level_leader_position)
+                continue
+            # We are not a table. We are not a navigable string. We are not a heading.
+            # There are no paragraphs below us. There are no tables below us.
+            if child.name in BLOCK_TAGS:
+                # These don't break the flow. We can keep level leader, but we do need to clear the context
+                # before handling them.
+                level_leader_position = self.flush(current_text_blob, level_leader_position)
+                current_text_blob = ''
+                self.walk(child, level_leader_position=level_leader_position)
+                continue
+            if child.name in INLINE_TAGS:
+                current_text_blob += child.text + ' '
+                continue
+            if child.name == 'font':
+                size_increase = False
+                if 'size' in child.attrs:
+                    if child.attrs['size'].startswith('+'):
+                        size_increase = True
+                    elif child.attrs['size'] in ['4', '5', '6', '7']:
+                        size_increase = True
+                        # Not completely true. It depends on how big we were before.
+                        # But it *probably* means a bigger font
+                    continue
+                if 'style' in child.attrs:
+                    font_size_match = font_size.search(child.attrs['style'])
+                    if font_size_match:
+                        if float(font_size_match.group(1)) > 12:
+                            size_increase = True
+                    continue
+                if size_increase:
+                    # It's like a heading.
+                    self.flush(current_text_blob, level_leader_position)
+                    current_text_blob = ''
+                    self.position += 1
+                    self.text_blobs.append(("HEADING", "H0", self.position, child.text))
+                    level_leader_position = self.position
+                    continue
+                # Not a size increase. Probably harmless colour change or something.
+                current_text_blob += child.text + ' '
+                continue
+            raise UnknownTagError(f"Don't know how to handle {child.name} tag in {child}")
+        if current_text_blob.strip() != '':
+            self.position += 1
+            if level_leader_position is None:
+                level_leader_position = self.position
+            self.text_blobs.append(("TEXT", self.position, level_leader_position, current_text_blob))
+
+
+def headings_tables_and_text(soup):
+    """The TEXT, HEADING and TABLE blobs of a parsed document, in document order."""
+    walk = _Walk()
+    walk.walk(soup)
+    return walk.text_blobs
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""Rate-limited, concurrent HTTP fetching from EDGAR.
+
+SEC allows roughly 10 requests per second from one client, across all
+of its connections. Every fetcher in a process should go through one
+EdgarFetcher so that they share the same token bucket."""
+
+import collections
+import configparser
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+import requests.adapters
+
+DEFAULT_REQUESTS_PER_SECOND = 8.0
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 60
+
+FetchResult = collections.namedtuple("FetchResult", ["url", "response", "error"])
+
+
+class RateLimiter:
+    """A token bucket that any number of threads can draw from.
+
+    Implemented as a virtual schedule: each caller reserves the next free
+    slot under the lock and then sleeps outside it until that slot comes
+    round, so waiting threads don't block each other's bookkeeping.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._interval = 1.0 / self.rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            slot = max(self._next_slot, now)
+            delay = slot - self._tolerance - now
+            self._next_slot = slot + self._interval
+        if delay > 0:
+            self._sleep(delay)
+
+
+class EdgarFetcher:
+    def __init__(self, user_agent, *, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, limiter=None):
+        self.user_agent = user_agent
+        self.workers = workers
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else RateLimiter(requests_per_second)
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session is not thread-safe, so each worker keeps its own
+        # keep-alive connection to www.sec.gov
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = self.user_agent
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, headers=None):
+        self.limiter.acquire()
+        return self._session().get(url, headers=headers, timeout=self.timeout)
+
+    def _fetch_one(self, url, headers):
+        try:
+            return FetchResult(url, self.get(url, headers=headers), None)
+        except requests.RequestException as exc:
+            return FetchResult(url, None, exc)
+
+    def fetch_all(self, urls, headers_for=None):
+        """Fetch every URL in ``urls``, yielding FetchResults as they complete.
+
+        ``urls`` may be a lazy iterable; only a few requests per worker are
+        kept in flight. ``headers_for`` can supply per-URL extra headers.
+        Network errors are returned in ``FetchResult.error`` rather than
+        raised, so one bad connection doesn't stop a long run.
+        """
+        max_in_flight = self.workers * 4
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = set()
+            for url in urls:
+                headers = headers_for(url) if headers_for is not None else None
+                in_flight.add(pool.submit(self._fetch_one, url, headers))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+def from_config(config_filename, **overrides):
+    """Build an EdgarFetcher from the [edgar] section of db.conf.
+
+    Recognised keys are ``useragent`` (required), ``requests_per_second``
+    and ``workers``. Keyword arguments that are not None take precedence.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    edgar = config["edgar"]
+    settings = {
+        "requests_per_second": edgar.getfloat("requests_per_second", DEFAULT_REQUESTS_PER_SECOND),
+        "workers": edgar.getint("workers", DEFAULT_WORKERS),
+    }
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return EdgarFetcher(edgar["useragent"], **settings)
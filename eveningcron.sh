@@ -44,8 +44,7 @@ echo "[$(timestamp)] Host: $(hostname) | Working directory: ${SCRIPT_DIR}"
 
 FAILED=0
 
-run_step "uv run batchfetch.py --show-costs" uv run batchfetch.py --show-costs || FAILED=1
-run_step "uv run process_director_compensation.py --show-costs" uv run process_director_compensation.py --show-costs || FAILED=1
+run_step "uv run batch_jobs.py --fetch --show-costs" uv run batch_jobs.py --fetch --show-costs || FAILED=1
 run_step "uv run process_from_raw.py" uv run process_from_raw.py || FAILED=1
 run_step "uv run fetch_prices_for_director_filings.py --stop-after 200" uv run fetch_prices_for_director_filings.py --stop-after 200 || FAILED=1
 run_step "uv run board_stock_analysis.py" uv run board_stock_analysis.py || FAILED=1
@@ -1,5 +1,13 @@
 #!/usr/bin/env python3
 
+"""Record where the text, headings and tables are in each DEF 14A filing.
+
+Filings are walked (see document_structure.py) in a process pool, a chunk
+at a time, and each chunk's blobs are written with one insert per table.
+A filing the walker can't handle is recorded in
+filings_with_textual_parse_errors and the run carries on.
+"""
+
 import argparse
 
 parser = argparse.ArgumentParser()
@@ -20,20 +28,25 @@ parser.add_argument("--cikcode",
                     help="Only process documents from this cikcode")
 parser.add_argument("--accession-number",
                     help="Only process documents with this accession number")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many processes to parse documents with (default: one per CPU)")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=200,
+                    help="How many documents to parse per transaction")
 parser.add_argument("--random-order",
                     action="store_true",
                     help="It doesn't matter what order things get processed in. Save the time doing the sort")
 args = parser.parse_args()
 
 import pgconnect
+import bulk_writer
+import doc_store
+import document_structure
 import logging
-import pandas
-import functools
-import sys
-import director_name_handling
 from bs4 import BeautifulSoup
-import re
-font_size = re.compile('font-size:(\d+)')
+from concurrent.futures import ProcessPoolExecutor
 
 if args.verbose:
     logging.basicConfig(
@@ -42,232 +55,106 @@ if args.verbose:
         datefmt='%Y-%m-%d %H:%M:%S')
     logging.info("Starting")
 
-conn = pgconnect.connect(args.database_config)
-read_cursor = conn.cursor()
-html_read_cursor = conn.cursor()
-write_cursor = conn.cursor()
 
-constraints = []
-constraint_args = []
-if args.cikcode is not None:
-    constraints.append("cikcode = %s")
-    constraint_args.append(args.cikcode)
-if args.accession_number is not None:
-    constraints.append("accessionnumber = %s")
-    constraint_args.append(args.accession_number)
-if len(constraints) == 0:
-    constraints = ""
-else:
-    constraints = " AND " + (' and '.join(constraints))
+def parse(work):
+    """Runs in a worker process. Returns (cikcode, accession number, blobs, error); one of the last two is None."""
+    cikcode, accession_number, html = work
+    soup = BeautifulSoup(html, features='lxml')
+    try:
+        return cikcode, accession_number, document_structure.headings_tables_and_text(soup), None
+    except document_structure.UnknownTagError as e:
+        return cikcode, accession_number, None, str(e)
+    except RecursionError:
+        return cikcode, accession_number, None, "Document is too deeply nested to walk"
 
-query = """
-select cikcode, accessionnumber, filingdate, document_storage_url, 
-  filings_with_textual_parse_errors.cikcode as failed_parse,
-  filings_parsed_successfully.cikcode as succeeded_parse
-from filings
-left join filings_with_textual_parse_errors using (cikcode, accessionnumber)
-left join filings_parsed_successfully  using (cikcode, accessionnumber)
-where filings_with_textual_parse_errors.cikcode is null
-  and filings_parsed_successfully.cikcode is null
-  and form = 'DEF 14A'
-""" + constraints
 
-if not args.random_order:
-    query += " order by cikcode, accessionnumber"
-if args.stop_after is not None:
-    query += f" limit {args.stop_after}"
+def save(writer, parsed):
+    for cikcode, accession_number, text_blobs, error in parsed:
+        if error is not None:
+            logging.warning(f"{cikcode} {accession_number}: {error}")
+            writer.add("insert into filings_with_textual_parse_errors (cikcode, accessionNumber, errors) values %s",
+                       (cikcode, accession_number, error))
+            continue
+        for t in text_blobs:
+            if t[0] == 'TEXT':
+                writer.add("insert into document_text_positions (cikcode, accessionNumber, document_position, position_of_leader, plaintext) values %s",
+                           (cikcode, accession_number, t[1], t[2], t[3]))
+            if t[0] == 'HEADING':
+                writer.add("insert into document_headings (cikcode, accessionNumber, heading_level, heading_text, document_position) values %s",
+                           (cikcode, accession_number, t[1][1], t[3], t[2]))
+            if t[0] == 'TABLE':
+                writer.add("insert into document_table_positions (cikcode, accessionNumber, table_number, document_position) values %s",
+                           (cikcode, accession_number, t[2], t[1]))
+        writer.add("insert into filings_parsed_successfully (cikcode, accessionNumber) values %s",
+                   (cikcode, accession_number))
+    writer.flush()
 
-read_cursor.execute(query, constraint_args)
 
-if args.progress:
-    import tqdm
-    iterator = tqdm.tqdm(read_cursor, total=read_cursor.rowcount)
-else:
-    iterator = read_cursor
+if __name__ == '__main__':
+    conn = pgconnect.connect(args.database_config)
+    store = doc_store.from_config(args.database_config)
+    read_cursor = conn.cursor()
+    html_read_cursor = conn.cursor()
+    writer = bulk_writer.BulkWriter(conn.cursor())
 
+    constraints = []
+    constraint_args = []
+    if args.cikcode is not None:
+        constraints.append("cikcode = %s")
+        constraint_args.append(args.cikcode)
+    if args.accession_number is not None:
+        constraints.append("accessionnumber = %s")
+        constraint_args.append(args.accession_number)
+    if len(constraints) == 0:
+        constraints = ""
+    else:
+        constraints = " AND " + (' and '.join(constraints))
 
-def headings_tables_and_text(congee, level_leader_position=None):
-    global last_table_number_seen
-    global last_heading_number_seen
-    global position
-    global text_blobs
-    
-    current_text_blob = ""
-    for child in congee.children:
-        if child.name in ['script', 'img', 'title', 'noscript', 's', 'del', 'strike', 'meta', 'head','map', 'area']:
-            continue
-        if child.name is None:
-            # then it's a navigable string
-            if child.text.strip() == '':
-                continue
-            # so now it's a navigable string that says something
-            #print(f"An ordinary blob of text at {position=}, with {level_leader_position=}: {child.text}")
-            current_text_blob += child.text + ' '
-            continue
-        if child.name == 'table':
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position
-                text_blobs.append(("TEXT",position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
+    query = """
+    select cikcode, accessionnumber, filingdate, document_storage_url,
+      filings_with_textual_parse_errors.cikcode as failed_parse,
+      filings_parsed_successfully.cikcode as succeeded_parse
+    from filings
+    left join filings_with_textual_parse_errors using (cikcode, accessionnumber)
+    left join filings_parsed_successfully  using (cikcode, accessionnumber)
+    where filings_with_textual_parse_errors.cikcode is null
+      and filings_parsed_successfully.cikcode is null
+      and form = 'DEF 14A'
+    """ + constraints
 
-            last_table_number_seen += 1
-            position += 1
-            text_blobs.append(("TABLE", position, last_table_number_seen))
-            #print(indent, f"Then we saw table {last_table_number_seen} at position {position}")
-            # It is possible that there are sentences inside tables that might be informative. Not sure.
-            headings_tables_and_text(child, level_leader_position=None)
-            continue
-        if child.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position
-                text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
-            position += 1
-            text_blobs.append(("HEADING", child.name, position, child.text))
-            level_leader_position = position
-            continue
-        if child.name in ['hr', 'br']:
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position                
-                text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
-            level_leader_position = None
-            continue
-        if child.find('table'):
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position
-                text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
-            #print(indent,"Has child table. Burrowing down")
-            headings_tables_and_text(child, level_leader_position=level_leader_position)
-            continue
-        if child.find('p'):
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position
-                text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
-            #print(indent, "Has a paragraph child. Burrowing down", child.text)
-            headings_tables_and_text(child, level_leader_position=level_leader_position)
-            continue
-        # We are not a table. We are not a navigable string. We are not a heading.
-        # There are no paragraphs below us. There are no tables below us.
-        if child.name in ['tr', 'td', 'p', 'li', 'ul', 'ol', 'dd', 'dt', 'div', 'caption', 'captions', 'main', 'cite', 'f1',
-                          'blockquote', 'datalist', 'details', 'page', 'dl', 'html', 'th', 'pre',
-                          'body', 'document', 'c', 'dir']:
-            # These don't break the flow. We can keep level leader, but we do need to clear the context
-            # before handling them.
-            if current_text_blob.strip() != '':
-                position += 1
-                if level_leader_position is None:
-                    level_leader_position = position
-                text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                current_text_blob = ''
-            headings_tables_and_text(child, level_leader_position=level_leader_position)
-            continue 
-        if child.name in ['b', 'i', 'em', 'a', 'u', 'center', 'sup', 'sub', 'strong', 'small', 'big', 'tt',
-                          'kbd', 'type']:
-            #print(f"An ordinary blob of text at {position=}, with {level_leader_position=}: {child.text}")
-            current_text_blob += child.text + ' '
-            continue 
-        if child.name == 'font':
-            size_increase = False
-            if 'size' in child.attrs:
-                if child.attrs['size'].startswith('+'):
-                    size_increase = True
-                elif child.attrs['size'] in ['4', '5', '6', '7']:
-                    size_increase = True
-                    # Not completely true. It depends on how big we were before.
-                    # But it *probably* means a bigger font
-                continue
-            if 'style' in child.attrs:
-                font_size_match = font_size.search(child.attrs['style'])
-                if font_size_match:
-                    if float(font_size_match.group(1)) > 12:
-                        size_increase = True
-                continue
-            if size_increase:
-                # It's like a heading.
-                if current_text_blob.strip() != '':
-                    position += 1
-                    if level_leader_position is None:
-                        level_leader_position = position
-                    text_blobs.append(("TEXT", position, level_leader_position, current_text_blob.strip()))
-                    current_text_blob = ''
-                position += 1
-                text_blobs.append(("HEADING", "H0", position, child.text))
-                level_leader_position = position
-                continue
-            # Not a size increase. Probably harmless colour change or something.
-            current_text_blob += child.text + ' '
-            continue
-        # No idea what to do. Panic.
-        global write_cursor
-        global conn
-        global cikcode
-        global accession_number
-        error_message = f"Don't know how to handle {child.name} tag in {child}"
-        write_cursor.execute("insert into filings_with_textual_parse_errors (cikcode, accessionNumber, errors) values (%s, %s, %s)",
-                             [cikcode, accession_number,error_message])
-                              
-        conn.commit()
-        logging.critical(error_message)
-        sys.exit(1)
-    if current_text_blob.strip() != '':
-        position += 1
-        if level_leader_position is None:
-            level_leader_position = position
-        text_blobs.append(("TEXT", position, level_leader_position, current_text_blob))
-        current_text_blob = ''
+    if not args.random_order:
+        query += " order by cikcode, accessionnumber"
+    if args.stop_after is not None:
+        query += f" limit {args.stop_after}"
+
+    read_cursor.execute(query, constraint_args)
+
+    if args.progress:
+        import tqdm
+        progress = tqdm.tqdm(total=read_cursor.rowcount)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            chunk = read_cursor.fetchmany(args.rows_per_chunk)
+            if len(chunk) == 0:
+                break
+            work = []
+            missing = []
+            for cikcode, accession_number, filingdate, document_storage_url, failed_parse, succeeded_parse in chunk:
+                logging.info(f"Loading {cikcode=}, {accession_number=} from {document_storage_url}")
+                html_row = store.load(html_read_cursor, document_storage_url)
+                if html_row is None:
+                    # It's bad, but we can recover
+                    missing.append((cikcode, accession_number, None,
+                                    "HTML content is missing from the html_doc_cache table"))
+                    continue
+                work.append((cikcode, accession_number, html_row[0]))
+            save(writer, missing + list(pool.map(parse, work)))
+            logging.info("Committing transaction")
+            conn.commit()
+            if args.progress:
+                progress.update(len(chunk))
+                progress.set_description(f"{chunk[-1][0]} {chunk[-1][1]}")
 
-for row in iterator:
-    cikcode = row[0]
-    accession_number = row[1]
-    logging.info(f"Processing {cikcode=}, {accession_number=}")
     if args.progress:
-        iterator.set_description(str(cikcode) + " " + str(accession_number))
-    filingdate = row[2]
-    document_storage_url = row[3]
-    logging.info(f"{document_storage_url=}") 
-    html_read_cursor.execute("select content from html_doc_cache where url = %s", [document_storage_url])
-    html_row = html_read_cursor.fetchone()
-    if html_row is None:
-        # It's bad, but we can recover
-        write_cursor.execute("insert into filings_with_textual_parse_errors (cikcode, accessionNumber, errors) values (%s, %s, %s)",
-                             [cikcode, accession_number,
-                              f"HTML content is missing from the html_doc_cache table"])
-        conn.commit()
-        continue
-    html = html_row[0]
-    logging.info("HTML fetched")
-    soup = BeautifulSoup(html.tobytes(), features='lxml')
-    logging.info("HTML parsed")
-    last_table_number_seen=0
-    last_heading_number_seen=0
-    position=0
-    text_blobs = []
-    headings_tables_and_text(soup)
-    logging.info("Text-level parsing complete")
-    for t in text_blobs:
-        if t[0] == 'TEXT':
-            write_cursor.execute("insert into document_text_positions (cikcode, accessionNumber, document_position, position_of_leader, plaintext) values (%s, %s, %s, %s,%s)",
-                                 [cikcode, accession_number, t[1], t[2], t[3]])
-        if t[0] == 'HEADING':
-            write_cursor.execute("insert into document_headings (cikcode, accessionNumber, heading_level, heading_text, document_position) values (%s, %s, %s, %s, %s)",
-                                 [cikcode, accession_number, t[1][1], t[3], t[2]])
-        if t[0] == 'TABLE':
-            write_cursor.execute("insert into document_table_positions (cikcode, accessionNumber, table_number, document_position) values (%s, %s, %s, %s)",
-                                 [cikcode, accession_number, t[2], t[1]])
-    write_cursor.execute("insert into filings_parsed_successfully (cikcode, accessionNumber) values (%s, %s)",
-                         [cikcode, accession_number])
-    logging.info("Committing transaction")
-    conn.commit()
+        progress.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""Parse every table in filing_tables into filing_table_cells, once.
+
+Run after extract_tables.py. Each table's HTML is turned into a grid with
+row and column spans resolved (see table_cells.py), and the grid's size is
+recorded in filing_table_grids, so that later stages can read cells
+instead of parsing HTML again.
+"""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Don't try to parse every table. Stop after this number")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=500,
+                    help="How many tables to parse per transaction")
+args = parser.parse_args()
+
+import pgconnect
+import bulk_writer
+import logging
+import table_cells
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+
+conn = pgconnect.connect(args.database_config)
+# Committing on the connection the cursor is reading from would close it
+write_conn = pgconnect.connect(args.database_config)
+read_cursor = conn.cursor(name="tables_needing_cells")
+read_cursor.itersize = args.rows_per_chunk
+writer = bulk_writer.BulkWriter(write_conn.cursor())
+
+query = """select table_id, html from filing_tables
+ where not exists (select 1 from filing_table_grids where filing_table_grids.table_id = filing_tables.table_id)"""
+if args.stop_after is not None:
+    query += f" limit {args.stop_after}"
+read_cursor.execute(query)
+
+if args.progress:
+    import tqdm
+    iterator = tqdm.tqdm(read_cursor, total=args.stop_after)
+else:
+    iterator = read_cursor
+
+tables_in_chunk = 0
+for table_id, html in iterator:
+    cells = table_cells.grid(html)
+    row_count = max((r for r, c, text in cells), default=-1) + 1
+    column_count = max((c for r, c, text in cells), default=-1) + 1
+    writer.add("insert into filing_table_grids (table_id, row_count, column_count) values %s",
+               (table_id, row_count, column_count))
+    writer.extend("insert into filing_table_cells (table_id, row_number, column_number, cell_text) values %s",
+                  [(table_id, r, c, text) for r, c, text in cells])
+    tables_in_chunk += 1
+    if tables_in_chunk >= args.rows_per_chunk:
+        writer.flush()
+        write_conn.commit()
+        tables_in_chunk = 0
+
+writer.flush()
+write_conn.commit()
+read_cursor.close()
+conn.commit()
@@ -1,5 +1,13 @@
 #!/usr/bin/env python3
 
+"""Copy every table in each fetched filing into filing_tables.
+
+Filings stream in through a server-side cursor (content and all), their
+tables are pulled out as they are parsed (see html_tables.py), and they are
+written a chunk of filings at a time. The writes go through a second
+connection, so committing them doesn't close the cursor.
+"""
+
 import argparse
 
 parser = argparse.ArgumentParser()
@@ -15,11 +23,17 @@ parser.add_argument("--verbose",
 parser.add_argument("--stop-after",
                     type=int,
                     help="Don't try to extract tables from every document. Stop after this number")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=50,
+                    help="How many documents to extract tables from per transaction")
 args = parser.parse_args()
 
 import pgconnect
+import bulk_writer
+import doc_store
+import html_tables
 import logging
-from bs4 import BeautifulSoup
 
 if args.verbose:
     logging.basicConfig(
@@ -29,41 +43,46 @@ if args.verbose:
     logging.info("Starting")
 
 conn = pgconnect.connect(args.database_config)
-read_cursor = conn.cursor()
-doc_read_cursor = conn.cursor()
-write_cursor = conn.cursor()
+write_conn = pgconnect.connect(args.database_config)
+store = doc_store.from_config(args.database_config)
+read_cursor = conn.cursor(name="filings_needing_table_extraction")
+read_cursor.itersize = args.rows_per_chunk
+writer = bulk_writer.BulkWriter(write_conn.cursor())
 
-query = "select cikcode, accessionnumber,document_storage_url from filings_needing_table_extraction join html_doc_cache on (document_storage_url = url) where content_type = 'text/html'"
+query = """select cikcode, accessionnumber, document_storage_url, content, codec, content_sha256, encoding
+  from filings_needing_table_extraction
+  join html_doc_cache on (document_storage_url = url)
+ where content_type = 'text/html'"""
 if args.stop_after is not None:
     query += f" limit {args.stop_after}"
 read_cursor.execute(query)
 
 if args.progress:
     import tqdm
-    iterator = tqdm.tqdm(read_cursor, total=read_cursor.rowcount)
+    iterator = tqdm.tqdm(read_cursor, total=args.stop_after)
 else:
     iterator = read_cursor
 
-for row in iterator:
-    cikcode = row[0]
-    accessionnumber = row[1]
-    document_url = row[2]
-    # It might be faster to fetch the content in the read_cursor step, but
-    # I'm vaguely worried about memory blowups. I suspect that we are going
-    # to be bottlenecked on parsing the HTML anyway.
-    doc_read_cursor.execute("select content, encoding from html_doc_cache where url = %s",
-                            [document_url])
-    doc_row = doc_read_cursor.fetchone()
-    if doc_row is None:
+documents_in_chunk = 0
+for cikcode, accessionnumber, document_url, content, codec, content_sha256, encoding in iterator:
+    raw = store.decode(content, codec, content_sha256)
+    if raw is None:
         logging.error(f"Missing data for url = {document_url}")
-    content = doc_row[0].tobytes().decode(doc_row[1])
-
-    soup = BeautifulSoup(content, features="lxml")
+        continue
     tables_found = False
-    for i,t in enumerate(soup.find_all('table')):
+    for table_number, table_html in html_tables.iter_tables(raw, encoding):
         tables_found = True
-        write_cursor.execute("insert into filing_tables (cikcode, accessionnumber, table_number, html) values (%s, %s, %s, %s)",
-                             [cikcode, accessionnumber, i+1, str(t)])
+        writer.add("insert into filing_tables (cikcode, accessionnumber, table_number, html) values %s",
+                   (cikcode, accessionnumber, table_number, table_html))
     if not tables_found:
-        write_cursor.execute("insert into filings_with_no_tables (cikcode, accessionnumber) values (%s, %s)", [cikcode, accessionnumber])
-    conn.commit()
+        writer.add("insert into filings_with_no_tables (cikcode, accessionnumber) values %s", (cikcode, accessionnumber))
+    documents_in_chunk += 1
+    if documents_in_chunk >= args.rows_per_chunk:
+        writer.flush()
+        write_conn.commit()
+        documents_in_chunk = 0
+
+writer.flush()
+write_conn.commit()
+read_cursor.close()
+conn.commit()
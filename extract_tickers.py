@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
-import psycopg2
-import psycopg2.extras
+import io
 import zipfile
 import pgconnect
 import logging
@@ -17,8 +16,7 @@ parser.add_argument("--database-config",
                     default="db.conf",
                     help="Parameters to connect to the database")
 parser.add_argument("--schema-file",
-                    default="ticker_schema.sql",
-                    help="SQL file containing the schema for the ticker table")
+                    help="SQL file to run first to create the ticker table (not needed if schema.sql has been loaded)")
 parser.add_argument("--progress",
                     action="store_true",
                     help="Show a progress bar")
@@ -53,19 +51,13 @@ submissions = zipfile.ZipFile(args.submissions_zip)
 conn = pgconnect.connect(args.database_config)
 cursor = conn.cursor()
 
-# Create the schema if it doesn't exist
-with open(args.schema_file, 'r') as schema_file:
-    schema_sql = schema_file.read()
-    cursor.execute(schema_sql)
-    conn.commit()
-    logging.info("Schema created or verified")
-
-# Prepare the ticker insertion query
-ticker_insert_query = """
-INSERT INTO cik_to_ticker (cikcode, ticker)
-VALUES (%s, %s)
-ON CONFLICT ON CONSTRAINT cik_to_ticker_pkey DO NOTHING
-"""
+# Create the schema if asked to
+if args.schema_file:
+    with open(args.schema_file, 'r') as schema_file:
+        schema_sql = schema_file.read()
+        cursor.execute(schema_sql)
+        conn.commit()
+        logging.info("Schema created or verified")
 
 # Get the ZIP entries
 zip_entries = [entry for entry in submissions.namelist() if entry.startswith("CIK") and entry.endswith(".json")]
@@ -80,46 +72,69 @@ if args.progress:
 else:
     iterator = zip_entries
 
-# Process each entry
-ticker_count = 0
-cik_count = 0
+# Gather every (cikcode, ticker) pair in memory; there are only tens of
+# thousands of them. ciks_seen also includes companies with no tickers, so
+# that tickers they used to have get removed.
+ticker_pairs = set()
+ciks_seen = []
 
 for entry in iterator:
     # Check if filename is of the right format (CIK followed by numbers and .json)
     if not (entry.startswith("CIK") and entry[3:-5].isdigit() and entry.endswith(".json")):
         continue
-        
+
     cikcode = int(entry[3:-5])
-    
+
     try:
         source_data = submissions.read(entry)
         json_data = json.loads(source_data)
-        
-        # Skip entries without "tickers" key or with empty tickers
-        if "tickers" not in json_data or not json_data["tickers"]:
-            logging.info(f"Skipping {entry}: No tickers found")
-            continue
-        
-        # Add all tickers for this CIK
-        cik_count += 1
-        for ticker in json_data["tickers"]:
-            if ticker:  # Only process non-empty tickers
-                cursor.execute(ticker_insert_query, [cikcode, ticker])
-                ticker_count += 1
-        
-        # Commit each CIK to avoid large transactions
-        conn.commit()
-            
     except Exception as e:
         logging.error(f"Error processing {entry}: {str(e)}")
         continue
 
-# Final commit
+    ciks_seen.append(cikcode)
+    for ticker in json_data.get("tickers") or []:
+        if ticker:  # Only process non-empty tickers
+            ticker_pairs.add((cikcode, ticker))
+
+
+def copy_lines(table, lines):
+    buffer = io.StringIO("".join(line + "\n" for line in lines))
+    cursor.copy_expert(f"copy {table} from stdin", buffer)
+
+
+cursor.execute("create temporary table tickers_staging (cikcode int, ticker varchar)")
+cursor.execute("create temporary table ciks_seen (cikcode int primary key)")
+# Tickers are short upper-case symbols, so they never need COPY escaping
+copy_lines("tickers_staging", (f"{cikcode}\t{ticker}" for cikcode, ticker in ticker_pairs))
+copy_lines("ciks_seen", (str(cikcode) for cikcode in set(ciks_seen)))
+cursor.execute("analyze tickers_staging")
+
+cursor.execute("""
+  with removed as (
+    delete from cik_to_ticker
+     where cikcode in (select cikcode from ciks_seen)
+       and not exists (select 1 from tickers_staging s
+                        where s.cikcode = cik_to_ticker.cikcode
+                          and s.ticker = cik_to_ticker.ticker)
+    returning 1
+  ), inserted as (
+    insert into cik_to_ticker (cikcode, ticker)
+    select cikcode, ticker from tickers_staging
+    on conflict on constraint cik_to_ticker_pkey do nothing
+    returning 1
+  )
+  select (select count(*) from inserted), (select count(*) from removed)
+""")
+inserted_count, removed_count = cursor.fetchone()
 conn.commit()
 
-logging.info(f"Extraction complete. Added {ticker_count} tickers for {cik_count} companies.")
-print(f"Extraction complete. Added {ticker_count} tickers for {cik_count} companies.")
+unchanged_count = len(ticker_pairs) - inserted_count
+summary = (f"Extraction complete. {len(ticker_pairs)} tickers for {len(set(ciks_seen))} companies: "
+           f"{inserted_count} inserted, {removed_count} removed, {unchanged_count} unchanged.")
+logging.info(summary)
+print(summary)
 
 # Close connections
 cursor.close()
-conn.close()
\ No newline at end of file
+conn.close()
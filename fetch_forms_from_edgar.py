@@ -2,7 +2,6 @@
 
 import argparse
 import datetime
-import configparser
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--database-config",
@@ -20,24 +19,45 @@ parser.add_argument("--form",
                     help="Which forms to select for download")
 parser.add_argument("--retry-past-failures",
                     action="store_true",
-                    help="If a document was unfetchable in the past, normally we don't try again, but with this option we will")
+                    help="Retry every past failure now, even ones that aren't due yet or were given up on. (Normally failures are retried with exponential backoff, and 404s are never retried)")
 
+parser.add_argument("--refresh",
+                    action="store_true",
+                    help="Instead of fetching new documents, re-check ones we already have with conditional GETs, keeping the old version of any that changed")
+parser.add_argument("--min-days-since-check",
+                    type=int,
+                    default=0,
+                    help="With --refresh, skip documents that were checked more recently than this")
 parser.add_argument("--url",
                     help="For debugging, only fetch this one URL")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many downloads to run at once (default: [edgar] workers in the config, or 4)")
+parser.add_argument("--requests-per-second",
+                    type=float,
+                    help="Overall rate limit against EDGAR (default: [edgar] requests_per_second in the config, or 8)")
+parser.add_argument("--commit-every",
+                    type=int,
+                    default=50,
+                    help="Commit after this many documents have been stored")
 args = parser.parse_args()
 
 import pgconnect
-import requests
+import blob_store
+import doc_store
+import edgar_fetcher
+import fetch_retry
 import logging
-import time
 
 conn = pgconnect.connect(args.database_config)
 read_cursor = conn.cursor()
 write_cursor = conn.cursor()
 
+# New work, plus past failures whose backoff has expired
 unfetched = """
   select document_storage_url
     from filings
+    left join html_fetch_failures on (url = document_storage_url)
    where form = %s
      and extract(year from filingDate) = %s
      and document_storage_url not in (select url from html_doc_cache)
@@ -46,39 +66,108 @@ unfetched = """
 if args.retry_past_failures:
     pass
 else:
-    unfetched += " and document_storage_url not in (select url from html_fetch_failures)"
+    unfetched += """
+     and (html_fetch_failures.url is null
+          or (not html_fetch_failures.permanent
+              and html_fetch_failures.next_attempt_after <= current_timestamp))
+"""
 
 params = [args.form, args.year]
 
-if args.url:
+if args.refresh:
+    unfetched = """
+  select url, etag, last_modified, content_sha256
+    from html_doc_cache
+    join filings on (document_storage_url = url)
+   where form = %s
+     and extract(year from filingDate) = %s
+     and date_checked <= current_timestamp - make_interval(days => %s)
+"""
+    params = [args.form, args.year, args.min_days_since_check]
+    if args.url:
+        unfetched = "select url, etag, last_modified, content_sha256 from html_doc_cache where url = %s"
+        params = [args.url]
+elif args.url:
     # Ignore most parameters
     unfetched = "select document_storage_url from filings where document_storage_url = %s"
     params = [args.url]
 
 read_cursor.execute(unfetched, params)
 
+# What we already know about each document, keyed by url (only for --refresh)
+validators = {}
+if args.refresh:
+    validators = {row[0]: row[1:] for row in read_cursor}
+
+
+def conditional_headers(url):
+    etag, last_modified, _ = validators[url]
+    headers = {}
+    if etag is not None:
+        headers['If-None-Match'] = etag
+    if last_modified is not None:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def stored_hash(url):
+    content_sha256 = validators[url][2]
+    if content_sha256 is None:
+        # Fetched before we recorded hashes
+        raw, _, _ = store.load(write_cursor, url)
+        content_sha256 = blob_store.content_hash(raw) if raw is not None else None
+    return content_sha256
+
+store = doc_store.from_config(args.database_config)
+fetcher = edgar_fetcher.from_config(args.database_config,
+                                    workers=args.workers,
+                                    requests_per_second=args.requests_per_second)
+if args.refresh:
+    results = fetcher.fetch_all(list(validators), headers_for=conditional_headers)
+else:
+    results = fetcher.fetch_all(row[0] for row in read_cursor)
+
 if args.progress:
     import tqdm
-    iterator = tqdm.tqdm(read_cursor, total=read_cursor.rowcount)
+    iterator = tqdm.tqdm(results, total=read_cursor.rowcount)
 else:
-    iterator = read_cursor
+    iterator = results
 
+uncommitted = 0
+changed_count = 0
+unchanged_count = 0
+for url, r, error in iterator:
+    etag = r.headers.get('etag') if r is not None else None
+    last_modified = r.headers.get('last-modified') if r is not None else None
+    if error is not None:
+        logging.error(f"Could not fetch {url}: {error}")
+        fetch_retry.record_failure(write_cursor, url, None)
+    elif args.refresh and r.status_code == 304:
+        store.mark_unchanged(write_cursor, url, etag, last_modified)
+        fetch_retry.record_success(write_cursor, url)
+        unchanged_count += 1
+    elif r.status_code != 200:
+        will_retry = fetch_retry.record_failure(write_cursor, url, r.status_code)
+        logging.error(f"Could not fetch {url}: {r.status_code}" + ("" if will_retry else " (giving up)"))
+    elif args.refresh and blob_store.content_hash(r.content) == stored_hash(url):
+        # The server ignored our validators but the document is the same
+        store.mark_unchanged(write_cursor, url, etag, last_modified)
+        fetch_retry.record_success(write_cursor, url)
+        unchanged_count += 1
+    elif args.refresh:
+        logging.info(f"{url} has changed; keeping the previous version")
+        store.replace(write_cursor, url, r.content, r.encoding, r.headers.get('content-type'), etag, last_modified)
+        fetch_retry.record_success(write_cursor, url)
+        changed_count += 1
+    else:
+        store.save(write_cursor, url, r.content, r.encoding, r.headers.get('content-type'), etag, last_modified)
+        fetch_retry.record_success(write_cursor, url)
+    uncommitted += 1
+    if uncommitted >= args.commit_every:
+        conn.commit()
+        uncommitted = 0
 
-config = configparser.ConfigParser()
-config.read(args.database_config)
-my_user_agent = config['edgar']['useragent']
+conn.commit()
 
-for row in iterator:
-    url = row[0]
-    r = requests.get(url, headers={'User-Agent': my_user_agent})
-    if r.status_code != 200:
-        write_cursor.execute("insert into html_fetch_failures (url, status_code) values (%s, %s) on conflict (url) do update set status_code = %s, date_attempted = current_timestamp",
-                             [url, r.status_code, r.status_code])
-        logging.error(f"Could not fetch {url}: {r.status_code}")
-        conn.commit()
-        continue
-        time.sleep(1)
-    write_cursor.execute("insert into html_doc_cache (url, content, encoding, content_type) values (%s, %s, %s, %s)", [url, r.content, r.encoding, r.headers.get('content-type')])
-    conn.commit()
-    # Chill out so we don't hit rate limits
-    time.sleep(1)
+if args.refresh:
+    print(f"{unchanged_count} documents unchanged, {changed_count} changed")
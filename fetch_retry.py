@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""Decide whether and when a failed EDGAR download should be tried again.
+
+html_fetch_failures doubles as the retry queue: each url carries the
+number of attempts so far, the earliest time it may be retried, and
+whether it has been given up on."""
+
+import random
+
+BASE_DELAY_SECONDS = 60
+MAX_DELAY_SECONDS = 7 * 24 * 3600
+MAX_ATTEMPTS = 10
+
+# EDGAR answers 403 when a client goes over its request rate, so it is
+# treated like a 429 rather than as a permanent refusal.
+RETRYABLE_STATUS_CODES = {403, 408, 425, 429}
+
+
+def is_retryable(status_code):
+    """True if a failure with this status might succeed later.
+
+    A status_code of None means the request never got a response
+    (timeout, connection reset), which is always worth retrying.
+    """
+    if status_code is None:
+        return True
+    return status_code in RETRYABLE_STATUS_CODES or 500 <= status_code <= 599
+
+
+def backoff_delay(attempts, rng=random.random):
+    """Seconds to wait before the next try, after ``attempts`` failures.
+
+    Exponential in the attempt count, capped, with "equal jitter": a random
+    amount between half and all of the nominal delay, so a burst of
+    failures doesn't all come due at the same moment.
+    """
+    nominal = min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** max(0, attempts - 1))
+    return nominal / 2 + rng() * nominal / 2
+
+
+def record_failure(cursor, url, status_code):
+    """Add or update url in html_fetch_failures. Returns True if it will be retried."""
+    cursor.execute("select attempts from html_fetch_failures where url = %s", [url])
+    row = cursor.fetchone()
+    attempts = (row[0] if row is not None and row[0] is not None else 0) + 1
+    permanent = not is_retryable(status_code) or attempts >= MAX_ATTEMPTS
+    cursor.execute("""
+      insert into html_fetch_failures (url, status_code, attempts, permanent, next_attempt_after)
+      values (%s, %s, %s, %s, current_timestamp + make_interval(secs => %s))
+      on conflict (url) do update set
+         status_code = excluded.status_code,
+         attempts = excluded.attempts,
+         permanent = excluded.permanent,
+         next_attempt_after = excluded.next_attempt_after,
+         date_attempted = current_timestamp""",
+                   [url, status_code, attempts, permanent, backoff_delay(attempts)])
+    return not permanent
+
+
+def record_success(cursor, url):
+    cursor.execute("delete from html_fetch_failures where url = %s", [url])
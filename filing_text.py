@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""Turn a fetched filing into the cleaned-up text we send to OpenAI.
+
+The result is cached in filing_text_cache, keyed by url and
+CLEANER_VERSION, so each filing is only cleaned once no matter how many
+prompts use it or how often it is retried. Bump CLEANER_VERSION whenever
+clean_html() changes what it produces.
+
+clean_html() is the reference implementation, written with BeautifulSoup.
+fast_clean_html() produces exactly the same output in a single pass over
+lxml's parser events, and is what text_version() uses; see
+tests/test_filing_text.py and benchmark_filing_text.py."""
+
+import re
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+CLEANER_VERSION = 1
+
+
+class UnsupportedContentType(Exception):
+    def __init__(self, content_type):
+        super().__init__(f"Don't know how to turn {content_type} into text")
+        self.content_type = content_type
+
+
+def clean_html(raw_html):
+    soup = BeautifulSoup(raw_html, "lxml")
+
+    # Remove CSS and JS
+    for tag in soup(["style", "script"]):
+        tag.decompose()
+
+    # Remove empty tags
+    for tag in soup.find_all():
+        if not tag.get_text(strip=True):
+            tag.decompose()
+
+    # Remove known junk spans (invisible content)
+    for span in soup.find_all("span", style=True):
+        if span is None:
+            # this makes no sense at all
+            continue
+        if "style" not in span:
+            continue
+        if span["style"] is None:
+            # don't know how this can happen
+            continue
+        style = span["style"].lower()
+        if "visibility:hidden" in style or "font-size:3pt" in style:
+            span.decompose()
+
+    # Remove inline styles and classes
+    for tag in soup.find_all(True):
+        tag.attrs = {}
+
+    for tag in soup.find_all('font'):
+        tag.unwrap()
+
+    for tag in soup.find_all('a'):
+        tag.unwrap()
+
+    text_version = str(soup)
+    for tail_tag in ['</td>', '</tr>', '</li>', '</p>']:
+        text_version = text_version.replace(tail_tag, '')
+
+    while True:
+        space_reduction = text_version.replace('\n\n', '\n')
+        if space_reduction == text_version:
+            break
+        text_version = space_reduction
+    return text_version
+
+
+# What BeautifulSoup does to strings and tags, so that fast_clean_html()
+# can do the same thing without building a soup
+_ASCII_SPACES = set('\x20\x0a\x09\x0c\x0d')
+_PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+_STRING_CONTAINER_TAGS = {'rt', 'rp', 'template', 'style', 'script'}
+_DROPPED_TAGS = {'style', 'script'}
+_UNWRAPPED_TAGS = {'font', 'a'}
+_TAIL_TAGS = ['</td>', '</tr>', '</li>', '</p>']
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class _Element:
+    __slots__ = ['name', 'position', 'string_kinds', 'hidden_style', 'has_style_string']
+
+    def __init__(self, name, position, hidden_style):
+        self.name = name
+        # Index in the output of this element's start tag
+        self.position = position
+        # Which sorts of non-blank string are somewhere inside it (see _Cleaner.flush)
+        self.string_kinds = set()
+        self.hidden_style = hidden_style
+        self.has_style_string = False
+
+
+class _Cleaner:
+    """lxml parser target that writes out the cleaned document as it is parsed.
+
+    Whether an element is kept depends on everything inside it, so each
+    start tag is written as a placeholder. When the element ends, the
+    placeholder is filled in, left empty (unwrapped tags), or the element
+    and everything after its placeholder is deleted. Nothing is ever
+    copied more than once, so it is linear however deep the nesting is.
+    """
+
+    def __init__(self):
+        self.output = []
+        self.stack = []
+        self.pending = []
+        self.dropping = 0
+        self.preserving = 0
+        self.containers = []
+
+    def flush(self, prefix='', suffix='', escape=True):
+        # BeautifulSoup's endData(): merge the pending text into one string,
+        # squashing strings of nothing but ASCII whitespace
+        text = ''.join(self.pending)
+        self.pending = []
+        if not self.preserving and all(c in _ASCII_SPACES for c in text):
+            text = '\n' if '\n' in text else ' '
+        if self.dropping:
+            return
+        if self.stack:
+            parent = self.stack[-1]
+            if text == 'style':
+                parent.has_style_string = True
+            if escape and text.strip():
+                # Text inside <rt>, <rp> and <template> is a different class of
+                # string in BeautifulSoup, and get_text() on an ordinary tag
+                # ignores it
+                parent.string_kinds.add(self.containers[-1] if self.containers else None)
+        self.output.append(prefix + (_escape(text) if escape else text) + suffix)
+
+    def start(self, tag, attrib):
+        if self.pending:
+            self.flush()
+        if tag in _STRING_CONTAINER_TAGS:
+            self.containers.append(tag)
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserving += 1
+        if tag in _DROPPED_TAGS:
+            self.dropping += 1
+        if self.dropping:
+            return
+        style = attrib.get('style') if tag == 'span' else None
+        hidden = style is not None and ('visibility:hidden' in style.lower() or 'font-size:3pt' in style.lower())
+        self.stack.append(_Element(tag, len(self.output), hidden))
+        self.output.append('')
+
+    def end(self, tag):
+        if self.pending:
+            self.flush()
+        if tag in _STRING_CONTAINER_TAGS:
+            self.containers.pop()
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self.preserving -= 1
+        if tag in _DROPPED_TAGS:
+            self.dropping -= 1
+            return
+        if self.dropping:
+            return
+        element = self.stack.pop()
+        if self.stack:
+            self.stack[-1].string_kinds |= element.string_kinds
+        wanted_kind = element.name if element.name in _STRING_CONTAINER_TAGS else None
+        if wanted_kind not in element.string_kinds:
+            del self.output[element.position:]
+        elif element.hidden_style and element.has_style_string:
+            # clean_html()'s check for invisible spans looks for a child
+            # string "style" rather than the attribute, so only fires then
+            del self.output[element.position:]
+        elif element.name not in _UNWRAPPED_TAGS:
+            self.output[element.position] = '<' + element.name + '>'
+            self.output.append('</' + element.name + '>')
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def comment(self, text):
+        if self.pending:
+            self.flush()
+        self.pending.append(text)
+        self.flush('<!--', '-->', escape=False)
+
+    def pi(self, target, data):
+        if self.pending:
+            self.flush()
+        self.pending.append(target + ' ' + data)
+        self.flush('<?', '>', escape=False)
+
+    def doctype(self, name, pubid, system):
+        if self.pending:
+            self.flush()
+        value = name or ''
+        if pubid is not None:
+            value += ' PUBLIC "%s"' % pubid
+            if system is not None:
+                value += ' "%s"' % system
+        elif system is not None:
+            value += ' SYSTEM "%s"' % system
+        self.pending.append(value)
+        self.flush('<!DOCTYPE ', '>\n', escape=False)
+
+    def close(self):
+        if self.pending:
+            self.flush()
+        return ''.join(self.output)
+
+
+def fast_clean_html(raw_html):
+    """The same as clean_html(), but in one pass and without BeautifulSoup."""
+    if raw_html.startswith('\ufeff'):
+        raw_html = raw_html[1:]
+    try:
+        parser = etree.HTMLParser(target=_Cleaner(), recover=True)
+        parser.feed(raw_html)
+        text_version = parser.close()
+    except (UnicodeDecodeError, LookupError, etree.ParserError):
+        # BeautifulSoup's fallback when lxml won't take a str
+        parser = etree.HTMLParser(target=_Cleaner(), recover=True, encoding='utf8')
+        parser.feed(raw_html.encode('utf8'))
+        text_version = parser.close()
+    for tail_tag in _TAIL_TAGS:
+        text_version = text_version.replace(tail_tag, '')
+    return re.sub('\n\n+', '\n', text_version)
+
+
+def text_version(raw, encoding, content_type):
+    """Return the text to send to OpenAI for a document's raw bytes."""
+    if content_type == 'text/plain':
+        text = bytes(raw).decode(encoding)
+    elif content_type == 'text/html':
+        text = fast_clean_html(bytes(raw).decode(encoding))
+    else:
+        raise UnsupportedContentType(content_type)
+    # Postgres text can't hold NULs, so take them out here rather than in
+    # save(); then the text used straight away is the same as the cached text
+    return text.replace('\x00', '')
+
+
+def save(cursor, url, text):
+    cursor.execute(
+        """insert into filing_text_cache (url, cleaner_version, text_version)
+           values (%s, %s, %s)
+           on conflict (url, cleaner_version) do update set
+              text_version = excluded.text_version,
+              date_prepared = current_timestamp""",
+        [url, CLEANER_VERSION, text],
+    )
@@ -12,6 +12,7 @@ parser.add_argument("--url")
 args = parser.parse_args()
 
 import pgconnect
+import doc_store
 import sys
 conn = pgconnect.connect(args.database_config)
 read_cursor = conn.cursor()
@@ -40,11 +41,11 @@ if args.url is None:
 if args.url is not None:
     url = args.url
 
-read_cursor.execute("select content, encoding from html_doc_cache where url = %s", [url])
-row = read_cursor.fetchone()
+store = doc_store.from_config(args.database_config)
+row = store.load(read_cursor, url)
 if row is None:
     sys.exit("URL has not been fetched")
-bytes = row[0].tobytes()
-print(bytes.decode(row[1]))
+bytes, encoding, content_type = row
+print(bytes.decode(encoding))
 #print(type(bytes))
 #print(dir(bytes))
@@ -22,27 +22,29 @@ read_cursor = conn.cursor()
 if args.table_id is None:
     if args.cikcode is None or args.accession_number is None or args.table_number is None:
         sys.exit("Must supply either --table-id or else all of --cikcode, --accession-number and --table-number")
-    read_cursor.execute("select html from filing_tables where cikcode = %s and accession_number = %s and table_number = %s", [args.cikcode, args.accession_number, args.table_number])
+    read_cursor.execute("select table_id, html from filing_tables where cikcode = %s and accessionnumber = %s and table_number = %s", [args.cikcode, args.accession_number, args.table_number])
 if args.table_id is not None:
     if args.cikcode is not None or args.accession_number is not None or args.table_number is not None:
         sys.exit("If --table-id is given, there is no need to supply --cikcode, --accession-number or --table-number")
-    read_cursor.execute("select html from filing_tables where table_id = %s", [args.table_id])
+    read_cursor.execute("select table_id, html from filing_tables where table_id = %s", [args.table_id])
 
 row = read_cursor.fetchone()
 if row is None:
     sys.exit("No such table")
 
-content = row[0]
+table_id, content = row
 if args.html:
     # Maybe pretty print it somehow?
     print(content)
 
 if args.csv:
     import pandas
-    from html_table_extractor.extractor import Extractor
-    extraction = Extractor(content)
-    extraction.parse()
-    the_table = pandas.DataFrame(extraction.return_list())
+    import table_cells
+    cells = table_cells.load(read_cursor, table_id)
+    if cells is None:
+        # extract_table_cells.py hasn't got to this one yet
+        cells = table_cells.grid(content)
+    the_table = pandas.DataFrame(table_cells.as_rows(cells))
     #tables = pandas.read_html(content)
     #the_table = tables[0]
     the_table.to_csv(sys.stdout, index=False)
@@ -29,6 +29,7 @@ parser.add_argument("--random-order",
 args = parser.parse_args()
 
 import pgconnect
+import bulk_writer
 import logging
 import pandas
 import functools
@@ -52,6 +53,7 @@ nlp = spacy.load('en_core_web_sm')
 conn = pgconnect.connect(args.database_config)
 read_cursor = conn.cursor()
 write_cursor = conn.cursor()
+writer = bulk_writer.BulkWriter(write_cursor)
 
 constraints = []
 constraint_args = []
@@ -103,29 +105,34 @@ for row in iterator:
     doc = nlp(plaintext)
     write_cursor.execute("insert into spacy_parses (cikcode, accessionNumber, document_position, spacy_blob) values (%s, %s, %s, %s)",
                          [cikcode, accession_number, document_position, doc.to_bytes()])
-    for (i,sent) in enumerate(doc.sents):
-        write_cursor.execute("insert into sentences (cikcode, accessionNumber, document_position, sentence_number_within_fragment, sentence_text) values (%s, %s, %s, %s, %s) returning sentence_id",
-                             [cikcode, accession_number, document_position, i+1, str(sent)])
-        srow = write_cursor.fetchone()
-        sentence_id = srow[0]
+    sents = list(doc.sents)
+    # Postgres doesn't promise RETURNING rows in VALUES order, so match them
+    # up by sentence number
+    sentence_ids = dict((number, sentence_id) for sentence_id, number in bulk_writer.insert_returning(
+        write_cursor,
+        "insert into sentences (cikcode, accessionNumber, document_position, sentence_number_within_fragment, sentence_text) values %s returning sentence_id, sentence_number_within_fragment",
+        [(cikcode, accession_number, document_position, i+1, str(sent)) for (i,sent) in enumerate(sents)]))
+    for i, sent in enumerate(sents):
+        sentence_id = sentence_ids[i+1]
         seen_ents = set()
         for ent in sent.ents:
             if str((ent,ent.label_)) not in seen_ents:
-                write_cursor.execute("insert into named_entities (sentence_id, named_entity, label) values (%s,%s, %s)",
-                                     [sentence_id, str(ent), ent.label_])
+                writer.add("insert into named_entities (sentence_id, named_entity, label) values %s",
+                           (sentence_id, str(ent), ent.label_))
                 seen_ents.update([str((ent,ent.label_))])
         noun_chunks = collections.defaultdict(int)
         for chunk in sent.noun_chunks:
             noun_chunks[str(chunk)] += 1
         for noun_chunk, ncount in noun_chunks.items():
-            write_cursor.execute("insert into noun_chunks (sentence_id, noun_chunk, repeat_count) values (%s, %s, %s)", [sentence_id, str(noun_chunk), ncount])
+            writer.add("insert into noun_chunks (sentence_id, noun_chunk, repeat_count) values %s", (sentence_id, str(noun_chunk), ncount))
         pronouns = collections.defaultdict(int)
         for word in sent:
             if word.tag_.startswith('PRP'):
                 pronouns[(str(word), word.tag_)] += 1
         for prep, count in pronouns.items():
-            write_cursor.execute("insert into pronouns (sentence_id, pronoun, tag, repeat_count) values (%s, %s, %s, %s)",
-                                 [sentence_id, prep[0], prep[1], count])
+            writer.add("insert into pronouns (sentence_id, pronoun, tag, repeat_count) values %s",
+                       (sentence_id, prep[0], prep[1], count))
+    writer.flush()
     conn.commit()
     
 logging.info("Completed")
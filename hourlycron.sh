@@ -67,18 +67,18 @@ do_batchcheck() {
 run_batchfetch() {
     local start
     start=$(date +%s)
-    log "START  uv run batchfetch.py --show-costs"
+    log "START  uv run batch_jobs.py --fetch --show-costs"
 
-    if uv run batchfetch.py --show-costs; then
+    if uv run batch_jobs.py --fetch --show-costs; then
         local elapsed
         elapsed=$(( $(date +%s) - start ))
-        log "SUCCESS uv run batchfetch.py --show-costs (took ${elapsed}s)"
+        log "SUCCESS uv run batch_jobs.py --fetch --show-costs (took ${elapsed}s)"
         return 0
     else
         local status=$?
         local elapsed
         elapsed=$(( $(date +%s) - start ))
-        log "FAILURE uv run batchfetch.py --show-costs (exit ${status}, took ${elapsed}s)"
+        log "FAILURE uv run batch_jobs.py --fetch --show-costs (exit ${status}, took ${elapsed}s)"
         return ${status}
     fi
 }
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""Pull the tables out of an HTML document without building the whole tree.
+
+iter_tables() feeds the document to lxml's incremental HTML parser (the one
+behind iterparse) a piece at a time, and yields each <table> as soon as it
+closes. Tables are numbered in the order they start,
+which is the order BeautifulSoup's find_all('table') finds them in, and a
+nested table appears both on its own and inside the table around it.
+Everything outside a table is thrown away as soon as it has been parsed,
+so memory stays flat however long the filing is.
+"""
+
+import lxml.etree
+import lxml.html
+
+FEED_SIZE = 65536
+
+
+def _events(raw, encoding):
+    parser = lxml.etree.HTMLPullParser(events=("start", "end"), huge_tree=True, remove_comments=True)
+    document = raw
+    if encoding is not None:
+        # lxml can't be told the encoding of a pull parser's input, so it is given text instead
+        try:
+            document = raw.decode(encoding, errors="replace")
+        except LookupError:
+            pass
+    for offset in range(0, len(document), FEED_SIZE):
+        parser.feed(document[offset:offset + FEED_SIZE])
+        yield from parser.read_events()
+    try:
+        parser.close()
+    except lxml.etree.XMLSyntaxError:
+        # Nothing in it that looks like HTML at all
+        return
+    yield from parser.read_events()
+
+
+def iter_tables(raw, encoding=None):
+    """Yield (table number, table html) for every table in raw (bytes), numbered from 1."""
+    # Numbers of the tables we are inside, innermost last
+    open_tables = []
+    last_table_number = 0
+    for event, element in _events(raw, encoding):
+        if not isinstance(element.tag, str):
+            continue
+        tag = element.tag.lower()
+        if event == "start":
+            if tag == "table":
+                last_table_number += 1
+                open_tables.append(last_table_number)
+            continue
+        if tag == "table":
+            yield open_tables.pop(), lxml.html.tostring(element, encoding="unicode", with_tail=False)
+        if len(open_tables) == 0:
+            # Nothing still open needs this element any more
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
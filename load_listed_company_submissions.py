@@ -16,6 +16,16 @@ parser.add_argument("--progress",
 parser.add_argument("--only-cikcode",
                     type=int,
                     help="Only process one cikcode (for debugging)")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many processes to parse the zip with (default: one per CPU)")
+parser.add_argument("--batch-size",
+                    type=int,
+                    default=2000,
+                    help="How many companies to load into the database per transaction")
+parser.add_argument("--refresh",
+                    action="store_true",
+                    help="Skip companies whose zip member is unchanged since the last load, and only insert filings newer than the last one loaded")
 parser.add_argument("--verbose",
                     action="store_true",
                     help="Lots of debugging messages")
@@ -23,126 +33,200 @@ parser.add_argument("--verbose",
 args = parser.parse_args()
 
 
-import psycopg2.extras
+import csv
+import io
+import json
+import logging
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
 import pgconnect
-import logging
-import json
 
 
-if args.verbose:
-    logging.basicConfig(
-        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
-        level=logging.INFO,
-        datefmt='%Y-%m-%d %H:%M:%S')
-    logging.info("Starting")
+filing_columns = ['accessionNumber', 'filingDate', 'reportDate', 'acceptanceDateTime', 'act', 'form', 'fileNumber', 'filmNumber', 'items', 'size', 'isXBRL', 'isInlineXBRL', 'primaryDocument', 'primaryDocDescription']
+
+# Each worker process opens the zip once and keeps it
+worker_zip = None
 
-submissions = zipfile.ZipFile(args.submissions_zip)
-conn = pgconnect.connect(args.database_config)
-read_cursor = conn.cursor()
-write_cursor = conn.cursor()
 
-filing_columns = ['accessionNumber', 'filingDate', 'reportDate', 'acceptanceDateTime', 'act', 'form', 'fileNumber', 'filmNumber', 'items', 'size', 'isXBRL', 'isInlineXBRL', 'primaryDocument', 'primaryDocDescription']
-insertion_query = """
-insert into filings
-   (cikcode,
-    accessionNumber,
-    filingDate,
-    reportDate,
-    acceptanceDateTime,
-    act,
-    form,
-    fileNumber,
-    filmNumber,
-    items,
-    size,
-    isXBRL,
-    isInlineXBRL,
-    primaryDocument,
-    primaryDocDescription) values (
-     %s,%s,%s,
-     nullif(%s, '') :: date,
-     nullif(%s, '') :: date,
-     %s,%s,%s,%s,%s,%s,
-     %s :: boolean,
-     %s :: boolean,
-     %s,%s
-    )
-    on conflict on constraint filings_pkey do update set
-    filingDate = %s,
-    reportDate = nullif(%s, '') :: date,
-    acceptanceDateTime = nullif(%s, '') :: date,
-    act = %s,
-    form = %s,
-    fileNumber = %s,
-    filmNumber = %s,
-    items = %s,
-    size = %s,
-    isXBRL = %s :: boolean,
-    isInlineXBRL = %s :: boolean,
-    primaryDocument = %s,
-    primaryDocDescription = %s
-   """
-
-zip_entries = [entry for entry in submissions.namelist() if entry.startswith("CIK") and entry.endswith(".json")]
-
-if args.only_cikcode:
-    zip_entries = [f"CIK{args.only_cikcode:010d}.json"]
-
-if args.progress:
-    import tqdm
-    iterator = tqdm.tqdm(zip_entries)
-else:
-    iterator = zip_entries
-
-for entry in iterator:
-    # Check if filename is of the right format (CIK followed by numbers and .json)
-    if not (entry.startswith("CIK") and entry[3:-5].isdigit() and entry.endswith(".json")):
-        continue
-        
+def open_worker_zip(path):
+    global worker_zip
+    worker_zip = zipfile.ZipFile(path)
+
+
+def parse_member(work):
+    """Parse one CIK json out of the zip.
+
+    ``work`` is (zip entry name, its CRC, the newest accession number
+    already loaded or None). Returns (cikcode, crc, newest accession number,
+    json text, filing rows), with json text None if the company has no
+    tickers, or None if the member couldn't be read. Runs in a worker process.
+    """
+    entry, crc, known_latest_accession = work
     cikcode = int(entry[3:-5])
-    
     try:
-        source_data = submissions.read(entry)
+        source_data = worker_zip.read(entry)
         json_data = json.loads(source_data)
-        
-        # Skip entries without "tickers" key or with empty tickers
-        if "tickers" not in json_data or not json_data["tickers"]:
-            logging.info(f"Skipping {entry}: No tickers found")
-            continue
-            
     except Exception as e:
         logging.error(f"Error processing {entry}: {str(e)}")
-        continue
-    json_data = json.loads(source_data)
-    data = psycopg2.extras.Json(json_data)
-    write_cursor.execute("select count(*) from submissions_raw where jsonb_extract_path_text(submission,'cik') :: int = %s ", [cikcode])
-    c = write_cursor.fetchone()
-    if c is None:
-        logging.critical(f"Cannot even count the number of submissions with cikcode = {cikcode}")
-        continue
-    if c[0] == 0:
-        logging.info(f"cikcode {cikcode} is new")
-        write_cursor.execute("insert into submissions_raw(submission) values (%s)", [data])
-    else:
-        logging.info(f"Updating existing cikcode {cikcode}")
-        write_cursor.execute("update submissions_raw set submission = %s where jsonb_extract_path_text(submission,'cik') :: int = %s", [data, cikcode])
-    # Store the filing information in a separate table
-    logging.info(f"Cikcode = {cikcode} has {len(json_data['filings']['recent']['accessionNumber'])} rows")
-    for i in range(len(json_data['filings']['recent']['accessionNumber'])):
+        return None
+    # Skip entries without "tickers" key or with empty tickers. None of
+    # their filings get loaded, so there is no latest accession to record.
+    if "tickers" not in json_data or not json_data["tickers"]:
+        return cikcode, crc, None, None, []
+    recent = json_data['filings']['recent']
+    accession_numbers = recent.get('accessionNumber', [])
+    latest_accession = accession_numbers[0] if accession_numbers else None
+    filing_rows = []
+    for i in range(len(accession_numbers)):
+        # Filings are listed newest first, so everything from here on is already loaded
+        if known_latest_accession is not None and accession_numbers[i] == known_latest_accession:
+            break
         def get_column(x):
-            column = json_data['filings']['recent'][x]
+            column = recent.get(x, [])
             if i < len(column):
                 return column[i]
             else:
                 return None
         if get_column('accessionNumber') is None:
             continue
-        insert_data = [cikcode] + [get_column(x) for x in filing_columns]
-        update_data = [get_column(x) for x in filing_columns[1:]]
-        #+ [cikcode, json_data['filings']['recent']['accessionNumber'][i]]
-        write_cursor.execute(insertion_query, insert_data + update_data)
-    conn.commit()
+        filing_rows.append([cikcode] + [get_column(x) for x in filing_columns])
+    return cikcode, crc, latest_accession, source_data.decode('utf-8'), filing_rows
+
 
-write_cursor.execute('refresh materialized view cik2ticker')
-conn.commit()
+def copy_rows(cursor, table, columns, rows):
+    # csv.QUOTE_NOTNULL leaves None unquoted, which COPY reads as NULL,
+    # while a genuine empty string is quoted and stays an empty string.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+    writer.writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"copy {table} ({', '.join(columns)}) from stdin with (format csv)", buffer)
+
+
+def load_batch(cursor, parsed, only_new_filings):
+    submissions = [(cikcode, text) for cikcode, _, _, text, _ in parsed if text is not None]
+    filing_rows = [row for _, _, _, _, rows in parsed for row in rows]
+    fingerprints = [(cikcode, crc, latest) for cikcode, crc, latest, _, _ in parsed]
+    cursor.execute("truncate submissions_staging, filings_staging, fingerprints_staging")
+    copy_rows(cursor, "submissions_staging", ["cikcode", "submission"], submissions)
+    copy_rows(cursor, "filings_staging", ["cikcode"] + filing_columns, filing_rows)
+    copy_rows(cursor, "fingerprints_staging", ["cikcode", "zip_crc", "latest_accession"], fingerprints)
+    cursor.execute("""
+      insert into submissions_raw (submission)
+      select submission from submissions_staging
+      on conflict (cikcode)
+      do update set submission = excluded.submission""")
+    cursor.execute("""
+      insert into filings
+         (cikcode, accessionNumber, filingDate, reportDate, acceptanceDateTime, act, form,
+          fileNumber, filmNumber, items, size, isXBRL, isInlineXBRL, primaryDocument, primaryDocDescription)
+      select distinct on (cikcode, accessionNumber)
+             cikcode, accessionNumber, filingDate :: date,
+             nullif(reportDate, '') :: date,
+             nullif(acceptanceDateTime, '') :: date,
+             act, form, fileNumber, filmNumber, items, size :: int,
+             isXBRL :: boolean, isInlineXBRL :: boolean,
+             primaryDocument, primaryDocDescription
+        from filings_staging
+      on conflict on constraint filings_pkey do """ + ("nothing" if only_new_filings else """update set
+         filingDate = excluded.filingDate,
+         reportDate = excluded.reportDate,
+         acceptanceDateTime = excluded.acceptanceDateTime,
+         act = excluded.act,
+         form = excluded.form,
+         fileNumber = excluded.fileNumber,
+         filmNumber = excluded.filmNumber,
+         items = excluded.items,
+         size = excluded.size,
+         isXBRL = excluded.isXBRL,
+         isInlineXBRL = excluded.isInlineXBRL,
+         primaryDocument = excluded.primaryDocument,
+         primaryDocDescription = excluded.primaryDocDescription"""))
+    cursor.execute("""
+      insert into submission_fingerprints (cikcode, zip_crc, latest_accession)
+      select cikcode, zip_crc, latest_accession from fingerprints_staging
+      on conflict (cikcode) do update set
+         zip_crc = excluded.zip_crc,
+         latest_accession = excluded.latest_accession,
+         date_loaded = current_timestamp""")
+    return len(submissions), len(filing_rows)
+
+
+if __name__ == '__main__':
+    if args.verbose:
+        logging.basicConfig(
+            format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+            level=logging.INFO,
+            datefmt='%Y-%m-%d %H:%M:%S')
+        logging.info("Starting")
+
+    submissions = zipfile.ZipFile(args.submissions_zip)
+    conn = pgconnect.connect(args.database_config)
+    write_cursor = conn.cursor()
+
+    write_cursor.execute("create temporary table submissions_staging (cikcode int, submission jsonb)")
+    write_cursor.execute("create temporary table filings_staging (cikcode int, " +
+                         ", ".join(f"{column} varchar" for column in filing_columns) + ")")
+    write_cursor.execute("create temporary table fingerprints_staging (cikcode int, zip_crc bigint, latest_accession varchar)")
+
+    # Check if filename is of the right format (CIK followed by numbers and .json)
+    zip_infos = [info for info in submissions.infolist()
+                 if info.filename.startswith("CIK") and info.filename.endswith(".json") and info.filename[3:-5].isdigit()]
+
+    if args.only_cikcode:
+        wanted = f"CIK{args.only_cikcode:010d}.json"
+        zip_infos = [info for info in zip_infos if info.filename == wanted]
+
+    fingerprints = {}
+    if args.refresh:
+        write_cursor.execute("select cikcode, zip_crc, latest_accession from submission_fingerprints")
+        fingerprints = {cikcode: (crc, latest) for cikcode, crc, latest in write_cursor}
+
+    # The central directory gives us each member's CRC without decompressing it
+    zip_entries = []
+    unchanged = 0
+    for info in zip_infos:
+        known_crc, known_latest = fingerprints.get(int(info.filename[3:-5]), (None, None))
+        if known_crc == info.CRC:
+            unchanged += 1
+            continue
+        zip_entries.append((info.filename, info.CRC, known_latest))
+    if args.refresh:
+        logging.info(f"{unchanged} companies are unchanged, {len(zip_entries)} need loading")
+
+    if args.progress:
+        import tqdm
+        progress = tqdm.tqdm(total=len(zip_entries))
+
+    batches = [zip_entries[i:i + args.batch_size] for i in range(0, len(zip_entries), args.batch_size)]
+    companies_loaded = 0
+    filings_loaded = 0
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=open_worker_zip,
+                             initargs=(args.submissions_zip,)) as pool:
+        # While one batch is being written, the workers parse the next one
+        pending = None
+        for batch in batches + [None]:
+            upcoming = None
+            if batch is not None:
+                upcoming = (batch, pool.map(parse_member, batch, chunksize=64))
+            if pending is not None:
+                pending_batch, results = pending
+                parsed = [result for result in results if result is not None]
+                companies, filings = load_batch(write_cursor, parsed, args.refresh)
+                conn.commit()
+                companies_loaded += companies
+                filings_loaded += filings
+                logging.info(f"Loaded {companies} companies with {filings} filings, up to {pending_batch[-1][0]}")
+                if args.progress:
+                    progress.update(len(pending_batch))
+            pending = upcoming
+
+    if args.progress:
+        progress.close()
+    print(f"Loaded {companies_loaded} companies with {filings_loaded} filings" +
+          (f"; skipped {unchanged} unchanged companies" if args.refresh else ""))
+
+    write_cursor.execute('refresh materialized view cik2ticker')
+    conn.commit()
@@ -3,6 +3,7 @@
 import argparse
 import json
 import pgconnect
+import request_ledger
 
 parser = argparse.ArgumentParser(description="Look up batch ID from OpenAI error record")
 parser.add_argument("--database-config",
@@ -33,7 +34,8 @@ if not batch_req_id:
     print("Error: No 'id' field found in JSON")
     exit(1)
 
-# Extract the custom_id (URL)
+# Extract the custom_id (a request id from the openai_requests ledger, or the
+# URL in batches from before the ledger)
 url = record.get('custom_id')
 if not url:
     print("Error: No 'custom_id' field found in JSON")
@@ -44,17 +46,25 @@ conn = pgconnect.connect(args.database_config)
 cursor = conn.cursor()
 
 # Look up the batch ID from the URL
-cursor.execute("""
-    SELECT de.batch_id, deb.openai_batch_id, deb.when_sent, deb.when_retrieved
-    FROM director_extractions de
-    JOIN director_extract_batches deb ON de.batch_id = deb.id
-    WHERE de.url = %s
-""", [url])
+if request_ledger.is_ledger_id(url):
+    cursor.execute("""
+        SELECT r.batch_id, deb.openai_batch_id, deb.when_sent, deb.when_retrieved, r.url
+        FROM openai_requests r
+        JOIN director_extract_batches deb ON r.batch_id = deb.id
+        WHERE r.id = %s
+    """, [int(url)])
+else:
+    cursor.execute("""
+        SELECT de.batch_id, deb.openai_batch_id, deb.when_sent, deb.when_retrieved, de.url
+        FROM director_extractions de
+        JOIN director_extract_batches deb ON de.batch_id = deb.id
+        WHERE de.url = %s
+    """, [url])
 
 result = cursor.fetchone()
 
 if result:
-    batch_id, openai_batch_id, when_sent, when_retrieved = result
+    batch_id, openai_batch_id, when_sent, when_retrieved, url = result
     print(f"Batch ID: {batch_id}")
     print(f"OpenAI Batch ID: {openai_batch_id}")
     print(f"When sent: {when_sent}")
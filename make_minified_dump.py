@@ -102,7 +102,7 @@ def main():
         "-U", dst["user"],
         dst["dbname"],
         "-c",
-        "UPDATE html_doc_cache SET content = NULL;",
+        "UPDATE html_doc_cache SET content = NULL, codec = NULL; UPDATE html_doc_versions SET content = NULL, codec = NULL; TRUNCATE filing_text_cache;",
     ], check=True, env=dst_env)
     subprocess.run([
         "psql",
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Move fetched filings between html_doc_cache.content and the on-disk blob store.
+
+  migrate_blob_store.py out   -- write each document to the blob store and
+                                 null out html_doc_cache.content
+  migrate_blob_store.py in    -- read each document back from the blob store
+                                 into html_doc_cache.content, compressed
+                                 with the configured codec
+
+Blobs are never deleted; they are content-addressed and may be shared by
+several urls. Each chunk is committed separately, so an interrupted run can
+simply be started again."""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("direction",
+                    choices=["out", "in"],
+                    help="'out' moves documents from postgres to the blob store, 'in' moves them back")
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=200,
+                    help="How many documents to move per transaction")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Stop after moving this many documents")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+args = parser.parse_args()
+
+import logging
+import sys
+
+import doc_store
+import pgconnect
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+
+store = doc_store.from_config(args.database_config)
+if store.blobs is None:
+    sys.exit("Set blob_directory in the [storage] section of the config first")
+
+conn = pgconnect.connect(args.database_config)
+read_cursor = conn.cursor()
+write_cursor = conn.cursor()
+
+if args.direction == "out":
+    pending = "content is not null"
+else:
+    pending = "content is null and content_sha256 is not null"
+
+read_cursor.execute(f"select count(*) from html_doc_cache where {pending}")
+total = read_cursor.fetchone()[0]
+if args.stop_after is not None:
+    total = min(total, args.stop_after)
+
+if args.progress:
+    import tqdm
+    progress = tqdm.tqdm(total=total)
+
+last_url = ''
+moved = 0
+while moved < total:
+    limit = min(args.rows_per_chunk, total - moved)
+    read_cursor.execute(f"""
+      select url, content, codec, content_sha256
+        from html_doc_cache
+       where {pending}
+         and url > %s
+    order by url
+       limit %s""", [last_url, limit])
+    chunk = read_cursor.fetchall()
+    if len(chunk) == 0:
+        break
+    for url, content, codec, content_sha256 in chunk:
+        raw = store.decode(content, codec, content_sha256)
+        if args.direction == "out":
+            digest = store.blobs.put(raw)
+            if content_sha256 is not None and content_sha256 != digest:
+                logging.warning(f"{url} had recorded hash {content_sha256} but its content hashes to {digest}")
+            write_cursor.execute("update html_doc_cache set content = null, codec = null, content_sha256 = %s where url = %s",
+                                 [digest, url])
+        else:
+            write_cursor.execute("update html_doc_cache set content = %s, codec = %s where url = %s",
+                                 [doc_store.compress(raw, store.codec), store.codec, url])
+    conn.commit()
+    last_url = chunk[-1][0]
+    moved += len(chunk)
+    if args.progress:
+        progress.update(len(chunk))
+    logging.info(f"Moved {moved} documents {args.direction}, up to {last_url}")
+
+if args.progress:
+    progress.close()
+print(f"Moved {moved} documents {args.direction}")
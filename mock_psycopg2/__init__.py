@@ -5,7 +5,7 @@ class DummyCursor:
         return None
 
 class DummyConnection:
-    def cursor(self):
+    def cursor(self, *args, **kwargs):
         return DummyCursor()
     def commit(self):
         pass
@@ -31,6 +31,8 @@ parser.add_argument("--max-words-per-nes-range",
 args = parser.parse_args()
 
 import pgconnect
+import bulk_writer
+import doc_store
 import logging
 import sys
 import nltk
@@ -45,8 +47,9 @@ if args.verbose:
 
 
 conn = pgconnect.connect(args.database_config)
+store = doc_store.from_config(args.database_config)
 read_cursor = conn.cursor()
-write_cursor = conn.cursor()
+writer = bulk_writer.BulkWriter(conn.cursor())
 
 constraints = []
 constraint_args = []
@@ -62,7 +65,7 @@ else:
     constraints = " AND " + (' and '.join(constraints))
 
 query = """
-select filings.cikcode, filings.accessionnumber, content, encoding
+select filings.cikcode, filings.accessionnumber, content, codec, content_sha256, encoding
 from filings
 join html_doc_cache on (url = document_storage_url)
 left join naively_extracted_sentences using (cikcode, accessionnumber)
@@ -84,14 +87,14 @@ else:
 for row in iterator:
     cikcode = row[0]
     accession_number = row[1]
-    raw_content = row[2]
-    encoding = row[3]
+    raw_content = store.decode(row[2], row[3], row[4])
+    encoding = row[5]
 
     logging.info(f"Processing {cikcode=}, {accession_number=}")
     if args.progress:
         iterator.set_description(f"{cikcode} {accession_number}")
 
-    content = raw_content.tobytes().decode(encoding)
+    content = raw_content.decode(encoding)
     soup = BeautifulSoup(content, features="lxml")
 
     execute_args = []
@@ -100,14 +103,14 @@ for row in iterator:
     saved_ranges = set()
     for i,sent in enumerate(nltk.sent_tokenize(soup.text)):
         sentence_length = len(nltk.word_tokenize(sent))
-        write_cursor.execute("insert into naively_extracted_sentences (cikcode, accessionNumber, position_in_document, word_count, sentence_text) values (%s, %s, %s, %s, %s)",
-                             [cikcode,
-                              accession_number,
-                              i,
-                              sentence_length,
-                              sent
-                              ]
-                             )
+        writer.add("insert into naively_extracted_sentences (cikcode, accessionNumber, position_in_document, word_count, sentence_text) values %s",
+                   (cikcode,
+                    accession_number,
+                    i,
+                    sentence_length,
+                    sent
+                    )
+                   )
         sentence_lengths.append(sentence_length)
         total_tokens_so_far = sum(sentence_lengths[nes_range_start:])
         if total_tokens_so_far >= args.max_words_per_nes_range:
@@ -117,11 +120,11 @@ for row in iterator:
             logging.info(f"Creating a range from sentences {nes_range_start} to {nes_end_range}")
             saved_ranges.update([(nes_range_start, nes_end_range)])
             
-            write_cursor.execute("insert into nes_ranges (cikcode, accessionnumber, starting_sentence, ending_sentence) values (%s,%s,%s,%s)",
-                                 [cikcode,
-                                  accession_number,
-                                  nes_range_start,
-                                  nes_end_range])
+            writer.add("insert into nes_ranges (cikcode, accessionnumber, starting_sentence, ending_sentence) values %s",
+                       (cikcode,
+                        accession_number,
+                        nes_range_start,
+                        nes_end_range))
             how_much_overlap = int((nes_end_range - nes_range_start) * args.overlap)
             logging.info(f"Calculated {how_much_overlap} for sentence overlap count (we are at sentence {i}).")
             new_nes_range_start = i - how_much_overlap
@@ -135,11 +138,12 @@ for row in iterator:
 
     if (nes_range_start,i) not in saved_ranges:
         logging.info(f"Wrapping up the last range: {nes_range_start} to {i}")
-        write_cursor.execute("insert into nes_ranges (cikcode, accessionnumber, starting_sentence, ending_sentence) values (%s,%s,%s,%s)",
-                             [cikcode,
-                              accession_number,
-                              nes_range_start,
-                              i])
+        writer.add("insert into nes_ranges (cikcode, accessionnumber, starting_sentence, ending_sentence) values %s",
+                   (cikcode,
+                    accession_number,
+                    nes_range_start,
+                    i))
     else:
         logging.info(f"Somehow, we already had the range {nes_range_start} to {i} saved")
+    writer.flush()
     conn.commit()
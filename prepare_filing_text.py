@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""Clean fetched filings into filing_text_cache ahead of time.
+
+ask_openai_bulk.py and extract_director_compensation.py fill the cache as
+they go, but cleaning is the slow part of building a batch. Running this
+first does it once per filing, in parallel, so the batch builders only
+read text back out of the cache."""
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--form",
+                    default="DEF 14A",
+                    help="Which form to prepare text for")
+parser.add_argument("--workers",
+                    type=int,
+                    help="How many processes to clean documents with (default: one per CPU)")
+parser.add_argument("--rows-per-chunk",
+                    type=int,
+                    default=200,
+                    help="How many documents to clean per transaction")
+parser.add_argument("--stop-after",
+                    type=int,
+                    help="Stop after preparing this many documents")
+parser.add_argument("--progress",
+                    action="store_true",
+                    help="Show a progress bar")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+args = parser.parse_args()
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import doc_store
+import filing_text
+import pgconnect
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+
+
+def clean(work):
+    """Runs in a worker process. Returns (url, text), with text None if it can't be cleaned."""
+    url, raw, encoding, content_type = work
+    try:
+        return url, filing_text.text_version(raw, encoding, content_type)
+    except filing_text.UnsupportedContentType:
+        return url, None
+
+
+if __name__ == '__main__':
+    store = doc_store.from_config(args.database_config)
+    conn = pgconnect.connect(args.database_config)
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+
+    pending = """
+        from html_doc_cache
+       where exists (select 1 from filings
+                      where filings.document_storage_url = html_doc_cache.url
+                        and filings.form = %s)
+         and not exists (select 1 from filing_text_cache
+                          where filing_text_cache.url = html_doc_cache.url
+                            and filing_text_cache.cleaner_version = %s)"""
+    read_cursor.execute("select count(*)" + pending,
+                        [args.form, filing_text.CLEANER_VERSION])
+    total = read_cursor.fetchone()[0]
+    if args.stop_after is not None:
+        total = min(total, args.stop_after)
+
+    if args.progress:
+        import tqdm
+        progress = tqdm.tqdm(total=total)
+
+    last_url = ''
+    prepared = 0
+    skipped = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while prepared + skipped < total:
+            limit = min(args.rows_per_chunk, total - prepared - skipped)
+            read_cursor.execute(
+                "select url, content, codec, content_sha256, encoding, content_type" +
+                pending + " and url > %s order by url limit %s",
+                [args.form, filing_text.CLEANER_VERSION, last_url, limit])
+            chunk = read_cursor.fetchall()
+            if len(chunk) == 0:
+                break
+            work = [(url, store.decode(content, codec, content_sha256), encoding, content_type)
+                    for url, content, codec, content_sha256, encoding, content_type in chunk]
+            for url, text in pool.map(clean, work):
+                if text is None:
+                    skipped += 1
+                    logging.info(f"Skipping {url}: not text or html")
+                    continue
+                filing_text.save(write_cursor, url, text)
+                prepared += 1
+            conn.commit()
+            last_url = chunk[-1][0]
+            if args.progress:
+                progress.update(len(chunk))
+            logging.info(f"Prepared {prepared} documents, up to {last_url}")
+
+    if args.progress:
+        progress.close()
+    print(f"Prepared {prepared} documents; skipped {skipped} that weren't text or html")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""Keep batch requests to OpenAI within a token budget.
+
+A filing whose cleaned text is too big for one request is cut down to the
+sections under director-related headings (from every_textual.py's
+document_headings), and if that is still too big, split into several
+chunks. Each chunk is its own request, with a custom_id that says which
+chunk of which url it is, and batchfetch.py merges the directors found in
+each chunk back into a single director_extraction_raw row.
+
+Token counts come from tiktoken if it is installed, and are otherwise
+estimated from the length of the text."""
+
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_MAX_PROMPT_TOKENS = 60000
+CHARS_PER_TOKEN = 4
+TIKTOKEN_ENCODING = "o200k_base"
+
+DIRECTOR_HEADING = re.compile(r"director|nominee|board|election|governance", re.IGNORECASE)
+
+_CHUNK_MARKER = re.compile(r"^(.*)#chunk(\d+)of(\d+)$")
+
+_encoder = None
+
+
+def estimate_tokens(text):
+    """How many tokens text is likely to be for the model."""
+    global _encoder
+    if tiktoken is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    if _encoder is None:
+        _encoder = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    return len(_encoder.encode(text, disallowed_special=()))
+
+
+def chunk_custom_id(url, index, count):
+    """custom_id for chunk ``index`` (counting from 0) of ``count`` chunks of url."""
+    return f"{url}#chunk{index + 1}of{count}"
+
+
+def split_custom_id(custom_id):
+    """Return (url, chunk index, chunk count), with None for both if it wasn't chunked."""
+    match = _CHUNK_MARKER.match(custom_id)
+    if match is None:
+        return custom_id, None, None
+    return match.group(1), int(match.group(2)) - 1, int(match.group(3))
+
+
+def director_sections(cursor, cikcode, accession_number, text):
+    """The parts of text under director-related headings.
+
+    Headings come from document_headings and are looked for in text in
+    document order; each section runs up to the next heading that was
+    found. Returns [] if the filing hasn't been through every_textual.py or
+    none of its director headings can be found in text.
+    """
+    cursor.execute("""
+      select heading_text from document_headings
+       where cikcode = %s and accessionNumber = %s
+    order by document_position""", [cikcode, accession_number])
+    boundaries = []
+    offset = 0
+    for (heading_text,) in cursor.fetchall():
+        heading_text = (heading_text or '').strip()
+        if heading_text == '':
+            continue
+        found = text.find(heading_text, offset)
+        if found == -1:
+            continue
+        boundaries.append((found, DIRECTOR_HEADING.search(heading_text) is not None))
+        offset = found + len(heading_text)
+    sections = []
+    for i, (start, is_director) in enumerate(boundaries):
+        if is_director:
+            end = boundaries[i + 1][0] if i + 1 < len(boundaries) else len(text)
+            sections.append(text[start:end])
+    return sections
+
+
+def _pieces(text, max_tokens):
+    # Lines of text, with any single line too big for a chunk cut up further
+    for line in text.splitlines(keepends=True):
+        tokens = estimate_tokens(line)
+        if tokens <= max_tokens:
+            yield line, tokens
+            continue
+        step = max(1, len(line) * max_tokens // tokens)
+        for start in range(0, len(line), step):
+            piece = line[start:start + step]
+            yield piece, estimate_tokens(piece)
+
+
+def split_into_chunks(sections, max_tokens):
+    """Pack sections into as few chunks of at most max_tokens as it can."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for section in sections:
+        section_tokens = estimate_tokens(section)
+        if section_tokens <= max_tokens:
+            pieces = [(section, section_tokens)]
+        else:
+            pieces = _pieces(section, max_tokens)
+        for piece, tokens in pieces:
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(''.join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def plan_chunks(cursor, cikcode, accession_number, text, max_tokens=DEFAULT_MAX_PROMPT_TOKENS):
+    """What to send for one filing: a list with one or more pieces of text.
+
+    A filing that fits is sent whole, as it always has been.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    sections = director_sections(cursor, cikcode, accession_number, text)
+    if len(sections) == 0:
+        sections = [text]
+    return split_into_chunks(sections, max_tokens)
+
+
+def merge_directors(chunk_arguments):
+    """Combine the show_directors arguments returned for each chunk of a filing.
+
+    A director named in several chunks is listed once. If any chunk found
+    them to have a software background, that is the entry kept.
+    """
+    merged = {}
+    for arguments in chunk_arguments:
+        for director in arguments.get("directors") or []:
+            key = " ".join(str(director.get("name", "")).upper().split())
+            if key not in merged or (director.get("software_background") and
+                                     not merged[key].get("software_background")):
+                merged[key] = director
+    return {"directors": list(merged.values())}
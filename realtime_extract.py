@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""Extract directors from a few filings now, rather than in tonight's batch.
+
+For example, to look at some particular filings:
+
+    realtime_extract.py --accession-file urgent.txt
+
+or the 20 most recently filed ones that haven't been asked about yet:
+
+    realtime_extract.py --newest 20
+
+Filings are chosen, cleaned and chunked just as batch_jobs.py --build
+would, but are sent as concurrent chat completions (see realtime_lane.py)
+and stored straight away.
+"""
+
+import argparse
+import asyncio
+import batch_engine
+import batch_kinds
+import doc_store
+import logging
+import openai
+import openai_key
+import pgconnect
+import realtime_lane
+import request_ledger
+import sys
+import token_costs
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--database-config",
+                    default="db.conf",
+                    help="Parameters to connect to the database")
+parser.add_argument("--verbose",
+                    action="store_true",
+                    help="Lots of debugging messages")
+parser.add_argument("--kind",
+                    choices=sorted(batch_kinds.KINDS),
+                    default=request_ledger.DIRECTOR_EXTRACTION,
+                    help="Which extraction to run")
+batch_engine.add_filing_arguments(parser)
+parser.add_argument("--workers",
+                    type=int,
+                    default=realtime_lane.DEFAULT_CONCURRENCY,
+                    help="How many requests to have in flight at once")
+parser.add_argument("--tokens-per-minute",
+                    type=int,
+                    help="Don't send more than this many (estimated) tokens a minute")
+parser.add_argument("--max-tokens",
+                    type=int,
+                    help="Stop choosing filings once their requests add up to this many (estimated) tokens")
+parser.add_argument("--max-attempts",
+                    type=int,
+                    default=realtime_lane.DEFAULT_MAX_ATTEMPTS,
+                    help="Give up on a request (leaving the filing for the batch) after this many tries")
+parser.add_argument("--openai-base-url",
+                    help="Send requests here instead of to OpenAI (e.g. a local mock server)")
+parser.add_argument("--dry-run",
+                    action="store_true",
+                    help="Say which filings would be sent, but don't send them")
+parser.add_argument("--show-costs", action="store_true")
+args = parser.parse_args()
+
+if args.verbose:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Starting")
+else:
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
+        level=logging.WARNING,
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+kind = batch_kinds.KINDS[args.kind]
+conn = pgconnect.connect(args.database_config)
+store = doc_store.from_config(args.database_config)
+
+filings = batch_engine.filing_requests(conn, store, kind, args)
+jobs = list(realtime_lane.within_budget((realtime_lane.Job(*filing) for filing in filings), args.max_tokens))
+filings.close()
+# Keep any filing text that was cleaned along the way
+conn.commit()
+
+if len(jobs) == 0:
+    print(f"Nothing to send for {kind.name}: no outstanding filings")
+    sys.exit(0)
+
+if args.dry_run:
+    for job in jobs:
+        print(f"{job.cikcode} {job.accession_number}: {len(job.user_contents)} request(s), about {job.request_tokens} tokens. {job.url}")
+    sys.exit(0)
+
+
+async def run():
+    # realtime_lane does its own retrying, so that it can respect the token budget as it goes
+    async with openai.AsyncOpenAI(api_key=openai_key.load_openai_api_key(args.openai_key_file),
+                                  base_url=args.openai_base_url,
+                                  max_retries=0) as client:
+        return await realtime_lane.ask(client, kind, jobs, concurrency=args.workers,
+                                       tokens_per_minute=args.tokens_per_minute,
+                                       max_attempts=args.max_attempts)
+
+results, failed = asyncio.run(run())
+realtime_lane.save(conn, kind, results)
+logging.info(f"Stored {len(results)} {kind.name} results")
+
+if args.show_costs:
+    usage = token_costs.Usage(sum(result.prompt_tokens for result in results),
+                              sum(result.cached_tokens for result in results),
+                              sum(result.completion_tokens for result in results))
+    token_costs.print_costs(usage, token_costs.prices_from_config(args.database_config), batch=False)
+
+if len(failed) > 0:
+    for url in failed:
+        sys.stderr.write(f"Gave up on {url}; it will go in the next batch\n")
+    sys.exit(f"{len(failed)} filing(s) could not be extracted")
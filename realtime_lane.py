@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""Ask OpenAI about a few filings straight away, instead of waiting for a batch.
+
+The Batch API is cheap but can take up to a day. This lane sends the same
+requests (the same kinds from batch_kinds.py, chunked the same way) as
+ordinary chat completions: at most `concurrency` at once, no faster than
+`tokens_per_minute`, retrying rate limits and server errors with
+exponential backoff (or as long as the response's retry-after asks).
+
+Results go through kind.ingest like a batch's do, and the filing is
+queued in kind.queue_table with no batch_id so that the batch lane leaves
+it alone. A filing that still fails after max_attempts isn't queued, so
+the next batch picks it up.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import random
+import time
+
+import openai
+
+import batch_kinds
+import prompt_chunks
+import token_costs
+from batch_response_parser import RetryableBatchRecordError, extract_tool_arguments
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 6
+
+# Backoff when the response doesn't say how long to wait: 1, 2, 4, ... seconds, up to a minute
+BASE_BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 60
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# One filing to ask about, as filing_requests() in batch_engine.py yields it
+Job = collections.namedtuple("Job", ["cikcode", "accession_number", "url", "user_contents", "request_tokens"])
+
+
+class TokenBucket:
+    """Hand out at most tokens_per_minute tokens a minute (or any number, if it is None)."""
+
+    def __init__(self, tokens_per_minute, clock=time.monotonic):
+        self.capacity = tokens_per_minute
+        self.clock = clock
+        self.available = tokens_per_minute
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        if self.capacity is None:
+            return
+        # A request bigger than a whole minute's allowance waits for a full bucket
+        tokens = min(tokens, self.capacity)
+        rate = self.capacity / 60
+        async with self.lock:
+            while True:
+                now = self.clock()
+                self.available = min(self.capacity, self.available + (now - self.updated) * rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / rate)
+
+
+def retry_delay(exc, attempt):
+    """Seconds to wait before trying again after exc on the given (1-based) attempt."""
+    response = getattr(exc, "response", None)
+    if response is not None:
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    # Jitter, so that requests that were throttled together don't all come back together
+    return delay * random.uniform(0.5, 1)
+
+
+async def complete(client, body, bucket, tokens, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Send one chat completion request, retrying until it works or max_attempts is used up.
+
+    Returns the completion as a dict, or raises the last error.
+    """
+    for attempt in range(1, max_attempts + 1):
+        await bucket.acquire(tokens)
+        try:
+            completion = await client.chat.completions.create(**body)
+            return completion.model_dump()
+        except RETRYABLE_ERRORS as exc:
+            if attempt == max_attempts:
+                raise
+            delay = retry_delay(exc, attempt)
+            logging.warning("Attempt %s failed (%s); trying again in %.1fs", attempt, exc.__class__.__name__, delay)
+            await asyncio.sleep(delay)
+
+
+def as_record(completion):
+    """Wrap a completion the way a batch output file would, for extract_tool_arguments."""
+    return {"response": {"status_code": 200, "request_id": completion.get("id"), "body": completion}}
+
+
+async def ask(client, kind, jobs, concurrency=DEFAULT_CONCURRENCY, tokens_per_minute=None,
+              max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Ask about every job at once (within the limits).
+
+    Returns a batch_kinds.Result for each filing that came back usable, and
+    the urls of those that didn't.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(tokens_per_minute)
+
+    async def ask_one(user_content):
+        body = kind.request_body(user_content)
+        tokens = prompt_chunks.estimate_tokens(json.dumps(body))
+        async with semaphore:
+            completion = await complete(client, body, bucket, tokens, max_attempts)
+        arguments = extract_tool_arguments(as_record(completion))
+        return arguments, token_costs.usage_from_response(completion.get("usage"))
+
+    async def ask_job(job):
+        try:
+            answers = await asyncio.gather(*(ask_one(user_content) for user_content in job.user_contents))
+        except RetryableBatchRecordError as exc:
+            logging.warning("Unusable structured output for %s: %s", job.url, exc.reason)
+            return None
+        except openai.OpenAIError as exc:
+            logging.error("Couldn't ask about %s: %s", job.url, exc)
+            return None
+        if len(answers) == 1:
+            arguments = answers[0][0]
+        else:
+            arguments = prompt_chunks.merge_directors([answer[0] for answer in answers])
+        usage = token_costs.add(*(answer[1] for answer in answers))
+        return batch_kinds.Result(job.url, job.cikcode, job.accession_number, arguments,
+                                  usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens)
+
+    outcomes = await asyncio.gather(*(ask_job(job) for job in jobs))
+    results = [outcome for outcome in outcomes if outcome is not None]
+    failed = [job.url for job, outcome in zip(jobs, outcomes) if outcome is None]
+    return results, failed
+
+
+def within_budget(jobs, max_tokens):
+    """Yield jobs until their estimated tokens would go over max_tokens (None for no limit)."""
+    used = 0
+    for job in jobs:
+        if max_tokens is not None and used + job.request_tokens > max_tokens:
+            logging.info(f"Token budget for this run is used up; stopping at {job.cikcode} {job.accession_number}")
+            return
+        used += job.request_tokens
+        yield job
+
+
+def save(conn, kind, results):
+    """Queue each result's filing (with no batch) and hand the results to kind.ingest."""
+    if len(results) == 0:
+        return
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        insert into {kind.queue_table} (url, batch_id)
+        select url, null from unnest(%s::text[]) as url
+        on conflict (url) do nothing""", [[result.url for result in results]])
+    kind.ingest(cursor, results)
+    for view in kind.refresh_views:
+        cursor.execute(f"refresh materialized view {view}")
+    conn.commit()
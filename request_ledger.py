@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""The openai_requests ledger: one row for every request we put in a batch.
+
+Each request's custom_id is the id of its ledger row, so results find their
+filing, prompt and chunk by primary key rather than by matching a long
+document url. A filing can be in flight for several prompts (and as several
+chunks) at once, since each request has a ledger row of its own.
+
+Batches sent before the ledger existed used the document url (with a chunk
+marker, see prompt_chunks.py) as the custom_id; resolve() still understands
+those.
+"""
+
+import collections
+import json
+
+import psycopg2.extras
+
+import prompt_chunks
+
+DIRECTOR_EXTRACTION = "director_extraction"
+DIRECTOR_COMPENSATION = "director_compensation"
+
+# What resolve() returns for each custom_id. prompt_kind is None for
+# requests from before the ledger.
+Request = collections.namedtuple(
+    "Request", ["url", "cikcode", "accession_number", "prompt_kind", "chunk_index", "chunk_count"])
+
+
+def record(cursor, batch_id, cikcode, accession_number, url, prompt_kind, chunk_count=1):
+    """Add ledger rows for a filing's requests, and return their custom_ids in chunk order."""
+    rows = psycopg2.extras.execute_values(cursor, """
+        insert into openai_requests (batch_id, cikcode, accessionNumber, url, prompt_kind, chunk_index, chunk_count)
+             values %s
+          returning id, chunk_index""",
+        [(batch_id, cikcode, accession_number, url, prompt_kind, chunk_index, chunk_count)
+         for chunk_index in range(chunk_count)],
+        fetch=True)
+    return [str(request_id) for request_id, chunk_index in sorted(rows, key=lambda row: row[1])]
+
+
+# Bytes batch_line() adds around a body, at most
+LINE_OVERHEAD_BYTES = 100
+
+
+def batch_line(custom_id, body):
+    """A batch file line for a chat completion request whose body is already serialised.
+
+    The builders serialise each body before they know which batch it goes in,
+    and so before it has a custom_id.
+    """
+    return f'{{"custom_id": {json.dumps(custom_id)}, "method": "POST", "url": "/v1/chat/completions", "body": {body}}}\n'
+
+
+def is_ledger_id(custom_id):
+    return custom_id.isdigit()
+
+
+def resolve(cursor, custom_ids):
+    """Map each custom_id to its Request, with one query for ledger ids and one for urls.
+
+    custom_ids that can't be resolved are left out.
+    """
+    resolved = {}
+    ledger_ids = [int(custom_id) for custom_id in custom_ids if is_ledger_id(custom_id)]
+    if ledger_ids:
+        cursor.execute("""
+            select id, url, cikcode, accessionNumber, prompt_kind, chunk_index, chunk_count
+              from openai_requests
+             where id = any(%s)""", [ledger_ids])
+        for request_id, url, cikcode, accession_number, prompt_kind, chunk_index, chunk_count in cursor.fetchall():
+            if chunk_count == 1:
+                chunk_index = chunk_count = None
+            resolved[str(request_id)] = Request(url, cikcode, accession_number, prompt_kind, chunk_index, chunk_count)
+
+    legacy = {custom_id: prompt_chunks.split_custom_id(custom_id)
+              for custom_id in custom_ids if not is_ledger_id(custom_id)}
+    if legacy:
+        cursor.execute(
+            "select document_storage_url, cikcode, accessionNumber from filings where document_storage_url = any(%s)",
+            [list({url for url, chunk_index, chunk_count in legacy.values()})])
+        filings = {url: (cikcode, accession_number) for url, cikcode, accession_number in cursor.fetchall()}
+        for custom_id, (url, chunk_index, chunk_count) in legacy.items():
+            if url in filings:
+                resolved[custom_id] = Request(url, *filings[url], None, chunk_index, chunk_count)
+    return resolved
@@ -75,9 +75,21 @@ create table individual_director_profile_details_raw (
 
 ----------------------------------------------------------------------
 create table submissions_raw (
- submission jsonb
+ submission jsonb,
+ -- Pulled out of the json so that joins by company don't have to parse it
+ cikcode int generated always as (cast(jsonb_extract_path_text(submission, 'cik') as int)) stored,
+ company_name text generated always as (submission->>'name') stored
+);
+create unique index on submissions_raw (cikcode);
+
+-- What load_listed_company_submissions.py last loaded for each company,
+-- so that --refresh can skip the ones that haven't changed
+create table submission_fingerprints (
+  cikcode int primary key,
+  zip_crc bigint not null,
+  latest_accession varchar,
+  date_loaded timestamp default current_timestamp
 );
-create unique index on submissions_raw (cast(jsonb_extract_path_text(submission, 'cik') as int));
 
 create table vanished_cikcodes (
   cikcode int primary key
@@ -121,27 +133,89 @@ create index on filings(cikcode);
 create index on filings(extract(year from filingDate));
 create unique index on filings(document_storage_url);
 create index on filings(accessionNumber);
+create index on filings(form, extract(year from filingDate));
 
 create table html_doc_cache (
   url varchar primary key,
   content bytea,
+  codec varchar, -- how content is compressed (see doc_store.py); null means raw bytes
+  content_sha256 varchar, -- when content is null, the document is in the blob store under this hash
   encoding varchar,
   content_type varchar,
-  date_fetch timestamp default current_timestamp
+  etag varchar,
+  last_modified varchar,
+  version int not null default 1,
+  date_fetch timestamp default current_timestamp,
+  date_checked timestamp default current_timestamp
+);
+
+create index on html_doc_cache(content_sha256);
+
+-- Work list for backfill_edgar_forms.py
+create table edgar_backfill_queue (
+  url varchar primary key,
+  form varchar not null,
+  filing_year int not null,
+  planned_at timestamp default current_timestamp,
+  completed_at timestamp
+);
+create index on edgar_backfill_queue(filing_year) where completed_at is null;
+
+-- Earlier versions of documents that changed when fetch_forms_from_edgar.py --refresh re-checked them
+create table html_doc_versions (
+  url varchar references html_doc_cache(url),
+  version int not null,
+  content bytea,
+  codec varchar,
+  content_sha256 varchar,
+  encoding varchar,
+  content_type varchar,
+  etag varchar,
+  last_modified varchar,
+  date_fetch timestamp,
+  date_superseded timestamp default current_timestamp,
+  primary key (url, version)
+);
+
+-- Documents whose current content differs from what was first fetched.
+-- DocumentStore.replace() deletes what the later stages made from the old
+-- version, so they redo these filings next time they run.
+create view changed_documents as select
+  url,
+  version,
+  date_fetch as date_changed
+from html_doc_cache
+where version > 1;
+
+-- Cleaned-up text of each filing as sent to OpenAI (see filing_text.py).
+-- Rows for an older cleaner_version are simply ignored.
+create table filing_text_cache (
+  url varchar references html_doc_cache(url),
+  cleaner_version int not null,
+  text_version text,
+  date_prepared timestamp default current_timestamp,
+  primary key (url, cleaner_version)
 );
 
 create table html_fetch_failures (
   url varchar primary key,
-  status_code int,
-  date_attempted  timestamp default current_timestamp
+  status_code int, -- null if there was no response at all
+  date_attempted  timestamp default current_timestamp,
+  attempts int not null default 1,
+  next_attempt_after timestamp default current_timestamp,
+  permanent boolean not null default false -- see fetch_retry.py
 );
+create index on html_fetch_failures(next_attempt_after) where not permanent;
 
 create table if not exists director_extract_batches (
        id integer GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
        openai_batch_id text,
        when_created timestamp default current_timestamp,
        when_sent timestamp,
-       when_retrieved timestamp
+       when_retrieved timestamp,
+       estimated_tokens bigint, -- prompt tokens in the batch, as planned by batch_sizing.py
+       request_count int,
+       batch_kind text not null -- see batch_kinds.py
 );
 
 create table if not exists director_extractions (
@@ -150,6 +224,21 @@ create table if not exists director_extractions (
 );
 create index on director_extractions(batch_id);
 
+-- One row per request sent in a batch; its id is the request's custom_id (see request_ledger.py)
+create table if not exists openai_requests (
+       id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+       batch_id int not null references director_extract_batches(id),
+       cikcode int not null,
+       accessionNumber varchar not null,
+       url varchar not null,
+       prompt_kind text not null, -- director_extraction or director_compensation
+       chunk_index int not null default 0,
+       chunk_count int not null default 1,
+       foreign key (cikcode, accessionnumber) references filings(cikcode, accessionnumber),
+       unique (batch_id, cikcode, accessionNumber, prompt_kind, chunk_index)
+);
+create index on openai_requests(cikcode, accessionNumber);
+
 
  create table if not exists batchprogress (
         batch_id int references director_extract_batches(id), 
@@ -189,8 +278,8 @@ FROM director_extraction_raw,
 --    jsonb_array_elements(submission->'tickers') as tickers;
 
 create view cik2name as select
-   distinct cast(submission->>'cik' as int) as cikcode,
-   submission->>'name' as company_name
+   cikcode,
+   company_name
 FROM submissions_raw;
 
 create view company_directorships as select
@@ -346,3 +435,57 @@ BEGIN
     WHERE UPPER(ticker) = UPPER(ticker_symbol);
 END;
 $$ LANGUAGE plpgsql;
+
+-- Each table in filing_tables parsed once into a grid of cells (see table_cells.py and extract_table_cells.py)
+create table if not exists filing_table_grids (
+       table_id int primary key,
+       row_count int not null,
+       column_count int not null
+);
+
+create table if not exists filing_table_cells (
+       table_id int not null references filing_table_grids(table_id),
+       row_number int not null,
+       column_number int not null,
+       cell_text text not null,
+       primary key (table_id, row_number, column_number)
+);
+
+-- What each table in filing_tables looks like, for finding board skills matrices (see skills_matrix.py)
+create table if not exists filing_table_features (
+       table_id int primary key,
+       cikcode int not null,
+       accessionNumber varchar not null,
+       table_number int not null,
+       feature_version int not null,
+       director_names_hash text not null, -- director_names_by_filing when it was scored
+       row_count int not null,
+       column_count int not null,
+       orientation text not null,
+       header_index int,
+       surname_hits int not null,
+       marker_cells int not null,
+       image_cells int not null,
+       repeated_marker_cells int not null,
+       blank_cells int not null,
+       body_cells int not null,
+       score real not null
+);
+create index if not exists filing_table_features_by_filing on filing_table_features(cikcode, accessionNumber, score desc);
+create index if not exists filing_table_features_by_score on filing_table_features(score desc);
+
+-- Which directors are known for each filing. A table's score depends on them,
+-- so detect_skills_matrices.py scores its tables again when this changes
+-- (e.g. once director_mentions has been refreshed after extraction).
+create or replace view director_names_by_filing as
+select cikcode, accessionNumber,
+       md5(string_agg(distinct director_name, '|' order by director_name)) as director_names_hash
+  from director_mentions
+ where director_name is not null
+ group by cikcode, accessionNumber;
+
+-- Each filing's tables, most likely to be a skills matrix first
+create or replace view likely_skills_matrices as
+select cikcode, accessionNumber, table_id, table_number, score,
+       rank() over (partition by cikcode, accessionNumber order by score desc, table_number) as rank_in_filing
+  from filing_table_features;
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""Spot board skills-matrix tables among the tables in filings.
+
+A skills matrix names the directors along one edge (usually the header
+row), the skills along the other, and marks each director's skills with
+the same glyph or image over and over (a check mark, a bullet, a little
+picture of a tick) with the other cells left blank.
+
+features() measures those things for one table, and score() turns them
+into a number between 0 and 1. detect_skills_matrices.py stores both in
+filing_table_features for every table, and the likely_skills_matrices view
+ranks each filing's tables by score. Tables are scored again when the
+directors known for their filing change.
+"""
+
+import collections
+import re
+
+import table_cells
+
+# Bump this when features() or score() change, so that every table is scored again
+FEATURE_VERSION = 2
+
+# Text that on its own in a cell is probably a "yes" marker. ü, þ, n and l
+# are what Wingdings check marks, boxes and bullets look like as plain text.
+MARKER_GLYPHS = {"✓", "✔", "✅", "☑", "√", "●", "•", "■", "◼", "◆", "★", "✗", "✘", "X", "x",
+                 "ü", "þ", "n", "l", "Y", "Yes", "YES"}
+
+NAME_SUFFIXES = {"JR", "SR", "II", "III", "IV", "PHD", "MD", "CPA", "ESQ"}
+
+# A table whose non-blank cells are at least this much one marker gets full marks for markers
+MARKER_SHARE = 0.6
+
+# A table naming this many directors along one edge gets full marks for names
+ENOUGH_SURNAMES = 5
+
+Features = collections.namedtuple("Features", [
+    "row_count", "column_count", "orientation", "header_index", "surname_hits",
+    "marker_cells", "image_cells", "repeated_marker_cells", "blank_cells", "body_cells"])
+
+
+def surname(name):
+    """The last word of a director's name, ignoring suffixes like Jr. and Ph.D."""
+    words = [re.sub(r"[^A-Z'-]", "", word) for word in name.upper().replace(",", " ").split()]
+    words = [word for word in words if word and word.replace("'", "") not in NAME_SUFFIXES]
+    if len(words) == 0:
+        return None
+    return words[-1]
+
+
+def _surname_patterns(surnames):
+    return [(name, re.compile(r"\b" + re.escape(name) + r"\b")) for name in sorted(set(surnames)) if len(name) > 1]
+
+
+def _best_edge(cells, patterns):
+    """(orientation, index, number of surnames) of the row or column naming the most directors."""
+    by_row = collections.defaultdict(set)
+    by_column = collections.defaultdict(set)
+    for r, c, text in cells:
+        upper = text.upper()
+        for name, pattern in patterns:
+            if name in upper and pattern.search(upper):
+                by_row[r].add(name)
+                by_column[c].add(name)
+    best = ("row", None, 0)
+    for orientation, found in (("row", by_row), ("column", by_column)):
+        for index, names in found.items():
+            if len(names) > best[2]:
+                best = (orientation, index, len(names))
+    return best
+
+
+def features(table_html, director_surnames=()):
+    table = table_cells.parse(table_html)
+    if table is None:
+        return Features(0, 0, "row", None, 0, 0, 0, 0, 0, 0)
+    cells = table_cells.cell_grid(table)
+    orientation, header_index, surname_hits = _best_edge(
+        [(r, c, text) for r, c, cell, text in cells], _surname_patterns(director_surnames))
+
+    # Everything is counted per grid position (so a spanned cell counts once
+    # for each position it covers), leaving out the header that names the
+    # directors
+    if header_index is None:
+        body = cells
+    else:
+        edge = 0 if orientation == "row" else 1
+        body = [cell for cell in cells if cell[edge] != header_index]
+    markers = collections.Counter()
+    marker_cells = 0
+    image_cells = 0
+    blank_cells = 0
+    for r, c, cell, text in body:
+        if text in MARKER_GLYPHS:
+            marker_cells += 1
+            markers[text] += 1
+        elif text == "":
+            images = cell.findall(".//img")
+            if len(images) > 0:
+                image_cells += 1
+                markers["img:" + (images[0].get("src") or "")] += 1
+            else:
+                blank_cells += 1
+
+    return Features(
+        row_count=max((r for r, c, cell, text in cells), default=-1) + 1,
+        column_count=max((c for r, c, cell, text in cells), default=-1) + 1,
+        orientation=orientation,
+        header_index=header_index,
+        surname_hits=surname_hits,
+        marker_cells=marker_cells,
+        image_cells=image_cells,
+        repeated_marker_cells=markers.most_common(1)[0][1] if markers else 0,
+        blank_cells=blank_cells,
+        body_cells=len(body),
+    )
+
+
+def score(f):
+    """How much f looks like a skills matrix, from 0 to 1."""
+    if f.body_cells == 0:
+        return 0.0
+    names = min(f.surname_hits, ENOUGH_SURNAMES) / ENOUGH_SURNAMES
+    # Apart from blanks (which EDGAR tables are full of anyway, as spacers)
+    # and the skill labels, a matrix is the same marker over and over; a few
+    # markers in a big table of numbers don't count for much
+    markers = 0.0
+    filled_cells = f.body_cells - f.blank_cells
+    if f.repeated_marker_cells >= 3 and filled_cells > 0:
+        markers = min(1.0, f.repeated_marker_cells / filled_cells / MARKER_SHARE)
+    shape = 1.0 if f.row_count >= 4 and f.column_count >= 4 else 0.0
+    # Plenty of tables name the directors (compensation, stock ownership);
+    # names only count in full alongside markers
+    return round(0.5 * names * (0.4 + 0.6 * markers) + 0.35 * markers + 0.15 * shape, 4)
+
+
+def select_tables_needing_features(cursor, limit=None):
+    """Run the query for (table id, cikcode, accession number, table number, html, director names hash) of tables to score.
+
+    That's tables never scored, scored by an older FEATURE_VERSION, or scored
+    before the filing's directors were known (or when different ones were).
+    """
+    query = """select table_id, cikcode, accessionnumber, table_number, html,
+                      coalesce(director_names_by_filing.director_names_hash, '')
+                 from filing_tables
+                 left join director_names_by_filing using (cikcode, accessionnumber)
+                where not exists (select 1 from filing_table_features
+                                   where filing_table_features.table_id = filing_tables.table_id
+                                     and feature_version = %s
+                                     and filing_table_features.director_names_hash =
+                                         coalesce(director_names_by_filing.director_names_hash, ''))"""
+    if limit is not None:
+        query += f" limit {int(limit)}"
+    cursor.execute(query, [FEATURE_VERSION])
+
+
+def ranked(cursor, cikcode=None, accession_number=None, min_score=0.5, limit=None):
+    """(cikcode, accession number, table id, table number, score, rank) of likely skills matrices, best first per filing."""
+    # Ranking only the tables over min_score gives them the same ranks as
+    # likely_skills_matrices does, but can use the index on score
+    query = """select cikcode, accessionnumber, table_id, table_number, score,
+                      rank() over (partition by cikcode, accessionnumber order by score desc, table_number)
+                 from filing_table_features
+                where score >= %s"""
+    params = [min_score]
+    if cikcode is not None:
+        query += " and cikcode = %s"
+        params.append(cikcode)
+    if accession_number is not None:
+        query += " and accessionnumber = %s"
+        params.append(accession_number)
+    query += " order by cikcode, accessionnumber, score desc, table_number"
+    if limit is not None:
+        query += f" limit {int(limit)}"
+    cursor.execute(query, params)
+    return cursor.fetchall()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Turn a table's HTML into a grid of cells, once, so it doesn't have to be parsed again.
+
+grid() gives a (row, column, text) triple for every position in the table
+that a cell covers. A cell spanning several rows or columns has its text
+repeated in each position it covers, so every row lines up with the
+header. Positions no cell covers are left out.
+
+extract_table_cells.py stores these in filing_table_cells;
+director_information_table.py and get_table.py read them back with load().
+"""
+
+import lxml.etree
+import lxml.html
+
+# Browsers ignore bigger spans than these, and so do we
+MAX_COLSPAN = 1000
+MAX_ROWSPAN = 65534
+
+
+def _span(value, maximum):
+    try:
+        span = int(value)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(span, 1), maximum)
+
+
+def cell_text(cell):
+    return " ".join(cell.text_content().split())
+
+
+def own_rows(table):
+    """The table's own rows, not those of tables nested inside it."""
+    return [tr for tr in table.iter("tr") if next(tr.iterancestors("table"), None) is table]
+
+
+def parse(table_html):
+    """The <table> element of table_html, or None if there isn't one."""
+    try:
+        table = lxml.html.fromstring(table_html)
+    except lxml.etree.ParserError:
+        # Nothing but whitespace or comments
+        return None
+    except ValueError:
+        # lxml won't parse a str that starts with an XML encoding declaration
+        return None
+    if table.tag != "table":
+        table = table.find(".//table")
+    return table
+
+
+def grid(table_html):
+    """(row, column, text) for each position covered by a cell, in row then column order."""
+    table = parse(table_html)
+    if table is None:
+        return []
+    return element_grid(table)
+
+
+def element_grid(table):
+    """grid() of a <table> element that has already been parsed."""
+    return [(r, c, text) for r, c, cell, text in cell_grid(table)]
+
+
+def cell_grid(table):
+    """(row, column, <td> or <th> element, text) for each position covered by a cell of a parsed <table>."""
+    rows = own_rows(table)
+    covered = {}
+    for row_number, tr in enumerate(rows):
+        column_number = 0
+        for cell in tr:
+            if cell.tag not in ("td", "th"):
+                continue
+            # Skip positions filled by a cell spanning down from a row above
+            while (row_number, column_number) in covered:
+                column_number += 1
+            rowspan = min(_span(cell.get("rowspan"), MAX_ROWSPAN), len(rows) - row_number)
+            colspan = _span(cell.get("colspan"), MAX_COLSPAN)
+            text = cell_text(cell)
+            for r in range(row_number, row_number + rowspan):
+                for c in range(column_number, column_number + colspan):
+                    covered.setdefault((r, c), (cell, text))
+            column_number += colspan
+    return [(r, c, cell, text) for (r, c), (cell, text) in sorted(covered.items())]
+
+
+def as_rows(cells):
+    """The cells as a list of rows (None where no cell covers a position), e.g. for a DataFrame."""
+    if len(cells) == 0:
+        return []
+    row_count = max(r for r, c, text in cells) + 1
+    column_count = max(c for r, c, text in cells) + 1
+    rows = [[None] * column_count for _ in range(row_count)]
+    for r, c, text in cells:
+        rows[r][c] = text
+    return rows
+
+
+def load(cursor, table_id):
+    """The stored cells of a table, or None if extract_table_cells.py hasn't got to it yet."""
+    cursor.execute("select 1 from filing_table_grids where table_id = %s", [table_id])
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute("""select row_number, column_number, cell_text from filing_table_cells
+                       where table_id = %s order by row_number, column_number""", [table_id])
+    return cursor.fetchall()
@@ -0,0 +1,121 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import batch_engine
+import batch_kinds
+import request_ledger
+
+
+class ledger_cursor:
+    """Knows the openai_requests ledger, and records what else it is asked to do."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.executed = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self.rowcount = 1
+
+    def fetchall(self):
+        sql, params = self.executed[-1]
+        wanted = set(params[0])
+        return [row for row in self.requests if row[0] in wanted]
+
+
+def recording_kind(name=request_ledger.DIRECTOR_EXTRACTION):
+    ingested = []
+    kind = batch_kinds.BatchKind(name, "director_extractions", "test batch", "prompt",
+                                 batch_kinds.DIRECTOR_EXTRACTION_TOOL,
+                                 lambda cursor, results: ingested.extend(results), chunked=True)
+    return kind, ingested
+
+
+def output_record(custom_id, directors, status_code=200, prompt_tokens=10, cached_tokens=0):
+    return {
+        "custom_id": custom_id,
+        "response": {
+            "status_code": status_code,
+            "request_id": "req",
+            "body": {
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+                "choices": [{
+                    "finish_reason": "stop",
+                    "message": {"tool_calls": [{"function": {"arguments": json.dumps({"directors": directors})}}]},
+                }],
+            },
+        },
+    }
+
+
+def director(name, software_background=False):
+    return {"name": name, "software_background": software_background, "reason": "", "source_excerpt": ""}
+
+
+def write_output(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def test_chunks_are_merged_and_failures_released(tmp_path):
+    a = "https://example.com/a.htm"
+    b = "https://example.com/b.htm"
+    c = "https://example.com/c.htm"
+    cursor = ledger_cursor([
+        (1, a, 1, "acc-a", request_ledger.DIRECTOR_EXTRACTION, 0, 1),
+        (2, b, 2, "acc-b", request_ledger.DIRECTOR_EXTRACTION, 0, 2),
+        (3, b, 2, "acc-b", request_ledger.DIRECTOR_EXTRACTION, 1, 2),
+        (4, c, 3, "acc-c", request_ledger.DIRECTOR_EXTRACTION, 0, 1),
+    ])
+    path = tmp_path / "output.jsonl"
+    write_output(path, [
+        output_record("1", [director("Jane Doe")]),
+        output_record("3", [director("John Roe", True)], cached_tokens=8),
+        output_record("2", [director("Jane Doe"), director("JOHN  ROE")]),
+        output_record("4", [], status_code=500),
+    ])
+    kind, ingested = recording_kind()
+    usage = batch_engine.ingest_output(cursor, kind, 7, "batch_abc", path)
+
+    assert usage == (30, 8, 3)
+    by_url = {result.url: result for result in ingested}
+    assert set(by_url) == {a, b}
+    assert by_url[b].cikcode == 2
+    assert by_url[b].prompt_tokens == 20
+    assert by_url[b].cached_tokens == 8
+    assert [d["name"] for d in by_url[b].arguments["directors"]] == ["Jane Doe", "John Roe"]
+    released = [params for sql, params in cursor.executed if sql.startswith("delete")]
+    assert released == [[7, c]]
+
+
+def test_requests_for_another_kind_are_not_ingested(tmp_path):
+    url = "https://example.com/a.htm"
+    cursor = ledger_cursor([(1, url, 1, "acc-a", request_ledger.DIRECTOR_COMPENSATION, 0, 1)])
+    path = tmp_path / "output.jsonl"
+    write_output(path, [output_record("1", [director("Jane Doe")])])
+    kind, ingested = recording_kind()
+    batch_engine.ingest_output(cursor, kind, 7, "batch_abc", path)
+    assert ingested == []
+
+
+def test_every_kind_asks_for_its_own_tool():
+    assert set(batch_kinds.KINDS) == {request_ledger.DIRECTOR_EXTRACTION, request_ledger.DIRECTOR_COMPENSATION}
+    for kind in batch_kinds.KINDS.values():
+        body = kind.request_body("some filing")
+        assert body["messages"][0] == {"role": "system", "content": kind.system_prompt}
+        assert body["tool_choice"]["function"]["name"] == kind.tool["function"]["name"]
+
+
+def test_requests_of_a_kind_share_a_prefix_up_to_the_filing():
+    for kind in batch_kinds.KINDS.values():
+        first = json.dumps(kind.request_body("one filing"))
+        second = json.dumps(kind.request_body("another filing entirely"))
+        prefix = first[:first.index("one filing")]
+        assert second.startswith(prefix)
+        assert json.dumps(kind.system_prompt) in prefix and kind.tool["function"]["name"] in prefix
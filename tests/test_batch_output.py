@@ -0,0 +1,67 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import batch_output
+import prompt_chunks
+
+
+class filings_cursor:
+    """Only knows about filings, as if every custom_id were from before the request ledger."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        urls = set(self.executed[-1][1][0])
+        return [row for row in self.rows if row[0] in urls]
+
+
+def write_output(path, custom_ids):
+    with open(path, "w") as f:
+        for custom_id in custom_ids:
+            f.write(json.dumps({"custom_id": custom_id, "response": {"status_code": 200}}) + "\n")
+        f.write("\n")
+        f.write("{not json\n")
+
+
+def test_records_skips_blank_and_broken_lines(tmp_path):
+    path = tmp_path / "output.jsonl"
+    write_output(path, ["a", "b", "c"])
+    assert [record["custom_id"] for record in batch_output.records(path)] == ["a", "b", "c"]
+
+
+def test_requests_for_uses_one_query_for_the_whole_file(tmp_path):
+    path = tmp_path / "output.jsonl"
+    write_output(path, [
+        "https://example.com/1.htm",
+        prompt_chunks.chunk_custom_id("https://example.com/2.htm", 0, 2),
+        prompt_chunks.chunk_custom_id("https://example.com/2.htm", 1, 2),
+        "https://example.com/missing.htm",
+    ])
+    cursor = filings_cursor([
+        ("https://example.com/1.htm", 1, "0000000001-24-000001"),
+        ("https://example.com/2.htm", 2, "0000000002-24-000001"),
+        ("https://example.com/3.htm", 3, "0000000003-24-000001"),
+    ])
+    requests = batch_output.requests_for(cursor, path)
+    assert len(cursor.executed) == 1
+    assert sorted((request.url, request.cikcode, request.chunk_index) for request in requests.values()) == [
+        ("https://example.com/1.htm", 1, None),
+        ("https://example.com/2.htm", 2, 0),
+        ("https://example.com/2.htm", 2, 1),
+    ]
+
+
+def test_requests_for_empty_file_does_not_query(tmp_path):
+    path = tmp_path / "output.jsonl"
+    path.write_text("")
+    cursor = filings_cursor([])
+    assert batch_output.requests_for(cursor, path) == {}
+    assert cursor.executed == []
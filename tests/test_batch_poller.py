@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import openai
+
+import batch_poller
+
+
+class fake_batches:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def retrieve(self, openai_batch_id):
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if openai_batch_id == "broken":
+                raise openai.OpenAIError("no such batch")
+            return types.SimpleNamespace(id=openai_batch_id, status="in_progress")
+        finally:
+            self.in_flight -= 1
+
+
+class mogrifying_cursor:
+    """Enough of a cursor for psycopg2.extras.execute_values."""
+
+    connection = types.SimpleNamespace(encoding="UTF8")
+
+    def __init__(self):
+        self.executed = []
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode()
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+
+def batch(status, completed=0, failed=0):
+    return types.SimpleNamespace(status=status, request_counts=types.SimpleNamespace(completed=completed, failed=failed))
+
+
+def test_retrieve_all_is_concurrent_but_bounded():
+    client = types.SimpleNamespace(batches=fake_batches())
+    ids = [f"batch_{i}" for i in range(20)] + ["broken"]
+    results = asyncio.run(batch_poller.retrieve_all_async(client, ids, concurrency=5))
+    assert client.batches.most_in_flight == 5
+    assert results["batch_3"].id == "batch_3"
+    assert results["broken"] is None
+    assert list(results) == ids
+
+
+def test_progress_is_recorded_in_one_insert():
+    cursor = mogrifying_cursor()
+    statuses = [
+        batch_poller.BatchStatus(1, "b1", "k", 10, batch("in_progress", 3, 1)),
+        batch_poller.BatchStatus(2, "b2", "k", 10, batch("completed", 10, 0)),
+        batch_poller.BatchStatus(3, "b3", "k", 10, batch("validating")),
+        batch_poller.BatchStatus(4, "b4", "k", 10, None),
+    ]
+    batch_poller.record_progress(cursor, statuses)
+    assert len(cursor.executed) == 1
+    sql = cursor.executed[0].decode()
+    assert "(1, 3, 1)" in sql and "(2, 10, 0)" in sql
+    assert "(3," not in sql
+
+
+def test_nothing_to_record():
+    cursor = mogrifying_cursor()
+    batch_poller.record_progress(cursor, [batch_poller.BatchStatus(1, "b1", "k", 10, None)])
+    assert cursor.executed == []
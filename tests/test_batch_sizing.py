@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import batch_sizing
+
+
+class canned_cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+def test_planner_starts_new_batches_at_the_token_limit():
+    planner = batch_sizing.BatchPlanner(budget_tokens=1000, batch_tokens=300, batch_bytes=10**6, max_batches=10)
+    assert [planner.place(100, 10) for _ in range(7)] == [0, 0, 0, 1, 1, 1, 2]
+    assert planner.batches[0] == [300, 30, 3]
+
+
+def test_planner_starts_new_batches_at_the_byte_and_request_limits():
+    planner = batch_sizing.BatchPlanner(budget_tokens=1000, batch_tokens=1000, batch_bytes=25, max_batches=10)
+    assert [planner.place(1, 10) for _ in range(3)] == [0, 0, 1]
+    planner = batch_sizing.BatchPlanner(budget_tokens=1000, batch_tokens=1000, batch_bytes=1000, max_batches=10,
+                                        batch_requests=4)
+    assert [planner.place(1, 1, requests=3) for _ in range(2)] == [0, 1]
+
+
+def test_planner_stops_at_the_budget_and_the_batch_count():
+    planner = batch_sizing.BatchPlanner(budget_tokens=250, batch_tokens=100, batch_bytes=10**6, max_batches=10)
+    assert [planner.place(100, 1) for _ in range(3)] == [0, 1, None]
+    planner = batch_sizing.BatchPlanner(budget_tokens=10**6, batch_tokens=100, batch_bytes=10**6, max_batches=2)
+    assert [planner.place(100, 1) for _ in range(3)] == [0, 1, None]
+
+
+def test_oversize_filing_gets_a_batch_to_itself():
+    planner = batch_sizing.BatchPlanner(budget_tokens=1000, batch_tokens=100, batch_bytes=10**6, max_batches=10)
+    assert planner.place(50, 1) == 0
+    assert planner.place(500, 1) == 1
+    assert planner.place(50, 1) == 2
+
+
+def test_turnaround_is_the_median_rate():
+    cursor = canned_cursor([(1000, 3600), (4000, 3600), (3000, 1800), (5000, 0)])
+    assert batch_sizing.tokens_per_hour(cursor) == 4000
+    assert batch_sizing.tokens_per_hour(canned_cursor([])) is None
+
+
+def test_planner_leaves_room_for_what_is_already_enqueued():
+    limits = batch_sizing.BatchLimits(enqueued_token_limit=1000, max_batch_tokens=500, max_batch_bytes=10**6,
+                                      target_turnaround_hours=2, max_batches=5)
+
+    class history_cursor(canned_cursor):
+        def execute(self, sql, params=None):
+            # enqueued_tokens() asks first, then tokens_per_hour()
+            self.rows = [(300,)] if "lateral" in sql else [(100, 3600)]
+
+    planner = batch_sizing.planner_for(history_cursor([]), limits)
+    assert planner.budget_tokens == 900 - 300
+    assert planner.batch_tokens == 200
+
+
+def test_limits_come_from_config(tmp_path):
+    config = tmp_path / "db.conf"
+    config.write_text("[batch]\nenqueued_token_limit=5000\nmax_batches=3\n")
+    limits = batch_sizing.limits_from_config(str(config), max_batches=None)
+    assert limits.enqueued_token_limit == 5000
+    assert limits.max_batches == 3
+    assert limits.max_batch_tokens == batch_sizing.DEFAULT_MAX_BATCH_TOKENS
+    assert batch_sizing.limits_from_config(str(config), max_batches=7).max_batches == 7
+    assert batch_sizing.limits_from_config(str(tmp_path / "missing.conf")).enqueued_token_limit == \
+        batch_sizing.DEFAULT_ENQUEUED_TOKEN_LIMIT
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import blob_store
+import doc_store
+
+
+def test_put_is_content_addressed_and_sharded():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = blob_store.BlobStore(tmpdir)
+        digest = store.put(b"<html>proxy</html>")
+        assert digest == blob_store.content_hash(b"<html>proxy</html>")
+        assert store.path_for(digest) == os.path.join(tmpdir, digest[:2], digest[2:4], digest)
+        assert store.put(b"<html>proxy</html>") == digest
+        assert store.get(digest) == b"<html>proxy</html>"
+
+
+def test_map_exposes_the_bytes_without_copying():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = blob_store.BlobStore(tmpdir)
+        digest = store.put(b"abcdef")
+        with store.map(digest) as mapped:
+            assert memoryview(mapped)[2:4].tobytes() == b"cd"
+
+
+def test_missing_blob_raises():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = blob_store.BlobStore(tmpdir)
+        try:
+            store.get("0" * 64)
+        except blob_store.BlobNotFoundError:
+            pass
+        else:
+            raise AssertionError("Expected a missing blob to raise BlobNotFoundError")
+
+
+def test_document_store_reads_rows_held_in_the_blob_store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        blobs = blob_store.BlobStore(tmpdir)
+        store = doc_store.DocumentStore(backend="blobstore", blobs=blobs)
+        digest = blobs.put(b"<html>on disk</html>")
+        assert store.decode(None, None, digest) == b"<html>on disk</html>"
+        assert store.decode(None, None, None) is None
@@ -0,0 +1,58 @@
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import bulk_writer
+
+
+class mogrifying_cursor:
+    """Enough of a cursor for psycopg2.extras.execute_values."""
+
+    connection = types.SimpleNamespace(encoding="UTF8")
+
+    def __init__(self):
+        self.executed = []
+        self.next_id = 100
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode()
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql.decode() if isinstance(sql, bytes) else sql)
+
+    def fetchall(self):
+        rows = self.executed[-1].count("),(") + 1
+        ids = [(self.next_id + i,) for i in range(rows)]
+        self.next_id += rows
+        return ids
+
+
+def test_each_statement_is_written_in_pages_in_the_order_first_added():
+    cursor = mogrifying_cursor()
+    writer = bulk_writer.BulkWriter(cursor, page_size=2)
+    for i in range(3):
+        writer.add("insert into parent (n) values %s", (i,))
+        writer.add("insert into child (n) values %s", (i,))
+    writer.extend("insert into parent (n) values %s", [(3,)])
+    assert writer.pending() == 7
+
+    writer.flush()
+
+    assert cursor.executed == [
+        "insert into parent (n) values (0,),(1,)",
+        "insert into parent (n) values (2,),(3,)",
+        "insert into child (n) values (0,),(1,)",
+        "insert into child (n) values (2,)",
+    ]
+    assert writer.pending() == 0
+    writer.flush()
+    assert len(cursor.executed) == 4
+
+
+def test_insert_returning_gives_back_a_row_per_value():
+    cursor = mogrifying_cursor()
+    assert bulk_writer.insert_returning(cursor, "insert into t (n) values %s returning id", []) == []
+    assert bulk_writer.insert_returning(cursor, "insert into t (n) values %s returning id",
+                                        [(1,), (2,), (3,)]) == [(100,), (101,), (102,)]
@@ -0,0 +1,162 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import doc_store
+
+
+SAMPLE = b"<html><body>" + b"<p>Director biography</p>\n" * 500 + b"</body></html>"
+
+
+class recording_cursor:
+    def __init__(self, row=None):
+        self.row = row
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+
+def test_gzip_round_trip_shrinks_repetitive_html():
+    stored = doc_store.compress(SAMPLE, "gzip")
+    assert len(stored) < len(SAMPLE) / 8
+    assert doc_store.decompress(memoryview(stored), "gzip") == SAMPLE
+
+
+def test_rows_without_codec_are_raw_bytes():
+    assert doc_store.decompress(memoryview(SAMPLE), None) == SAMPLE
+
+
+def test_unknown_codec_is_rejected():
+    try:
+        doc_store.DocumentStore(codec="brotli")
+    except doc_store.UnknownCodecError:
+        pass
+    else:
+        raise AssertionError("Expected an unknown codec to be rejected")
+
+
+def test_save_records_codec_and_load_decodes():
+    store = doc_store.DocumentStore(codec="gzip")
+    cursor = recording_cursor()
+    store.save(cursor, "https://example.com/a.htm", SAMPLE, "utf-8", "text/html")
+    query, params = cursor.executed[0]
+    assert params[2] == "gzip"
+    assert params[1] != SAMPLE
+
+    cursor = recording_cursor(row=(memoryview(params[1]), "gzip", params[3], "utf-8", "text/html"))
+    assert store.load(cursor, "https://example.com/a.htm") == (SAMPLE, "utf-8", "text/html")
+
+
+class sqlite_cursor:
+    """Just enough of a psycopg2 cursor over sqlite to run DocumentStore's statements."""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    def execute(self, query, params=None):
+        self.cursor.execute(query.replace("%s", "?"), params or [])
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+
+URL = "https://www.sec.gov/Archives/edgar/data/1800/000110465923000001/proxy.htm"
+PROXY = b"<html><body><p>Board of directors</p></body></html>"
+
+# Tables keyed by filing that every_textual.py, extract_tables.py and the rest use as done markers
+FILING_TABLES = ["filings_parsed_successfully", "filings_with_textual_parse_errors", "filings_with_no_tables",
+                 "document_text_positions", "document_headings", "document_table_positions", "spacy_parses",
+                 "naively_extracted_sentences", "nes_ranges"]
+
+
+def processed_database(cached_text=None):
+    """sqlite standing in for postgres, with every stage done for two filings."""
+    import sqlite3
+
+    connection = sqlite3.connect(":memory:")
+    connection.executescript(f"""
+        create table filings (cikcode int, accessionnumber text, document_storage_url text);
+        create table html_doc_cache (url text, content blob, codec text, content_sha256 text, encoding text,
+                                     content_type text, etag text, last_modified text, version int default 1,
+                                     date_fetch timestamp, date_checked timestamp);
+        create table html_doc_versions (url text, version int, content blob, codec text, content_sha256 text,
+                                        encoding text, content_type text, etag text, last_modified text,
+                                        date_fetch timestamp);
+        create table filing_text_cache (url text, cleaner_version int, text_version text);
+        create table filing_tables (table_id int, cikcode int, accessionnumber text);
+        create table sentences (sentence_id int, cikcode int, accessionnumber text);
+        create table director_details (id int, url text);
+        insert into filings values (1800, '0001104659-23-000001', '{URL}');
+        insert into filings values (1800, '0001104659-23-000002', 'https://example.com/other.htm');
+        insert into filing_tables values (7, 1800, '0001104659-23-000001');
+        insert into sentences values (9, 1800, '0001104659-23-000001');
+        insert into director_details values (3, '{URL}');
+    """)
+    connection.execute("""insert into html_doc_cache (url, content, encoding, content_type, version)
+                          values (?, ?, 'utf-8', 'text/html', 1)""", [URL, PROXY])
+    if cached_text is not None:
+        connection.execute("insert into filing_text_cache values (?, ?, ?)",
+                           [URL, doc_store.filing_text.CLEANER_VERSION, cached_text])
+    for table in FILING_TABLES:
+        connection.execute(f"create table {table} (cikcode int, accessionnumber text)")
+        connection.execute(f"insert into {table} select cikcode, accessionnumber from filings")
+    for table in ["filing_table_grids", "filing_table_cells", "filing_table_features"]:
+        connection.execute(f"create table {table} (table_id int)")
+        connection.execute(f"insert into {table} values (7)")
+    for table in ["named_entities", "noun_chunks", "pronouns"]:
+        connection.execute(f"create table {table} (sentence_id int)")
+        connection.execute(f"insert into {table} values (9)")
+    for table in ["director_extractions", "director_compensation"]:
+        connection.execute(f"create table {table} (url text)")
+        connection.execute(f"insert into {table} select document_storage_url from filings")
+    connection.execute("create table director_committees (director_id int)")
+    connection.execute("insert into director_committees values (3)")
+    return connection
+
+
+def needing_work(connection):
+    """The filings every_textual.py and the director extraction batches would pick up."""
+    return connection.execute("""
+        select accessionnumber from filings
+         where not exists (select 1 from filings_parsed_successfully
+                            where filings_parsed_successfully.accessionnumber = filings.accessionnumber)
+           and document_storage_url not in (select url from director_extractions)""").fetchall()
+
+
+def test_replaced_documents_are_processed_again():
+    connection = processed_database()
+    assert needing_work(connection) == []
+    doc_store.DocumentStore(codec=None).replace(
+        sqlite_cursor(connection), URL, b"<html><body><p>Amended board</p></body></html>", "utf-8", "text/html")
+
+    assert needing_work(connection) == [("0001104659-23-000001",)]
+    assert connection.execute("select version from html_doc_cache").fetchall() == [(2,)]
+    assert connection.execute("select url, version from html_doc_versions").fetchall() == [(URL, 1)]
+    for table in FILING_TABLES:
+        # Only the replaced filing's rows are gone
+        assert connection.execute(f"select accessionnumber from {table}").fetchall() == [("0001104659-23-000002",)]
+    for table in ["filing_tables", "filing_table_cells", "sentences", "named_entities", "director_details",
+                  "director_committees"]:
+        assert connection.execute(f"select count(*) from {table}").fetchone() == (0,)
+
+
+def test_openai_results_survive_changes_that_leave_the_cleaned_text_alone():
+    connection = processed_database(cached_text=doc_store.filing_text.text_version(PROXY, "utf-8", "text/html"))
+    restyled = b'<html><body><p style="margin:0">Board of directors</p></body></html>'
+    doc_store.DocumentStore(codec=None).replace(sqlite_cursor(connection), URL, restyled, "utf-8", "text/html")
+
+    # Parsed again, but not sent to OpenAI again
+    assert connection.execute("select count(*) from filings_parsed_successfully").fetchone() == (1,)
+    assert connection.execute("select count(*) from filing_tables").fetchone() == (0,)
+    assert connection.execute("select url from director_extractions where url = ?", [URL]).fetchall() == [(URL,)]
+    for table in ["director_details", "director_committees", "filing_text_cache"]:
+        assert connection.execute(f"select count(*) from {table}").fetchone() == (1,)
+    assert connection.execute("select url from director_compensation where url = ?", [URL]).fetchall() == [(URL,)]
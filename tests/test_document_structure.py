@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from bs4 import BeautifulSoup
+
+import document_structure
+
+
+def blobs(html):
+    return document_structure.headings_tables_and_text(BeautifulSoup(html, features='lxml'))
+
+
+def test_text_is_grouped_under_the_heading_before_it():
+    assert blobs("<html><body><h2>Board</h2><p>Jane <b>Doe</b> is a director</p>"
+                 "<table><tr><td>Name</td></tr></table><hr><p>Other</p></body></html>") == [
+        ("HEADING", "h2", 1, "Board"),
+        ("TEXT", 2, 1, "Jane  Doe  is a director "),
+        ("TABLE", 3, 1),
+        ("TEXT", 4, 4, "Name "),
+        ("TEXT", 5, 5, "Other "),
+    ]
+
+
+def test_each_walk_starts_afresh():
+    html = "<html><body><table><tr><td>x</td></tr></table></body></html>"
+    assert blobs(html) == blobs(html)
+    assert blobs(html)[0] == ("TABLE", 1, 1)
+
+
+def test_unknown_tags_raise():
+    with pytest.raises(document_structure.UnknownTagError):
+        blobs("<html><body><p>Fine</p><marquee>Not fine</marquee></body></html>")
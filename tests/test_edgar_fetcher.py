@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from edgar_fetcher import RateLimiter
+
+
+class fake_clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_burst_is_served_without_sleeping():
+    clock = fake_clock()
+    limiter = RateLimiter(5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+
+def test_sustained_rate_is_limited():
+    clock = fake_clock()
+    limiter = RateLimiter(10, burst=1, clock=clock, sleep=clock.sleep)
+    for _ in range(21):
+        limiter.acquire()
+    # The first token was already in the bucket; the other twenty had to wait
+    assert abs(clock.now - 2.0) < 1e-9
+
+
+def test_rate_must_be_positive():
+    try:
+        RateLimiter(0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected a zero rate to be rejected")
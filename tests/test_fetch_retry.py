@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import fetch_retry
+
+
+def test_status_code_classification():
+    assert fetch_retry.is_retryable(429)
+    assert fetch_retry.is_retryable(503)
+    assert fetch_retry.is_retryable(None)
+    assert not fetch_retry.is_retryable(404)
+    assert not fetch_retry.is_retryable(410)
+
+
+def test_backoff_doubles_and_is_capped():
+    no_jitter = lambda: 1.0
+    assert fetch_retry.backoff_delay(1, rng=no_jitter) == fetch_retry.BASE_DELAY_SECONDS
+    assert fetch_retry.backoff_delay(3, rng=no_jitter) == 4 * fetch_retry.BASE_DELAY_SECONDS
+    assert fetch_retry.backoff_delay(50, rng=no_jitter) == fetch_retry.MAX_DELAY_SECONDS
+
+
+def test_jitter_stays_within_half_to_full_delay():
+    assert fetch_retry.backoff_delay(2, rng=lambda: 0.0) == fetch_retry.BASE_DELAY_SECONDS
+    assert fetch_retry.backoff_delay(2, rng=lambda: 0.999) < 2 * fetch_retry.BASE_DELAY_SECONDS
+
+
+class recording_cursor:
+    def __init__(self, attempts):
+        self.attempts = attempts
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return None if self.attempts is None else (self.attempts,)
+
+
+def test_record_failure_gives_up_on_404_and_after_max_attempts():
+    assert fetch_retry.record_failure(recording_cursor(None), "u", 503)
+    assert not fetch_retry.record_failure(recording_cursor(None), "u", 404)
+    cursor = recording_cursor(fetch_retry.MAX_ATTEMPTS - 1)
+    assert not fetch_retry.record_failure(cursor, "u", 503)
+    assert cursor.executed[-1][1][2] == fetch_retry.MAX_ATTEMPTS
@@ -0,0 +1,124 @@
+import random
+import sys
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bs4 import XMLParsedAsHTMLWarning
+
+import filing_text
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "filings"
+
+
+def test_html_is_cleaned():
+    raw = b"""<html><head><style>p {color: red}</style></head><body>
+<p class="x"><font size="2">Jane Doe</font></p>
+
+
+<p><a href="#bio">Director</a></p>
+</body></html>"""
+    text = filing_text.text_version(raw, 'utf-8', 'text/html')
+    assert 'Jane Doe' in text
+    assert '<a' not in text and '<font' not in text
+    assert 'class=' not in text
+    assert 'color: red' not in text
+    assert '</p>' not in text
+    assert '\n\n' not in text
+
+
+def test_plain_text_is_decoded():
+    assert filing_text.text_version(b'caf\xe9', 'latin-1', 'text/plain') == 'café'
+
+
+def test_other_content_types_are_refused():
+    try:
+        filing_text.text_version(b'GIF89a', None, 'image/gif')
+    except filing_text.UnsupportedContentType as e:
+        assert e.content_type == 'image/gif'
+    else:
+        assert False, "expected UnsupportedContentType"
+
+
+class recording_cursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+
+def test_nul_bytes_are_stripped_before_the_text_is_used_or_saved():
+    html = filing_text.text_version(b'<p>a\x00b</p>', 'utf-8', 'text/html')
+    plain = filing_text.text_version(b'a\x00b', 'utf-8', 'text/plain')
+    assert '\x00' not in html
+    assert plain == 'ab'
+    cursor = recording_cursor()
+    filing_text.save(cursor, 'https://example.com/a.htm', plain)
+    sql, params = cursor.executed[0]
+    assert 'filing_text_cache' in sql
+    assert params == ['https://example.com/a.htm', filing_text.CLEANER_VERSION, plain]
+
+
+def reference_clean(raw_html):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", XMLParsedAsHTMLWarning)
+        return filing_text.clean_html(raw_html)
+
+
+def test_fast_cleaner_matches_reference_on_fixtures():
+    fixtures = sorted(FIXTURES.glob("*.htm"))
+    assert len(fixtures) > 0
+    for fixture in fixtures:
+        raw_html = fixture.read_text(encoding="utf-8")
+        expected = reference_clean(raw_html)
+        assert filing_text.fast_clean_html(raw_html) == expected, fixture.name
+        assert len(expected) > 0
+
+
+def test_fast_cleaner_matches_reference_on_awkward_markup():
+    samples = [
+        "",
+        "   \n ",
+        "just some text",
+        "\ufeff<p>byte order mark</p>",
+        "<!DOCTYPE html><!----><p>a<br>b &amp; &lt; &nbsp;</p><?xml x?>",
+        "<p>unclosed <b>bold <i>italic</p> after",
+        "<span style='visibility:hidden'>style</span><span style='visibility:hidden'>kept</span>",
+        "<p>a<span style='font-size:3pt'>style<b>x</b></span>b</p>",
+        "<pre>\n\n</pre><p>\r\n</p><textarea> </textarea>",
+        "<ruby>k<rt>k</rt></ruby><p><rt>ruby only</rt></p><template><p>t</p></template>",
+        "<table><tr><td>1<td><td>&#160;<tr><td>2</table>",
+        "<p><!-- </p> in a comment --></p><p>x<!--\n\n-->y</p>",
+        "<div>" * 2000 + "deep" + "</div>" * 2000,
+    ]
+    for sample in samples:
+        assert filing_text.fast_clean_html(sample) == reference_clean(sample), repr(sample)
+
+
+def test_fast_cleaner_matches_reference_on_random_markup():
+    # Random tag soup, to catch differences the fixtures don't think of
+    rng = random.Random(14)
+    tags = ["p", "div", "span", "font", "a", "b", "td", "tr", "table", "li", "pre",
+            "rt", "template", "script", "style", "br", "img", "ix:nonnumeric"]
+    attributes = ["", ' class="c"', ' style="visibility:hidden"', ' style="FONT-SIZE:3pt"', ' href="#x"']
+    strings = ["x", "style", " ", "\n", "\n\n \t", "&amp;", "&nbsp;", "<", ">", "Jane Doe", "</p>"]
+
+    def random_markup(depth):
+        parts = []
+        for _ in range(rng.randint(0, 5)):
+            choice = rng.random()
+            if choice < 0.35 and depth < 8:
+                tag = rng.choice(tags)
+                closing = f"</{tag}>" if rng.random() < 0.8 else ""
+                parts.append(f"<{tag}{rng.choice(attributes)}>" + random_markup(depth + 1) + closing)
+            elif choice < 0.45:
+                parts.append("<!--" + rng.choice(["", "style", " ", "x</p>"]) + "-->")
+            else:
+                parts.append(rng.choice(strings))
+        return "".join(parts)
+
+    for _ in range(500):
+        sample = random_markup(0)
+        assert filing_text.fast_clean_html(sample) == reference_clean(sample), repr(sample)
@@ -0,0 +1,45 @@
+import sys
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+
+import html_tables
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "filings"
+
+
+def test_tables_are_numbered_in_the_order_they_start():
+    raw = (b"<html><body><p>Before</p><table><tr><td>Outer<table><tr><td>Inner</td></tr></table>"
+           b"</td></tr></table><div><TABLE border=1><tr><td>Fees &amp; awards</td></tr></TABLE></div>"
+           b"<p>Unclosed<table><tr><td>Last")
+    tables = dict(html_tables.iter_tables(raw))
+    assert sorted(tables) == [1, 2, 3, 4]
+    assert tables[2] == "<table><tr><td>Inner</td></tr></table>"
+    assert tables[1].startswith("<table><tr><td>Outer<table>") and "Inner" in tables[1]
+    assert tables[3] == '<table border="1"><tr><td>Fees &amp; awards</td></tr></table>'
+    assert "Last" in tables[4]
+
+
+def test_finds_the_same_tables_as_beautifulsoup():
+    for path in FIXTURES.glob("def14a_*.htm"):
+        raw = path.read_bytes()
+        found = list(html_tables.iter_tables(raw))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", XMLParsedAsHTMLWarning)
+            expected = BeautifulSoup(raw, features="lxml").find_all("table")
+            assert len(found) == len(expected), path.name
+            for (_, table_html), table in zip(found, expected):
+                assert BeautifulSoup(table_html, features="lxml").get_text() == table.get_text()
+
+
+def test_declared_encoding_is_used():
+    raw = "<table><tr><td>Société</td></tr></table>".encode("latin-1")
+    [(number, table_html)] = html_tables.iter_tables(raw, "latin-1")
+    assert "Société" in table_html
+
+
+def test_empty_documents_have_no_tables():
+    assert list(html_tables.iter_tables(b"")) == []
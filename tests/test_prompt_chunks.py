@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import prompt_chunks
+
+
+class headings_cursor:
+    def __init__(self, headings):
+        self.headings = headings
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return [(heading,) for heading in self.headings]
+
+
+def test_custom_id_round_trip():
+    url = "https://www.sec.gov/Archives/edgar/data/1/000000000123000001/def14a.htm"
+    assert prompt_chunks.split_custom_id(url) == (url, None, None)
+    custom_id = prompt_chunks.chunk_custom_id(url, 2, 5)
+    assert custom_id != url
+    assert prompt_chunks.split_custom_id(custom_id) == (url, 2, 5)
+
+
+def test_small_filings_are_sent_whole():
+    text = "<p>Election of Directors\n<p>Jane Doe\n"
+    assert prompt_chunks.plan_chunks(headings_cursor([]), 1, "a", text, max_tokens=1000) == [text]
+
+
+def test_chunks_stay_within_budget_and_keep_everything():
+    lines = [f"Line {i} about some director or other\n" for i in range(500)]
+    text = "".join(lines)
+    chunks = prompt_chunks.split_into_chunks([text], 200)
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    for chunk in chunks:
+        assert prompt_chunks.estimate_tokens(chunk) <= 200
+
+
+def test_one_enormous_line_is_still_split():
+    text = "x" * 10000
+    chunks = prompt_chunks.split_into_chunks([text], 100)
+    assert "".join(chunks) == text
+    assert all(prompt_chunks.estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_oversize_filings_are_cut_down_to_director_sections():
+    text = ("<p>Notice of Annual Meeting\n" + "boilerplate\n" * 2000 +
+            "<p>Election of Directors\n<p>Jane Doe, engineer\n" +
+            "<p>Audit Matters\n" + "more boilerplate\n" * 2000)
+    cursor = headings_cursor(["Notice of Annual Meeting", "Election of Directors", "Audit Matters", "Missing Heading"])
+    chunks = prompt_chunks.plan_chunks(cursor, 1, "a", text, max_tokens=1000)
+    assert chunks == ["Election of Directors\n<p>Jane Doe, engineer\n<p>"]
+
+
+def test_oversize_filings_without_headings_are_split():
+    text = "Jane Doe, engineer\n" * 2000
+    chunks = prompt_chunks.plan_chunks(headings_cursor([]), 1, "a", text, max_tokens=1000)
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+
+
+def test_merge_keeps_one_entry_per_director_preferring_software_background():
+    merged = prompt_chunks.merge_directors([
+        {"directors": [{"name": "Jane Doe", "software_background": False, "reason": "a", "source_excerpt": "a"},
+                       {"name": "John Roe", "software_background": False, "reason": "b", "source_excerpt": "b"}]},
+        {"directors": [{"name": "JANE  DOE", "software_background": True, "reason": "c", "source_excerpt": "c"}]},
+        {},
+    ])
+    assert [d["name"] for d in merged["directors"]] == ["JANE  DOE", "John Roe"]
+    assert merged["directors"][0]["software_background"] is True
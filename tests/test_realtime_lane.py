@@ -0,0 +1,162 @@
+import asyncio
+import http.server
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import openai
+
+import batch_kinds
+import realtime_lane
+import request_ledger
+
+
+class mock_openai_handler(http.server.BaseHTTPRequestHandler):
+    """Answers chat completions like OpenAI would, with a show_directors call naming whoever the prompt mentions."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers["content-length"])
+        body = json.loads(self.rfile.read(length))
+        user_content = body["messages"][-1]["content"]
+        with server.lock:
+            server.requests += 1
+            request_number = server.requests
+            server.in_flight += 1
+            server.most_in_flight = max(server.most_in_flight, server.in_flight)
+        try:
+            time.sleep(0.05)
+            if request_number <= server.throttle_first or "BROKEN" in user_content:
+                status = 429 if request_number <= server.throttle_first else 500
+                self.reply(status, {"error": {"message": "slow down", "type": "requests"}},
+                           {"retry-after": "0"})
+                return
+            arguments = {"directors": [{"name": name, "software_background": False}
+                                       for name in user_content.split("\n")[-1].split(",")]}
+            self.reply(200, {
+                "id": f"chatcmpl-{request_number}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [{
+                            "id": "call_1",
+                            "type": "function",
+                            "function": {"name": "show_directors", "arguments": json.dumps(arguments)},
+                        }],
+                    },
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def mock_openai_server(throttle_first=0):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), mock_openai_handler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.in_flight = 0
+    server.most_in_flight = 0
+    server.throttle_first = throttle_first
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def ask(server, jobs, **kwargs):
+    async def run():
+        async with openai.AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                                      max_retries=0) as client:
+            return await realtime_lane.ask(client, batch_kinds.KINDS[request_ledger.DIRECTOR_EXTRACTION],
+                                           jobs, **kwargs)
+    try:
+        return asyncio.run(run())
+    finally:
+        server.shutdown()
+
+
+def test_ask_retries_rate_limits_and_merges_chunks():
+    server = mock_openai_server(throttle_first=1)
+    jobs = [realtime_lane.Job("1", f"acc-{i}", f"https://example.com/{i}", [f"Board:\nDirector {i}"], 50)
+            for i in range(6)]
+    jobs.append(realtime_lane.Job("2", "acc-chunked", "https://example.com/chunked",
+                                  ["[Part 1 of 2]\nAda,Grace", "[Part 2 of 2]\nGrace,Linus"], 100))
+
+    results, failed = ask(server, jobs, concurrency=3)
+
+    assert failed == []
+    assert server.requests == 6 + 2 + 1
+    assert server.most_in_flight <= 3
+    by_url = {result.url: result for result in results}
+    assert by_url["https://example.com/3"].arguments == {
+        "directors": [{"name": "Director 3", "software_background": False}]}
+    assert [d["name"] for d in by_url["https://example.com/chunked"].arguments["directors"]] == ["Ada", "Grace", "Linus"]
+    assert by_url["https://example.com/chunked"].prompt_tokens == 200
+    assert by_url["https://example.com/chunked"].completion_tokens == 20
+
+
+def test_ask_gives_up_after_max_attempts():
+    server = mock_openai_server()
+    jobs = [realtime_lane.Job("1", "acc-ok", "https://example.com/ok", ["Board:\nAda"], 50),
+            realtime_lane.Job("1", "acc-bad", "https://example.com/bad", ["BROKEN\nAda"], 50)]
+
+    results, failed = ask(server, jobs, max_attempts=2)
+
+    assert [result.url for result in results] == ["https://example.com/ok"]
+    assert failed == ["https://example.com/bad"]
+    assert server.requests == 1 + 2
+
+
+def test_within_budget_stops_at_the_first_job_that_does_not_fit():
+    jobs = [realtime_lane.Job("1", str(i), f"url-{i}", ["x"], tokens) for i, tokens in enumerate([40, 40, 20, 10])]
+
+    assert [job.accession_number for job in realtime_lane.within_budget(jobs, 90)] == ["0", "1"]
+    assert len(list(realtime_lane.within_budget(jobs, None))) == 4
+
+
+def test_token_bucket_waits_for_tokens_to_come_back():
+    now = [0.0]
+    slept = []
+
+    async def run():
+        bucket = realtime_lane.TokenBucket(600, clock=lambda: now[0])
+        await bucket.acquire(600)
+        original_sleep = asyncio.sleep
+
+        async def fake_sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+            await original_sleep(0)
+
+        asyncio.sleep = fake_sleep
+        try:
+            await bucket.acquire(100)
+        finally:
+            asyncio.sleep = original_sleep
+
+    asyncio.run(run())
+    # 600 tokens a minute is 10 a second, so 100 more tokens take 10 seconds
+    assert slept == [10.0]
@@ -0,0 +1,64 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import prompt_chunks
+import request_ledger
+
+
+class ledger_cursor:
+    """Answers the two queries resolve() makes from canned rows."""
+
+    def __init__(self, requests=(), filings=()):
+        self.requests = requests
+        self.filings = filings
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        sql, params = self.executed[-1]
+        wanted = set(params[0])
+        if "openai_requests" in sql:
+            return [row for row in self.requests if row[0] in wanted]
+        return [row for row in self.filings if row[0] in wanted]
+
+
+def test_batch_line_is_a_valid_request():
+    body = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi \"there\""}]})
+    line = request_ledger.batch_line("42", body)
+    assert line.endswith("\n")
+    request = json.loads(line)
+    assert request["custom_id"] == "42"
+    assert request["url"] == "/v1/chat/completions"
+    assert request["body"] == json.loads(body)
+    assert len(line.encode("utf-8")) - len(body.encode("utf-8")) <= request_ledger.LINE_OVERHEAD_BYTES
+
+
+def test_resolve_ledger_ids():
+    cursor = ledger_cursor(requests=[
+        (7, "https://example.com/a.htm", 1, "0000000001-24-000001", request_ledger.DIRECTOR_EXTRACTION, 0, 1),
+        (8, "https://example.com/b.htm", 2, "0000000002-24-000001", request_ledger.DIRECTOR_EXTRACTION, 1, 3),
+        (9, "https://example.com/a.htm", 1, "0000000001-24-000001", request_ledger.DIRECTOR_COMPENSATION, 0, 1),
+    ])
+    resolved = request_ledger.resolve(cursor, {"7", "8", "9", "10"})
+    assert len(cursor.executed) == 1
+    assert resolved["7"] == request_ledger.Request(
+        "https://example.com/a.htm", 1, "0000000001-24-000001", request_ledger.DIRECTOR_EXTRACTION, None, None)
+    assert resolved["8"].chunk_index == 1 and resolved["8"].chunk_count == 3
+    # The same filing can be in flight for another prompt
+    assert resolved["9"].prompt_kind == request_ledger.DIRECTOR_COMPENSATION
+    assert "10" not in resolved
+
+
+def test_resolve_urls_from_before_the_ledger():
+    url = "https://example.com/a.htm"
+    chunked = prompt_chunks.chunk_custom_id(url, 1, 2)
+    cursor = ledger_cursor(filings=[(url, 1, "0000000001-24-000001")])
+    resolved = request_ledger.resolve(cursor, {url, chunked, "https://example.com/missing.htm"})
+    assert resolved[url] == request_ledger.Request(url, 1, "0000000001-24-000001", None, None, None)
+    assert resolved[chunked] == request_ledger.Request(url, 1, "0000000001-24-000001", None, 1, 2)
+    assert len(resolved) == 2
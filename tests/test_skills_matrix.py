@@ -0,0 +1,116 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import skills_matrix
+
+DIRECTORS = ["Smith", "Jones", "Brown", "Garcia", "Lee"]
+
+SKILLS_MATRIX = """<table>
+  <tr><td>Skill</td><td>Smith</td><td>Jones</td><td>Brown</td><td>Garcia</td><td>Lee</td></tr>
+  <tr><td>Finance</td><td><img src="tick.jpg"></td><td></td><td><img src="tick.jpg"></td><td></td><td><img src="tick.jpg"></td></tr>
+  <tr><td>Technology</td><td></td><td><img src="tick.jpg"></td><td></td><td><img src="tick.jpg"></td><td></td></tr>
+  <tr><td>Risk</td><td><img src="tick.jpg"></td><td><img src="tick.jpg"></td><td></td><td></td><td><img src="tick.jpg"></td></tr>
+</table>"""
+
+COMPENSATION = """<table>
+  <tr><td>Name</td><td>Fees</td><td>Stock awards</td><td>Total</td></tr>
+  <tr><td>Jane Smith</td><td>$95,000</td><td>$160,000</td><td>$255,000</td></tr>
+  <tr><td>Tom Jones</td><td>$80,000</td><td>$160,000</td><td>$240,000</td></tr>
+  <tr><td>Ann Brown</td><td>$85,000</td><td>$160,000</td><td>$245,000</td></tr>
+</table>"""
+
+
+def test_surnames_ignore_suffixes_and_punctuation():
+    assert skills_matrix.surname("JOHN Q. PUBLIC, JR.") == "PUBLIC"
+    assert skills_matrix.surname("Mary O'Brien Ph.D.") == "O'BRIEN"
+    assert skills_matrix.surname("  ") is None
+
+
+def test_skills_matrix_features():
+    f = skills_matrix.features(SKILLS_MATRIX, [skills_matrix.surname(name) for name in DIRECTORS])
+    assert (f.orientation, f.header_index, f.surname_hits) == ("row", 0, 5)
+    assert (f.row_count, f.column_count) == (4, 6)
+    assert f.image_cells == f.repeated_marker_cells == 8
+    assert f.blank_cells == 7
+    assert f.body_cells == 18
+
+
+def test_skills_matrix_outscores_a_compensation_table():
+    surnames = [skills_matrix.surname(name) for name in DIRECTORS]
+    matrix = skills_matrix.score(skills_matrix.features(SKILLS_MATRIX, surnames))
+    compensation = skills_matrix.score(skills_matrix.features(COMPENSATION, surnames))
+    assert matrix > 0.9
+    assert compensation < 0.3
+
+
+def test_glyph_markers_count_without_known_directors():
+    html = "<table>" + "".join(
+        f"<tr><td>Skill {i}</td><td>✓</td><td></td><td>✓</td><td></td></tr>" for i in range(6)) + "</table>"
+    f = skills_matrix.features(html)
+    assert f.surname_hits == 0 and f.marker_cells == 12
+    assert skills_matrix.score(f) >= 0.5
+
+
+def test_cells_are_counted_per_position_outside_the_header():
+    # Photos in the header, and a blank and a check mark spanning two columns
+    html = """<table>
+      <tr><td>Skill</td><td><img src="smith.jpg">Smith</td><td><img src="jones.jpg">Jones</td>
+          <td><img src="lee.jpg">Lee</td></tr>
+      <tr><td>Finance</td><td colspan="2"></td><td><img src="tick.jpg"></td></tr>
+      <tr><td>Risk</td><td><img src="tick.jpg"></td><td colspan="2"><img src="tick.jpg"></td></tr>
+    </table>"""
+    f = skills_matrix.features(html, ["SMITH", "JONES", "LEE"])
+    assert (f.header_index, f.surname_hits, f.body_cells) == (0, 3, 8)
+    assert f.image_cells == f.repeated_marker_cells == 4
+    assert f.blank_cells == 2
+
+
+def test_unparseable_tables_have_no_features():
+    for html in ["", " \n", '<?xml version="1.0" encoding="utf-8"?><table><tr><td>x</td></tr></table>']:
+        f = skills_matrix.features(html, ["SMITH"])
+        assert f.body_cells == 0
+        assert skills_matrix.score(f) == 0.0
+
+
+class sqlite_cursor:
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    def execute(self, query, params=None):
+        self.cursor.execute(query.replace("%s", "?"), params or [])
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+def test_tables_are_scored_again_once_the_directors_are_known():
+    import sqlite3
+
+    connection = sqlite3.connect(":memory:")
+    connection.executescript("""
+        create table filing_tables (table_id int, cikcode int, accessionnumber text, table_number int, html text);
+        create table filing_table_features (table_id int, feature_version int, director_names_hash text);
+        -- A view over director_mentions in postgres
+        create table director_names_by_filing (cikcode int, accessionnumber text, director_names_hash text);
+        insert into filing_tables values (1, 1800, '0001104659-24-000001', 0, '<table></table>');
+    """)
+    cursor = sqlite_cursor(connection)
+
+    def needing_features():
+        skills_matrix.select_tables_needing_features(cursor)
+        return [(row[0], row[5]) for row in cursor.fetchall()]
+
+    # Before director extraction has run for the filing
+    assert needing_features() == [(1, "")]
+    connection.execute("insert into filing_table_features values (1, ?, '')", [skills_matrix.FEATURE_VERSION])
+    assert needing_features() == []
+
+    connection.execute("insert into director_names_by_filing values (1800, '0001104659-24-000001', 'abc')")
+    assert needing_features() == [(1, "abc")]
+    connection.execute("update filing_table_features set director_names_hash = 'abc'")
+    assert needing_features() == []
+
+    connection.execute("update filing_table_features set feature_version = feature_version - 1")
+    assert needing_features() == [(1, "abc")]
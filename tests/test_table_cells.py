@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import table_cells
+
+
+def test_spans_are_repeated_in_every_position_they_cover():
+    html = """<table>
+      <tr><th rowspan="2">Name</th><th colspan="2">Committees</th></tr>
+      <tr><th>Audit</th><th> Pay&nbsp;</th></tr>
+      <tr><td>Jane   Doe</td><td>X</td></tr>
+    </table>"""
+    assert table_cells.as_rows(table_cells.grid(html)) == [
+        ["Name", "Committees", "Committees"],
+        ["Name", "Audit", "Pay"],
+        ["Jane Doe", "X", None],
+    ]
+
+
+def test_nested_tables_are_part_of_their_cell():
+    html = "<table><tr><td>a<table><tr><td>b</td><td>c</td></tr></table></td><td>d</td></tr></table>"
+    assert table_cells.grid(html) == [(0, 0, "abc"), (0, 1, "d")]
+
+
+def test_silly_spans_are_limited():
+    html = '<table><tr><td rowspan="0" colspan="x">a</td><td rowspan="99">b</td></tr><tr><td>c</td></tr></table>'
+    assert table_cells.grid(html) == [(0, 0, "a"), (0, 1, "b"), (1, 0, "c"), (1, 1, "b")]
+
+
+def test_director_table_from_cells_matches_html():
+    import director_information_table
+
+    html = """<table>
+      <tr><td>Committee</td><td>Mr. Smith</td><td>Ms. Jones</td></tr>
+      <tr><td>Audit</td><td>Member</td><td>Chair</td></tr>
+      <tr><td>Pay</td><td>Member</td><td>Member</td></tr>
+      <tr><td>Risk</td><td>Member</td><td></td></tr>
+      <tr><td>Tech</td><td>Member</td><td>Member</td></tr>
+    </table>"""
+    from_html = director_information_table.DirectorInformationTable(html, 'row', ["Smith", "Jones"])
+    from_cells = director_information_table.DirectorInformationTable.from_cells(
+        table_cells.grid(html), 'row', ["Smith", "Jones"])
+    assert from_cells.get_values() == from_html.get_values()
+    assert from_cells.get_values()["SMITH"][(1, "Audit")] == "Member"
+    assert list(from_cells.regions_with_few_values(min_size=3)) == [
+        (1, 4, ["Audit", "Pay", "Risk", "Tech"], 2, {"", "Member", "Chair"}),
+    ]
+
+
+def test_regions_in_a_big_check_mark_matrix_take_linear_time():
+    import time
+    import director_information_table
+
+    def matrix(row_count):
+        surnames = [f"Director{d}" for d in range(10)]
+        cells = [(0, 0, "Skill")] + [(0, d + 1, name) for d, name in enumerate(surnames)]
+        for r in range(1, row_count):
+            cells.append((r, 0, f"Skill {r}"))
+            cells.extend((r, d + 1, "✓" if (r + d) % 3 else "") for d in range(10))
+        return director_information_table.DirectorInformationTable.from_cells(cells, 'row', surnames)
+
+    def seconds(table):
+        started = time.perf_counter()
+        regions = list(table.regions_with_few_values(min_size=3))
+        return time.perf_counter() - started, regions
+
+    small_time, small = seconds(matrix(500))
+    big_time, big = seconds(matrix(8000))
+    assert [region[:2] for region in big] == [(1, 7999)]
+    assert big[0][3:] == (1, {"", "✓"})
+    assert small == [(1, 499, [f"Skill {r}" for r in range(1, 500)], 1, {"", "✓"})]
+    # 16 times the rows; anything worse than linear would take far longer
+    assert big_time < max(small_time, 0.001) * 100
+
+
+def test_unparseable_html_has_no_cells():
+    assert table_cells.parse("") is None
+    assert table_cells.grid("  \n ") == []
+    assert table_cells.grid('<?xml version="1.0" encoding="utf-8"?><table><tr><td>a</td></tr></table>') == []
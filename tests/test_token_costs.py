@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import token_costs
+
+
+def test_usage_from_response_reads_cached_tokens():
+    usage = token_costs.usage_from_response(
+        {"prompt_tokens": 1200, "completion_tokens": 30, "prompt_tokens_details": {"cached_tokens": 1024}})
+    assert usage == token_costs.Usage(1200, 1024, 30)
+    assert token_costs.usage_from_response({"prompt_tokens": 5, "completion_tokens": 1}) == (5, 0, 1)
+    assert token_costs.usage_from_response(None) == token_costs.NO_USAGE
+
+
+def test_cached_tokens_are_priced_separately():
+    prices = token_costs.Prices(prompt_per_million=1.0, cached_prompt_per_million=0.1,
+                                completion_per_million=4.0, batch_discount=0.5)
+    usage = token_costs.add(token_costs.Usage(1000000, 1000000, 0), token_costs.Usage(1000000, 0, 1000000))
+    assert usage == (2000000, 1000000, 1000000)
+    assert token_costs.cost(usage, prices, batch=False) == pytest.approx(5.1)
+    assert token_costs.cost(usage, prices) == pytest.approx(2.55)
+
+
+def test_prices_come_from_the_pricing_section(tmp_path):
+    config = tmp_path / "db.conf"
+    config.write_text("[pricing]\nprompt_per_million = 2\n")
+    prices = token_costs.prices_from_config(str(config))
+    assert prices.prompt_per_million == 2.0
+    assert prices.completion_per_million == token_costs.DEFAULT_COMPLETION_PER_MILLION
+    assert token_costs.prices_from_config(str(tmp_path / "missing.conf")).batch_discount == token_costs.DEFAULT_BATCH_DISCOUNT
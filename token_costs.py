@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""What our OpenAI requests used, and what that cost.
+
+Prompt tokens that OpenAI found in its prompt cache (reported as
+usage.prompt_tokens_details.cached_tokens) are much cheaper than the rest,
+so they are counted and priced separately. Prices are per million tokens
+and come from the [pricing] section of db.conf, e.g.
+
+    [pricing]
+    prompt_per_million = 0.15
+    cached_prompt_per_million = 0.015
+    completion_per_million = 0.6
+    batch_discount = 0.5
+
+They are the ordinary (real-time) prices; batch requests cost
+batch_discount times as much.
+"""
+
+import collections
+import configparser
+
+DEFAULT_PROMPT_PER_MILLION = 0.15
+DEFAULT_CACHED_PROMPT_PER_MILLION = 0.015
+DEFAULT_COMPLETION_PER_MILLION = 0.6
+DEFAULT_BATCH_DISCOUNT = 0.5
+
+# cached_tokens are included in prompt_tokens, as OpenAI reports them
+Usage = collections.namedtuple("Usage", ["prompt_tokens", "cached_tokens", "completion_tokens"])
+
+NO_USAGE = Usage(0, 0, 0)
+
+Prices = collections.namedtuple(
+    "Prices", ["prompt_per_million", "cached_prompt_per_million", "completion_per_million", "batch_discount"])
+
+
+def usage_from_response(usage):
+    """Usage from the usage object of a chat completion (as a dict); missing counts are 0."""
+    usage = usage or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return Usage(usage.get("prompt_tokens") or 0, details.get("cached_tokens") or 0, usage.get("completion_tokens") or 0)
+
+
+def add(*usages):
+    return Usage(*(sum(counts) for counts in zip(NO_USAGE, *usages)))
+
+
+def prices_from_config(config_filename):
+    config = configparser.ConfigParser()
+    config.read(config_filename)
+    section = config["pricing"] if config.has_section("pricing") else {}
+    return Prices(
+        prompt_per_million=float(section.get("prompt_per_million", DEFAULT_PROMPT_PER_MILLION)),
+        cached_prompt_per_million=float(section.get("cached_prompt_per_million", DEFAULT_CACHED_PROMPT_PER_MILLION)),
+        completion_per_million=float(section.get("completion_per_million", DEFAULT_COMPLETION_PER_MILLION)),
+        batch_discount=float(section.get("batch_discount", DEFAULT_BATCH_DISCOUNT)),
+    )
+
+
+def cost(usage, prices, batch=True):
+    """Cost in USD of usage at these prices."""
+    uncached = usage.prompt_tokens - usage.cached_tokens
+    dollars = (uncached * prices.prompt_per_million
+               + usage.cached_tokens * prices.cached_prompt_per_million
+               + usage.completion_tokens * prices.completion_per_million) / 1000000
+    if batch:
+        dollars *= prices.batch_discount
+    return dollars
+
+
+def print_costs(usage, prices, batch=True):
+    print(f"Prompt tokens:     {usage.prompt_tokens}")
+    if usage.prompt_tokens > 0:
+        print(f"  of which cached: {usage.cached_tokens} ({usage.cached_tokens / usage.prompt_tokens:.0%})")
+    print(f"Completion tokens: {usage.completion_tokens}")
+    print(f"Cost (USD):        {cost(usage, prices, batch):.2f}")